@@ -0,0 +1,322 @@
+"""
+Captura opcional de tráfico real (forma de los requests, sin contenido) para
+reproducirlo después con `python -m app.testing.replay`.
+
+Por cada request de IA (HTTP y cada request del WebSocket) se guarda una
+línea JSON con ruta, método, campos del request anonimizados, bucket de
+usuario, status y latencia. Los textos se reemplazan por
+`{"chars", "fp", "lang"}`: largo, fingerprint (blake2b con clave
+`capture_salt`, iguales solo si el texto es igual) e idioma detectado
+localmente. Solo se conservan tal cual los valores cortos de campos
+conocidos (action, language, tone, ...); user_id, tokens e ids se descartan.
+
+El middleware solo copia lo que el request ya lee (body) y encola; el
+parseo, la anonimización y la escritura corren en un hilo, con la misma cola
+acotada que el exportador de spans (llena → se descarta y se cuenta). El
+archivo rota al pasar `capture_max_bytes`, conservando `capture_backups`
+archivos (`traffic.jsonl.1`, `.2`, ...). Con `capture_enabled=false` el
+middleware no se registra.
+"""
+import base64
+import hashlib
+import json
+import logging
+import os
+import queue
+import random
+import re
+import secrets
+import threading
+import time
+import zlib
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qsl
+
+from app.core.config import settings
+from app.core import metrics
+from app.services.language_detector import language_detector
+from app.utils.http import route_template
+
+logger = logging.getLogger(__name__)
+
+# Campos cuyo valor corto se guarda tal cual (el resto de los strings se anonimiza)
+_KEEP_FIELDS = frozenset({"action", "actions", "payload", "tone", "language", "type", "group", "stream"})
+_DROP_FIELDS = frozenset({"user_id", "token", "id", "email", "name"})
+_MAX_KEPT_CHARS = 32
+
+# Mensajes del servidor que cierran un request del WebSocket (van al principio del JSON)
+_WS_TERMINAL = re.compile(r'"type":\s*"(done|error|cancelled)"')
+_WS_ERROR_TYPE = re.compile(r'"error_type":\s*"([a-z_]+)"')
+
+
+class TrafficCapture:
+    """Cola acotada + hilo que anonimiza y escribe el archivo rotativo"""
+
+    def __init__(self, path: str, max_bytes: int, backups: int, salt: Optional[str] = None,
+                 user_buckets: int = 64, max_queue: int = 10000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.user_buckets = user_buckets
+        self.written = 0
+        self.dropped = 0
+        # Sin sal configurada, los fingerprints solo coinciden dentro del proceso
+        self._key = (salt or secrets.token_hex(16)).encode("utf-8")[:64]
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max_queue)
+        self._file = None
+        self._size = 0
+        self._thread = threading.Thread(target=self._run, name="traffic-capture", daemon=True)
+        self._thread.start()
+
+    def submit(self, sample: Dict[str, Any]):
+        try:
+            self._queue.put_nowait(sample)
+        except queue.Full:
+            self.dropped += 1
+            metrics.TRAFFIC_CAPTURED.labels("dropped").inc()
+
+    # ---- hilo de escritura ----
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                for sample in batch:
+                    self._write(json.dumps(self.record(sample), ensure_ascii=False, separators=(",", ":")) + "\n")
+                self._file.flush()
+            except Exception as e:
+                logger.warning(f"No se pudo escribir la captura de tráfico: {e}")
+
+    def _write(self, line: str):
+        data = line.encode("utf-8")
+        if self._file is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(self.path, "ab")
+            self._size = self._file.tell()
+        elif self._size + len(data) > self.max_bytes:
+            self._rotate()
+        self._file.write(data)
+        self._size += len(data)
+        self.written += 1
+        metrics.TRAFFIC_CAPTURED.labels("written").inc()
+
+    def _rotate(self):
+        self._file.close()
+        for index in range(self.backups - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        self._file = open(self.path, "wb")
+        self._size = 0
+
+    # ---- anonimización ----
+
+    def record(self, sample: Dict[str, Any]) -> Dict[str, Any]:
+        """Línea del archivo a partir de lo que juntó el middleware"""
+        fields, user = self._fields(sample)
+        record = {
+            "ts": round(sample["ts"], 3),
+            "kind": sample["kind"],
+            "method": sample["method"],
+            "route": sample["route"],
+            "in": sample["in"],
+            "fields": self.shape(fields) if fields is not None else None,
+            "user": self.bucket(user or sample.get("client")),
+            "status": sample["status"],
+            "ms": round(sample["ms"], 1),
+        }
+        if sample.get("conn"):
+            record["conn"] = sample["conn"]
+        return record
+
+    def _fields(self, sample: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        if sample["in"] == "ws":
+            fields = sample["message"]
+            return fields, _token_subject(sample.get("token"))
+        query = dict(parse_qsl(sample["query"].decode("latin-1"), keep_blank_values=True))
+        if sample["in"] == "query":
+            return query, query.get("user_id") or _token_subject(query.get("token"))
+        body = _decode(sample["body"], sample.get("encoding"))
+        if not isinstance(body, dict):
+            return None, None
+        return body, body.get("user_id") or _token_subject(body.get("token"))
+
+    def shape(self, value: Any, field: Optional[str] = None) -> Any:
+        if isinstance(value, dict):
+            return {k: self.shape(v, k) for k, v in value.items() if k not in _DROP_FIELDS}
+        if isinstance(value, list):
+            return [self.shape(v, field) for v in value]
+        if isinstance(value, str) and (field not in _KEEP_FIELDS or len(value) > _MAX_KEPT_CHARS):
+            return self.describe(value)
+        return value
+
+    def describe(self, text: str) -> Dict[str, Any]:
+        """Reemplazo de un texto: largo, fingerprint e idioma"""
+        text = text.strip()
+        return {
+            "chars": len(text),
+            "fp": hashlib.blake2b(text.encode("utf-8"), digest_size=8, key=self._key).hexdigest(),
+            "lang": language_detector.detect(text).language,
+        }
+
+    def bucket(self, user: Optional[str]) -> Optional[int]:
+        if not user:
+            return None
+        digest = hashlib.blake2b(user.encode("utf-8"), digest_size=8, key=self._key).digest()
+        return int.from_bytes(digest, "big") % self.user_buckets
+
+
+def _decode(body: bytes, encoding: Optional[str]) -> Any:
+    """Body JSON del request (None si no se pudo leer completo o está en zstd)"""
+    try:
+        if encoding in ("gzip", "deflate"):
+            decoder = zlib.decompressobj(16 + zlib.MAX_WBITS if encoding == "gzip" else zlib.MAX_WBITS)
+            body = decoder.decompress(body, settings.ai_max_body_bytes)
+        elif encoding not in (None, "identity"):
+            return None
+        return json.loads(body)
+    except (ValueError, zlib.error):
+        return None
+
+
+def _token_subject(token: Optional[str]) -> Optional[str]:
+    """`sub` del JWT sin verificar la firma (solo para agrupar por usuario)"""
+    if not token or token.count(".") != 2:
+        return None
+    try:
+        part = token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(part + "=" * (-len(part) % 4)))
+        return str(claims.get("sub") or claims.get("user_id") or "") or None
+    except (ValueError, AttributeError):
+        return None
+
+
+class CaptureMiddleware:
+    """
+    Middleware ASGI que junta la forma de cada request HTTP bajo
+    `capture_routes` y de cada request del WebSocket de IA, y la encola en
+    `capture`. No modifica el request ni la respuesta.
+    """
+
+    def __init__(self, app, capture: TrafficCapture):
+        self.app = app
+        self.capture = capture
+        self.prefixes = tuple(settings.capture_routes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket") or not scope["path"].startswith(self.prefixes) \
+                or random.random() >= settings.capture_sample_rate:
+            await self.app(scope, receive, send)
+            return
+        if scope["type"] == "websocket":
+            await self._websocket(scope, receive, send)
+            return
+
+        ts, start = time.time(), time.perf_counter()
+        status_code = 500
+        body = bytearray()
+        limit = settings.ai_max_body_bytes
+
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.request" and len(body) <= limit:
+                body.extend(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        has_body = scope["method"] in ("POST", "PUT", "PATCH")
+        try:
+            await self.app(scope, receive_wrapper if has_body else receive, send_wrapper)
+        finally:
+            headers = dict(scope.get("headers") or [])
+            encoding = headers.get(b"content-encoding")
+            self.capture.submit({
+                "ts": ts,
+                "kind": "http",
+                "method": scope["method"],
+                "route": route_template(scope),
+                "in": "json" if has_body else "query",
+                "query": scope.get("query_string", b""),
+                "body": bytes(body),
+                "encoding": encoding.decode("latin-1").strip().lower() if encoding else None,
+                "client": scope["client"][0] if scope.get("client") else None,
+                "status": status_code,
+                "ms": (time.perf_counter() - start) * 1000,
+            })
+
+    async def _websocket(self, scope, receive, send):
+        conn = secrets.token_hex(4)
+        token = dict(parse_qsl(scope.get("query_string", b"").decode("latin-1"))).get("token")
+        client = scope["client"][0] if scope.get("client") else None
+        pending: Dict[str, Tuple[float, float, Dict[str, Any]]] = {}
+
+        def submit(request_id: str, status: str):
+            ts, start, message = pending.pop(request_id)
+            self.capture.submit({
+                "ts": ts, "kind": "ws", "method": "WS", "route": scope["path"], "in": "ws",
+                "message": message, "token": token, "client": client, "conn": conn,
+                "status": status, "ms": (time.perf_counter() - start) * 1000,
+            })
+
+        async def receive_wrapper():
+            nonlocal token
+            message = await receive()
+            text = message.get("text") if message["type"] == "websocket.receive" else None
+            if text and ('"request"' in text or '"auth"' in text):
+                try:
+                    data = json.loads(text)
+                except ValueError:
+                    return message
+                if isinstance(data, dict) and data.get("type") == "request" and data.get("id") is not None:
+                    pending[str(data["id"])] = (time.time(), time.perf_counter(), data)
+                elif isinstance(data, dict) and data.get("type") == "auth":
+                    token = data.get("token")
+            return message
+
+        async def send_wrapper(message):
+            text = message.get("text") if message["type"] == "websocket.send" else None
+            if text and pending:
+                match = _WS_TERMINAL.search(text, 0, 200)
+                if match:
+                    request_id = _ws_request_id(text)
+                    if request_id in pending:
+                        status = match.group(1)
+                        if status == "error":
+                            error_type = _WS_ERROR_TYPE.search(text)
+                            status = f"error:{error_type.group(1) if error_type else 'other'}"
+                        submit(request_id, status)
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            for request_id in list(pending):
+                submit(request_id, "disconnected")
+
+
+def _ws_request_id(text: str) -> Optional[str]:
+    try:
+        request_id = json.loads(text).get("id")
+    except ValueError:
+        return None
+    return str(request_id) if request_id is not None else None
+
+
+traffic_capture = TrafficCapture(
+    settings.capture_path, settings.capture_max_bytes, settings.capture_backups,
+    settings.capture_salt, settings.capture_user_buckets
+) if settings.capture_enabled else None
@@ -1,7 +1,7 @@
 # app/core/config.py
 import os
 from pydantic_settings import BaseSettings
-from typing import List, Optional
+from typing import Dict, List, Optional
 from enum import Enum
 import json
 
@@ -25,6 +25,8 @@ class Settings(BaseSettings):
     # Supabase
     supabase_url: str
     supabase_service_key: str
+    supabase_read_url: Optional[str] = None     # réplica de lectura (PostgREST)
+    supabase_read_key: Optional[str] = None     # por defecto, la service key
     
     # Application
     app_name: str = "Cliro Notes MLP"
@@ -37,6 +39,95 @@ class Settings(BaseSettings):
     rate_limit_per_minute: int = 30
     ai_rate_limit_per_hour: int = 100
     
+    # Gemini: deadlines (segundos), circuit breaker y hedging
+    ai_model: str = "gemini-3-flash-preview"
+    gemini_base_url: Optional[str] = None   # ej. app.testing.gemini_stub en local
+    ai_default_deadline_seconds: float = 20.0
+    ai_action_deadlines: Dict[str, float] = {
+        "summarize": 20.0,
+        "explain": 20.0,
+        "rewrite": 20.0,
+        "translate": 25.0,
+        "xray": 40.0,
+    }
+    ai_breaker_failure_threshold: int = 5
+    ai_breaker_reset_seconds: float = 30.0
+    ai_hedging_enabled: bool = False
+    ai_hedge_min_samples: int = 20  # muestras mínimas antes de estimar el p95
+    
+    # Scheduler de acciones de IA (admisión y prioridad)
+    ai_max_concurrency: int = 16         # acciones de IA en paralelo por proceso (tope)
+    ai_adaptive_concurrency: bool = True  # AIMD entre min y max según latencia y quota
+    ai_initial_concurrency: int = 8
+    ai_min_concurrency: int = 1
+    ai_limit_backoff: float = 0.7
+    ai_limit_latency_tolerance: float = 2.0
+    ai_max_queue: int = 200
+    ai_interactive_max_chars: int = 1000  # hasta este largo un request es "interactivo"
+    ai_max_body_bytes: int = 262144       # POST /api/ai/: tope del body ya descomprimido
+    
+    # Sesiones de documento (/api/ai/documents) y context caching de Gemini
+    ai_documents_max: int = 1000
+    ai_documents_max_chars: int = 20_000_000     # suma de todos los documentos en memoria
+    ai_documents_ttl_seconds: int = 1800         # absoluto; también es el TTL del context cache
+    ai_document_max_bytes: int = 1_048_576       # body del registro, ya descomprimido
+    ai_context_cache_enabled: bool = True
+    ai_context_cache_min_tokens: int = 1024      # mínimo que acepta Gemini para un cache explícito
+    
+    # WebSocket /api/ai/ws (extensión)
+    ai_ws_heartbeat_seconds: float = 20.0  # < 30 s: mantiene vivo el service worker MV3
+    ai_ws_auth_timeout_seconds: float = 10.0
+    ai_ws_max_inflight: int = 8           # requests en curso por conexión
+    
+    # Cuotas por usuario ponderadas por costo (tokens estimados en ventana deslizante)
+    ai_budget_tokens: int = 200000
+    ai_budget_window_seconds: int = 3600
+    ai_chars_per_token: int = 4
+    ai_output_token_ratio: Dict[str, float] = {   # tokens de salida esperados por token de entrada
+        "summarize": 0.3,
+        "explain": 1.0,
+        "rewrite": 1.0,
+        "translate": 1.1,
+        "xray": 1.5,
+    }
+    ai_usage_persist_enabled: bool = True
+    ai_usage_flush_seconds: float = 30.0
+    
+    # Cache de resultados (exacto + casi-duplicados por SimHash)
+    ai_cache_enabled: bool = True
+    ai_cache_max_entries: int = 5000
+    ai_cache_ttl_seconds: float = 3600.0
+    ai_cache_actions: List[str] = ["summarize", "explain", "translate", "xray"]
+    ai_cache_near_actions: List[str] = ["summarize", "explain"]
+    ai_cache_near_threshold: float = 0.95    # similitud mínima (1 - hamming/64)
+    ai_cache_near_audit_rate: float = 0.01   # fracción de casi-aciertos que se recalculan
+    ai_cache_audit_min_overlap: float = 0.5
+    
+    # Prefetch especulativo (/api/ai/prefetch): calcula la acción probable antes del click
+    ai_prefetch_enabled: bool = True
+    ai_prefetch_default_actions: List[str] = ["summarize"]
+    ai_prefetch_actions: List[str] = ["summarize", "explain", "translate"]  # permitidas
+    ai_prefetch_max_chars: int = 5000
+    ai_prefetch_max_utilization: float = 0.5  # solo con menos de esta fracción del límite en uso
+    ai_prefetch_max_inflight: int = 4
+    ai_prefetch_max_per_user: int = 2          # en curso
+    ai_prefetch_per_user_per_minute: int = 20
+    ai_prefetch_ttl_seconds: float = 300.0     # sin usar en este plazo cuenta como desperdicio
+    
+    # Memoria de traducción por segmento (LRU en memoria por proceso)
+    translation_memory_enabled: bool = True
+    translation_memory_max_segments: int = 20000
+    
+    # Detección local de idioma (metadata.language y traducciones al mismo idioma)
+    ai_language_detection_enabled: bool = True
+    ai_language_detect_max_chars: int = 500      # prefijo analizado para metadata.language
+    # translate al idioma detectado devuelve el texto tal cual. Calibrado con
+    # selecciones cortas fuera de las muestras: las detecciones erróneas no
+    # pasan de 0.58 (es↔pt) y con 0.9 se saltaban menos de la mitad en español
+    ai_language_skip_min_confidence: float = 0.7
+    ai_language_skip_min_chars: int = 20
+    ai_language_skip_max_chars: int = 5000       # textos más largos siempre van a Gemini
+    
     # Waitlist configuration
     max_languages_per_user: int = 3
     
@@ -45,6 +136,56 @@ class Settings(BaseSettings):
     
     # Database configuration
     database_pool_size: int = 20
+    db_request_budget_seconds: float = 5.0   # presupuesto compartido por request
+    db_attempt_timeout_seconds: float = 2.0  # timeout por intento
+    db_max_retries: int = 3                  # solo lecturas idempotentes
+    db_backoff_base_seconds: float = 0.1
+    db_backoff_max_seconds: float = 1.0
+    db_replica_max_lag_seconds: float = 5.0  # atraso tolerado: tras escribir una tabla se lee del primario
+    db_replica_cooldown_seconds: float = 30.0  # réplica fuera de rotación tras una falla
+    
+    # Logging (cola acotada + hilo de escritura, ver app/core/logging_config.py)
+    log_format: str = "json"  # json | text
+    log_queue_size: int = 10000
+    log_debug_sample_every: int = 10  # 1 de cada N logs DEBUG por línea de código
+    
+    # Compresión de respuestas (gzip / brotli)
+    compression_min_bytes: int = 1024
+    compression_gzip_level: int = 6
+    compression_brotli_quality: int = 4  # calidad baja = rápido, buena razón para JSON
+    
+    # Cache HTTP de catálogos estáticos (/api/ai/actions, /api/auth/config/public)
+    catalog_cache_max_age: int = 86400
+    
+    # Tracing (spans por request + header Server-Timing)
+    tracing_enabled: bool = False
+    tracing_export_path: Optional[str] = None  # JSON lines en formato OTLP
+    tracing_export_url: Optional[str] = None   # Collector OTLP/HTTP, p.ej. http://localhost:4318/v1/traces
+    
+    # Profiling bajo demanda (header X-Cliro-Profile o /api/admin/profiling, token con role=admin)
+    profiling_enabled: bool = False
+    profiling_interval_ms: float = 5.0         # período del sampler
+    profiling_max_seconds: float = 60.0        # ventana máxima
+    profiling_max_active: int = 4              # sesiones simultáneas
+    profiling_max_profiles: int = 20           # perfiles terminados en memoria
+    profiling_output_dir: Optional[str] = None  # además, un .folded por perfil
+    loop_lag_monitor_enabled: bool = False     # lag del event loop siempre (si no, solo al perfilar)
+    loop_lag_interval_ms: float = 50.0
+    loop_lag_stall_ms: float = 100.0           # bloqueo a partir del cual se captura el stack
+    
+    # Warmup al arrancar (conexiones, imports y caches antes de aceptar tráfico; /ready)
+    warmup_enabled: bool = True
+    warmup_timeout_seconds: float = 10.0
+    
+    # Captura de tráfico anonimizado para replay (app/core/capture.py, app/testing/replay.py)
+    capture_enabled: bool = False
+    capture_path: str = "capture/traffic.jsonl"
+    capture_max_bytes: int = 10 * 1024 * 1024  # rota al pasar este tamaño
+    capture_backups: int = 5
+    capture_sample_rate: float = 1.0
+    capture_routes: List[str] = ["/api/ai"]
+    capture_salt: Optional[str] = None          # clave de los fingerprints (sin ella, aleatoria por proceso)
+    capture_user_buckets: int = 64
     
     class Config:
         env_file = ".env"
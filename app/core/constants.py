@@ -14,6 +14,10 @@ SUPPORTED_LANGUAGES = {
     # Podemos agregar más después
 }
 
+# Idiomas planeados: se aceptan como preferencia en la waitlist aunque todavía
+# no estén en SUPPORTED_LANGUAGES (ver app/core/validation.py)
+PLANNED_LANGUAGES = ("zh", "ja", "ko", "ru", "ar")
+
 # Razones de interés predefinidas - EN CÓDIGO (fácil de cambiar)
 INTEREST_REASONS = [
     {"id": "productivity", "label": "Mejora mi productividad"},
@@ -41,4 +45,18 @@ AI_ACTIONS = {
     "rewrite": {"id": "rewrite", "label": "Reescribir", "requires_payload": True},
     "translate": {"id": "translate", "label": "Traducir", "requires_payload": True},
     "xray": {"id": "xray", "label": "Análisis X-Ray", "requires_payload": False}
+}
+
+# Alias aceptados por acción (el cliente envía tanto inglés como español)
+ACTION_ALIASES = {
+    "summarize": "summarize",
+    "resumir": "summarize",
+    "explain": "explain",
+    "explicar": "explain",
+    "rewrite": "rewrite",
+    "reescribir": "rewrite",
+    "translate": "translate",
+    "traducir": "translate",
+    "xray": "xray",
+    "analizar": "xray"
 }
\ No newline at end of file
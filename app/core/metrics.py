@@ -0,0 +1,307 @@
+"""
+Métricas Prometheus del backend.
+
+Con varios workers (uvicorn/gunicorn) definir PROMETHEUS_MULTIPROC_DIR antes de
+arrancar el proceso: cada worker escribe en archivos mmap y /metrics agrega
+todos al momento de la lectura, sin locks entre procesos.
+"""
+import os
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+
+from app.core.constants import AI_ACTIONS
+from app.core.tracing import span
+from app.utils.http import route_template
+
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# Buckets pensados para llamadas a Gemini (segundos) y textos de hasta 5000 chars
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CHAR_BUCKETS = (50, 100, 250, 500, 1000, 2000, 3000, 4000, 5000, 10000, 20000)
+
+# HTTP
+HTTP_REQUEST_LATENCY = Histogram(
+    "cliro_http_request_duration_seconds",
+    "Latencia de requests HTTP por ruta",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "cliro_http_requests_in_flight",
+    "Requests HTTP en curso",
+    multiprocess_mode="livesum",
+)
+RATE_LIMIT_REJECTIONS = Counter(
+    "cliro_rate_limit_rejections_total",
+    "Requests rechazados por rate limiting",
+    ["route"],
+)
+
+# Acciones de IA
+AI_ACTION_LATENCY = Histogram(
+    "cliro_ai_action_duration_seconds",
+    "Latencia total de process_ai_action por acción",
+    ["action"],
+    buckets=LATENCY_BUCKETS,
+)
+AI_ACTIONS_IN_FLIGHT = Gauge(
+    "cliro_ai_actions_in_flight",
+    "Acciones de IA en curso",
+    ["action"],
+    multiprocess_mode="livesum",
+)
+AI_ERRORS = Counter(
+    "cliro_ai_errors_total",
+    "Errores de acciones de IA por tipo (quota, safety, other)",
+    ["action", "type"],
+)
+AI_INPUT_CHARS = Histogram(
+    "cliro_ai_input_chars",
+    "Caracteres de entrada por acción",
+    ["action"],
+    buckets=CHAR_BUCKETS,
+)
+AI_OUTPUT_CHARS = Histogram(
+    "cliro_ai_output_chars",
+    "Caracteres de salida por acción",
+    ["action"],
+    buckets=CHAR_BUCKETS,
+)
+AI_HEDGES = Counter(
+    "cliro_ai_hedged_requests_total",
+    "Requests con hedging por acción y request ganadora",
+    ["action", "winner"],
+)
+TRANSLATION_SEGMENTS = Counter(
+    "cliro_translation_memory_segments_total",
+    "Segmentos de traducción resueltos desde memoria (hit) o enviados a Gemini (miss)",
+    ["outcome"],
+)
+AI_TRANSLATIONS_SKIPPED = Counter(
+    "cliro_ai_translations_skipped_total",
+    "Traducciones resueltas sin Gemini: el texto ya estaba en el idioma destino",
+    ["language"],
+)
+AI_CACHE_LOOKUPS = Counter(
+    "cliro_ai_cache_lookups_total",
+    "Búsquedas en el cache de resultados por acción (exact, near, miss)",
+    ["action", "outcome"],
+)
+AI_PREFETCH = Counter(
+    "cliro_ai_prefetch_total",
+    "Prefetch especulativo por resultado (started, hit, joined, wasted, superseded, preempted, no_capacity, ...)",
+    ["action", "outcome"],
+)
+AI_CACHE_NEAR_AUDITS = Counter(
+    "cliro_ai_cache_near_audits_total",
+    "Auditorías de casi-aciertos (consistent, false_reuse)",
+    ["action", "outcome"],
+)
+AI_TOKENS_CHARGED = Counter(
+    "cliro_ai_tokens_charged_total",
+    "Tokens estimados (entrada + salida) cobrados a usuarios por acción",
+    ["action"],
+)
+AI_BUDGET_REJECTIONS = Counter(
+    "cliro_ai_budget_rejections_total",
+    "Requests rechazadas por presupuesto de tokens agotado",
+)
+AI_QUEUE_DEPTH = Gauge(
+    "cliro_ai_queue_depth",
+    "Acciones de IA esperando lugar en el scheduler por clase de prioridad",
+    ["priority"],
+    multiprocess_mode="livesum",
+)
+AI_QUEUE_WAIT = Histogram(
+    "cliro_ai_queue_wait_seconds",
+    "Espera en cola del scheduler por clase de prioridad",
+    ["priority"],
+    buckets=LATENCY_BUCKETS,
+)
+AI_QUEUE_SHED = Counter(
+    "cliro_ai_queue_shed_total",
+    "Requests rechazadas por el scheduler (queue_full, deadline, timeout)",
+    ["priority", "reason"],
+)
+AI_DOCUMENT_EVENTS = Counter(
+    "cliro_ai_document_events_total",
+    "Sesiones de documento: created, expired, evicted, deleted y context_cache_*",
+    ["event"],
+)
+AI_CONTEXT_CACHE_TOKENS = Counter(
+    "cliro_ai_context_cache_tokens_total",
+    "Tokens de entrada servidos desde el context cache de Gemini (no reenviados)",
+)
+AI_WS_CONNECTIONS = Gauge(
+    "cliro_ai_ws_connections",
+    "Conexiones WebSocket de IA abiertas",
+    multiprocess_mode="livesum",
+)
+AI_WS_REQUESTS = Counter(
+    "cliro_ai_ws_requests_total",
+    "Requests multiplexados por WebSocket según resultado (done, error, cancelled, superseded)",
+    ["outcome"],
+)
+AI_CONCURRENCY_LIMIT = Gauge(
+    "cliro_ai_concurrency_limit",
+    "Límite actual de acciones de IA concurrentes (adaptativo)",
+    multiprocess_mode="livesum",
+)
+AI_CONCURRENCY_DECREASES = Counter(
+    "cliro_ai_concurrency_decreases_total",
+    "Reducciones del límite adaptativo por motivo (quota, timeout, latency)",
+    ["reason"],
+)
+CIRCUIT_STATE = Gauge(
+    "cliro_circuit_state",
+    "Estado del circuit breaker (0=closed, 1=half_open, 2=open)",
+    ["upstream"],
+    multiprocess_mode="max",
+)
+CIRCUIT_REJECTIONS = Counter(
+    "cliro_circuit_rejections_total",
+    "Requests rechazadas con el circuito abierto",
+    ["upstream"],
+)
+
+# Upstreams (Gemini, Supabase)
+UPSTREAM_LATENCY = Histogram(
+    "cliro_upstream_duration_seconds",
+    "Latencia de llamadas a upstreams por operación",
+    ["upstream", "operation", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_IN_FLIGHT = Gauge(
+    "cliro_upstream_requests_in_flight",
+    "Llamadas a upstreams en curso",
+    ["upstream"],
+    multiprocess_mode="livesum",
+)
+
+
+# Event loop y profiling
+EVENT_LOOP_LAG = Histogram(
+    "cliro_event_loop_lag_seconds",
+    "Retraso del event loop en despertar una corrutina (monitor de lag)",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+EVENT_LOOP_STALLS = Counter(
+    "cliro_event_loop_stalls_total",
+    "Bloqueos del event loop por encima de loop_lag_stall_ms (con stack capturado)",
+)
+PROFILES_CAPTURED = Counter(
+    "cliro_profiles_captured_total",
+    "Sesiones de profiling iniciadas por tipo (request, window)",
+    ["kind"],
+)
+
+WARMUP_DURATION = Gauge(
+    "cliro_warmup_duration_seconds",
+    "Duración del warmup al arrancar el proceso",
+    multiprocess_mode="max",
+)
+
+# Captura de tráfico
+TRAFFIC_CAPTURED = Counter(
+    "cliro_traffic_capture_records_total",
+    "Requests capturados para replay por resultado (written, dropped)",
+    ["outcome"],
+)
+
+# Logging
+LOG_RECORDS_DROPPED = Counter(
+    "cliro_log_records_dropped_total",
+    "Records de log descartados por cola llena",
+)
+LOG_RECORDS_SAMPLED_OUT = Counter(
+    "cliro_log_records_sampled_out_total",
+    "Records DEBUG omitidos por muestreo",
+)
+
+
+def action_label(action: str) -> str:
+    """Acota la etiqueta `action` a las acciones conocidas (el valor viene del cliente)"""
+    return action if action in AI_ACTIONS else "unknown"
+
+
+@contextmanager
+def track_upstream(upstream: str, operation: str):
+    """
+    Mide una llamada a un upstream (p.ej. gemini/generate_content, supabase/waitlist_users.select).
+    También abre un span `upstream.operation` si hay tracing activo.
+    """
+    in_flight = UPSTREAM_IN_FLIGHT.labels(upstream)
+    in_flight.inc()
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        with span(f"{upstream}.{operation}"):
+            yield
+        outcome = "ok"
+    finally:
+        UPSTREAM_LATENCY.labels(upstream, operation, outcome).observe(time.perf_counter() - start)
+        in_flight.dec()
+
+
+def render_metrics() -> bytes:
+    """Serializa las métricas en formato de exposición de Prometheus"""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def mark_process_dead(pid: Optional[int] = None):
+    """Limpia los gauges `live*` de un worker que termina (solo en modo multiproceso)"""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid or os.getpid())
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI puro (sin BaseHTTPMiddleware) para latencia por ruta.
+    La ruta se etiqueta con la plantilla (`/api/auth/waitlist/check-email/{email}`)
+    para no disparar la cardinalidad con valores de path.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUEST_LATENCY.labels(
+                scope["method"],
+                route_template(scope),
+                str(status_code),
+            ).observe(time.perf_counter() - start)
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+
@@ -0,0 +1,367 @@
+"""
+Profiling bajo demanda en producción (sampling) y monitor de lag del event loop.
+
+- Sampler: un hilo lee `sys._current_frames()` cada `profiling_interval_ms` y
+  acumula los stacks en formato folded (`hilo;frame;frame N`), que leen
+  directamente flamegraph.pl, speedscope e inferno. Los hilos ociosos
+  (event loop en select, workers esperando trabajo) no se cuentan.
+  Un perfil de request incluye todo lo que corrió en el proceso mientras
+  duró el request (también otros requests concurrentes).
+- LoopLagMonitor: una corrutina duerme `loop_lag_interval_ms` y mide con cuánto
+  retraso la despierta el loop; un hilo watchdog captura el stack del hilo del
+  loop cuando lleva más de `loop_lag_stall_ms` sin correr, así una llamada
+  síncrona que lo bloquea queda identificada con su stack.
+
+Se activa por request (header `X-Cliro-Profile` con token de admin) o por
+ventana de tiempo (`POST /api/admin/profiling`). Con `profiling_enabled=false`
+el middleware no se registra y no hay hilos: costo cero. Sin sesiones activas
+no corre el sampler, y el monitor de lag solo corre con sesiones activas o
+con `loop_lag_monitor_enabled`.
+"""
+import asyncio
+import logging
+import os
+import secrets
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from typing import Deque, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.core import metrics
+from app.core.security import security
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-cliro-profile"
+PROFILE_ID_HEADER = b"x-cliro-profile-id"
+
+# Frames donde un hilo está esperando, no trabajando (archivo, función)
+_IDLE_FRAMES = frozenset({
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+})
+
+# Etiqueta por code object (se arma una sola vez por función)
+_frame_labels: Dict[object, str] = {}
+
+
+def _frame_label(code) -> str:
+    label = _frame_labels.get(code)
+    if label is None:
+        path = code.co_filename
+        for marker in ("site-packages" + os.sep, os.getcwd() + os.sep):
+            index = path.find(marker)
+            if index >= 0:
+                path = path[index + len(marker):]
+                break
+        label = f"{code.co_name} ({path}:{code.co_firstlineno})"
+        _frame_labels[code] = label
+    return label
+
+
+def _is_idle(frame) -> bool:
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES
+
+
+def _fold(thread_name: str, frame) -> str:
+    """Stack en formato folded, de la raíz hacia el frame actual"""
+    frames: List[str] = []
+    while frame is not None:
+        frames.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    frames.append(thread_name)
+    frames.reverse()
+    return ";".join(frames)
+
+
+class ProfileSession:
+    """Muestras y lag del loop acumulados durante un request o una ventana"""
+
+    def __init__(self, kind: str, label: str):
+        self.id = secrets.token_hex(8)
+        self.kind = kind
+        self.label = label
+        self.started = time.time()
+        self.ended: Optional[float] = None
+        self.samples: Counter = Counter()
+        self.idle_samples = 0
+        self.lag_max = 0.0
+        self.lag_total = 0.0
+        self.lag_count = 0
+        self.stalls = 0
+
+    @property
+    def active(self) -> bool:
+        return self.ended is None
+
+    def record_lag(self, lag: float):
+        self.lag_max = max(self.lag_max, lag)
+        self.lag_total += lag
+        self.lag_count += 1
+        if lag * 1000 >= settings.loop_lag_stall_ms:
+            self.stalls += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def summary(self) -> Dict[str, object]:
+        end = self.ended or time.time()
+        return {
+            "profile_id": self.id,
+            "kind": self.kind,
+            "label": self.label,
+            "active": self.active,
+            "duration_seconds": round(end - self.started, 3),
+            "samples": sum(self.samples.values()),
+            "idle_samples": self.idle_samples,
+            "loop_lag_ms": {
+                "max": round(self.lag_max * 1000, 1),
+                "mean": round(self.lag_total / self.lag_count * 1000, 1) if self.lag_count else 0.0,
+                "stalls": self.stalls,
+            },
+        }
+
+
+class LoopLagMonitor:
+    """Lag del event loop (corrutina) y stacks que lo bloquean (watchdog)"""
+
+    def __init__(self, interval_ms: float, stall_ms: float, max_stacks: int = 50):
+        self.interval = interval_ms / 1000
+        self.stall = stall_ms / 1000
+        self.recent: Deque[float] = deque(maxlen=1000)
+        self.blocking: Counter = Counter()
+        self.max_stacks = max_stacks
+        self.sessions: List[ProfileSession] = []
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._beat = 0.0
+        self._loop_thread = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Debe llamarse desde el event loop a monitorear"""
+        if self.running:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        # Un evento por arranque: un watchdog anterior que no terminó de salir no revive
+        self._stop = threading.Event()
+        self._task = asyncio.get_running_loop().create_task(self._tick())
+        threading.Thread(target=self._watchdog, args=(self._stop,), name="loop-lag-watchdog", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _tick(self):
+        while True:
+            before = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self._beat = time.monotonic()
+            lag = max(0.0, self._beat - before - self.interval)
+            self.recent.append(lag)
+            metrics.EVENT_LOOP_LAG.observe(lag)
+            for session in self.sessions:
+                session.record_lag(lag)
+
+    def pending_lag(self) -> float:
+        """Retraso del tick en curso (si el loop estuvo bloqueado hasta recién)"""
+        if not self.running:
+            return 0.0
+        return max(0.0, time.monotonic() - self._beat - self.interval)
+
+    def _watchdog(self, stop: threading.Event):
+        """Corre fuera del loop: si el loop no late a tiempo, captura qué lo bloquea"""
+        reported = 0.0
+        while not stop.wait(self.interval / 2):
+            beat = self._beat
+            if beat == reported or time.monotonic() - beat < self.interval + self.stall:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            reported = beat
+            stack = _fold("loop", frame)
+            metrics.EVENT_LOOP_STALLS.inc()
+            if stack in self.blocking or len(self.blocking) < self.max_stacks:
+                self.blocking[stack] += 1
+            logger.warning(
+                f"Event loop bloqueado más de {self.stall * 1000:.0f} ms en {_frame_label(frame.f_code)}",
+                extra={"stack": stack}
+            )
+
+    def stats(self) -> Dict[str, object]:
+        lags = sorted(self.recent)
+
+        def pct(q: float) -> float:
+            return round(lags[min(len(lags) - 1, int(q * len(lags)))] * 1000, 1) if lags else 0.0
+
+        return {
+            "running": self.running,
+            "interval_ms": self.interval * 1000,
+            "stall_ms": self.stall * 1000,
+            "lag_ms": {"p50": pct(0.5), "p99": pct(0.99), "max": pct(1.0)},
+            "blocking_stacks": [
+                {"stack": stack, "count": count} for stack, count in self.blocking.most_common(10)
+            ],
+        }
+
+
+class Profiler:
+    """Sesiones de profiling activas, el hilo sampler y los perfiles terminados"""
+
+    def __init__(self, interval_ms: float, max_profiles: int, output_dir: Optional[str] = None):
+        self.interval = interval_ms / 1000
+        self.max_profiles = max_profiles
+        self.output_dir = output_dir
+        self.lag_monitor = LoopLagMonitor(settings.loop_lag_interval_ms, settings.loop_lag_stall_ms)
+        self._active: List[ProfileSession] = []
+        self._profiles: "OrderedDict[str, ProfileSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._sampler: Optional[threading.Thread] = None
+
+    def start(self, kind: str, label: str) -> ProfileSession:
+        """Abre una sesión (desde el event loop); arranca el sampler si hace falta"""
+        if len(self._active) >= settings.profiling_max_active:
+            raise HTTPException(
+                status_code=429,
+                detail={"success": False, "error": "Demasiadas sesiones de profiling activas", "error_type": "too_many_profiles"}
+            )
+        session = ProfileSession(kind, label)
+        with self._lock:
+            self._active.append(session)
+        self._profiles[session.id] = session
+        while len(self._profiles) > self.max_profiles:
+            self._profiles.popitem(last=False)
+        self.lag_monitor.sessions.append(session)
+        self.lag_monitor.start()
+        if self._sampler is None or not self._sampler.is_alive():
+            self._sampler = threading.Thread(target=self._sample, name="profiler-sampler", daemon=True)
+            self._sampler.start()
+        metrics.PROFILES_CAPTURED.labels(kind).inc()
+        return session
+
+    def stop(self, session: ProfileSession):
+        if not session.active:
+            return
+        session.ended = time.time()
+        # Un request que bloqueó el loop termina antes de que el tick atrasado lo mida
+        pending = self.lag_monitor.pending_lag()
+        if pending > 0:
+            session.record_lag(pending)
+        with self._lock:
+            self._active.remove(session)
+        self.lag_monitor.sessions.remove(session)
+        if not self._active and not settings.loop_lag_monitor_enabled:
+            self.lag_monitor.stop()
+        if self.output_dir:
+            # Escribir fuera del loop
+            asyncio.get_running_loop().run_in_executor(None, self._write, session)
+
+    def start_window(self, seconds: float, label: str) -> ProfileSession:
+        session = self.start("window", label)
+        asyncio.get_running_loop().call_later(seconds, self.stop, session)
+        return session
+
+    def get(self, profile_id: str) -> Optional[ProfileSession]:
+        return self._profiles.get(profile_id)
+
+    def profiles(self) -> List[Dict[str, object]]:
+        return [session.summary() for session in reversed(self._profiles.values())]
+
+    def _sample(self):
+        own = threading.get_ident()
+        while True:
+            if not self._active:
+                return
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks: List[str] = []
+            idle = 0
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                if _is_idle(frame):
+                    idle += 1
+                    continue
+                stacks.append(_fold(names.get(ident, str(ident)), frame))
+            # Con el lock: una sesión ya detenida no recibe más muestras
+            with self._lock:
+                for session in self._active:
+                    session.samples.update(stacks)
+                    session.idle_samples += idle
+            time.sleep(self.interval)
+
+    def _write(self, session: ProfileSession):
+        path = os.path.join(self.output_dir, f"{int(session.started)}-{session.kind}-{session.id}.folded")
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(session.folded())
+        except OSError as e:
+            logger.warning(f"No se pudo guardar el perfil {session.id}: {e}")
+
+
+def authorize(token: Optional[str]) -> Dict[str, object]:
+    """Claims de un token de admin; 401/403 con el formato de error de la API"""
+    try:
+        return security.verify_admin_token(token or "")
+    except HTTPException as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail={"success": False, "error": str(e.detail), "error_type": "unauthorized"}
+        )
+
+
+class ProfilingMiddleware:
+    """
+    Middleware ASGI: perfila el request si trae `X-Cliro-Profile: <token admin>`.
+    La respuesta lleva `X-Cliro-Profile-Id` para bajar el perfil de
+    `/api/admin/profiling/{id}`. Un token inválido no perfila (el request
+    sigue normal). Solo se registra si `settings.profiling_enabled`.
+    """
+
+    def __init__(self, app, profiler: "Profiler"):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = next((value for name, value in scope["headers"] if name == PROFILE_HEADER), None)
+        if token is None:
+            await self.app(scope, receive, send)
+            return
+        try:
+            authorize(token.decode("latin-1"))
+            session = self.profiler.start("request", f"{scope['method']} {scope['path']}")
+        except HTTPException as e:
+            logger.warning(f"Profiling de request rechazado: {e.detail}")
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((PROFILE_ID_HEADER, session.id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.profiler.stop(session)
+
+
+profiler = Profiler(settings.profiling_interval_ms, settings.profiling_max_profiles, settings.profiling_output_dir)
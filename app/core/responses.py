@@ -0,0 +1,216 @@
+"""
+Serialización JSON rápida y compresión de respuestas.
+
+- FastJSONResponse: usa orjson si está instalado (fallback a json estándar).
+  Los handlers que ya devuelven dicts planos la retornan directamente para
+  saltarse jsonable_encoder y la re-validación del response_model.
+- CompressionMiddleware: br (si `brotli` está instalado) o gzip según
+  Accept-Encoding, solo por encima de `compression_min_bytes`.
+- StaticJSON: catálogos serializados una vez al arrancar, con ETag por
+  contenido, Cache-Control largo y 304 en If-None-Match.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import zlib
+from typing import Any, Dict, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Intentar importar orjson, con fallback
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+    logger.warning("orjson no instalado. Usando json estándar para respuestas.")
+
+# Intentar importar brotli, con fallback a solo gzip
+try:
+    import brotli
+    HAS_BROTLI = True
+except ImportError:
+    HAS_BROTLI = False
+
+
+def dumps(content: Any) -> bytes:
+    """Serializa a JSON compacto en UTF-8"""
+    if HAS_ORJSON:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse con orjson (datetime, UUID y dataclasses nativos)"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+# Tipos que vale la pena comprimir
+_COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "text/",
+)
+
+
+class _Compressor:
+    """Interfaz común para gzip y brotli en modo streaming"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._br = brotli.Compressor(quality=settings.compression_brotli_quality)
+        else:
+            # wbits=31 → contenedor gzip
+            self._gz = zlib.compressobj(settings.compression_gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == "br":
+            out = self._br.process(data)
+            return out + (self._br.finish() if final else self._br.flush())
+        out = self._gz.compress(data)
+        return out + self._gz.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Elige br > gzip según Accept-Encoding (ignora q=0)"""
+    offered = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        offered[name.strip()] = q
+    if HAS_BROTLI and offered.get("br", 0) > 0:
+        return "br"
+    if offered.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+class CompressionMiddleware:
+    """
+    Middleware ASGI de compresión negociada.
+    Respuestas completas por debajo del umbral salen sin comprimir; las
+    respuestas en streaming se comprimen por chunk con flush para no
+    retrasar la entrega incremental.
+    """
+
+    def __init__(self, app, minimum_size: Optional[int] = None):
+        self.app = app
+        self.minimum_size = settings.compression_min_bytes if minimum_size is None else minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor, passthrough
+
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                passthrough = (
+                    "content-encoding" in headers
+                    or not content_type.startswith(_COMPRESSIBLE_TYPES)
+                )
+                if passthrough:
+                    await send(message)
+                else:
+                    start_message = message
+                return
+
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is None:
+                if not more_body and len(body) < self.minimum_size:
+                    # Respuesta completa y chica: no vale la pena comprimir
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding)
+                headers = MutableHeaders(raw=start_message["headers"])
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if more_body:
+                    del headers["Content-Length"]
+                    await send(start_message)
+                else:
+                    compressed = compressor.compress(body, final=True)
+                    headers["Content-Length"] = str(len(compressed))
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+
+            await send({
+                "type": "http.response.body",
+                "body": compressor.compress(body, final=not more_body),
+                "more_body": more_body,
+            })
+
+        await self.app(scope, receive, send_wrapper)
+
+
+class StaticJSON:
+    """
+    Respuesta JSON inmutable: se serializa (y comprime) una sola vez.
+    Cada request solo compara el ETag y elige la variante ya codificada.
+    """
+
+    def __init__(self, content: Any, max_age: Optional[int] = None):
+        max_age = settings.catalog_cache_max_age if max_age is None else max_age
+        body = dumps(content)
+        self.etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        self.cache_control = f"public, max-age={max_age}, stale-while-revalidate={max_age}"
+        self.variants: Dict[str, bytes] = {"identity": body, "gzip": gzip.compress(body, 9)}
+        if HAS_BROTLI:
+            self.variants["br"] = brotli.compress(body, quality=11)
+
+    def not_modified(self, request: Request) -> bool:
+        if_none_match = request.headers.get("if-none-match")
+        if not if_none_match:
+            return False
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in candidates or self.etag in candidates
+
+    def response(self, request: Request) -> Response:
+        headers = {
+            "ETag": self.etag,
+            "Cache-Control": self.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if self.not_modified(request):
+            return Response(status_code=304, headers=headers)
+        encoding = negotiate_encoding(request.headers.get("accept-encoding", "")) or "identity"
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(self.variants[encoding], media_type="application/json", headers=headers)
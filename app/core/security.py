@@ -5,9 +5,14 @@ from typing import Optional, Dict, Any, Tuple
 from datetime import datetime, timedelta
 import logging
 from fastapi import HTTPException, status
+from app.core.validation import filter_languages, is_interest_reason
 
 logger = logging.getLogger(__name__)
 
+# Caracteres de control que se eliminan del input (se conservan \t, \n y \r)
+_CONTROL_CHARS = re.compile(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]')
+_EMAIL = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+
 # Intentar importar email_validator, con fallback
 try:
     from email_validator import validate_email, EmailNotValidError
@@ -51,8 +56,7 @@ class SecurityService:
                 if not local_part or not domain or "." not in domain:
                     return False
                 # Validar caracteres básicos
-                email_regex = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-                if not re.match(email_regex, email):
+                if not _EMAIL.match(email):
                     return False
             return True
         except (EmailNotValidError, ValueError):
@@ -70,41 +74,22 @@ class SecurityService:
             text = text[:max_length]
         
         # Remover caracteres peligrosos (básico)
-        text = re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]', '', text)
+        text = _CONTROL_CHARS.sub('', text)
         
         return text if text else None
     
     @staticmethod
     def validate_languages(languages: list) -> Tuple[bool, list]:
-        """Valida lista de idiomas SIN IMPORTAR constants aquí"""
-        # NO importar SUPPORTED_LANGUAGES aquí para evitar circular imports
-        BASIC_SUPPORTED_LANGUAGES = ["es", "en", "fr", "de", "it", "pt", "zh", "ja", "ko", "ru", "ar"]
-        
+        """Valida lista de idiomas (listas blancas en app/core/validation.py)"""
         if not languages or not isinstance(languages, list):
             return False, []
-        
-        # Limitar a máximo permitido
-        languages = languages[:3]
-        
-        # Filtrar solo idiomas válidos
-        valid_languages = [
-            lang for lang in languages 
-            if lang in BASIC_SUPPORTED_LANGUAGES
-        ]
-        
-        # Eliminar duplicados
-        valid_languages = list(dict.fromkeys(valid_languages))
-        
+        valid_languages = filter_languages(languages)
         return len(valid_languages) > 0, valid_languages
     
     @staticmethod
     def validate_interest_reason(reason_id: str) -> bool:
-        """Valida que la razón de interés sea válida SIN IMPORTAR constants"""
-        BASIC_INTEREST_REASONS = [
-            "productivity", "writing", "learning", "content", 
-            "students", "business", "accessibility", "other"
-        ]
-        return reason_id in BASIC_INTEREST_REASONS
+        """Valida que la razón de interés sea una de las predefinidas"""
+        return is_interest_reason(reason_id)
     
     @staticmethod
     def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -164,6 +149,17 @@ class SecurityService:
                 detail="Error de autenticación"
             )
     
+    @staticmethod
+    def verify_admin_token(token: str) -> Dict[str, Any]:
+        """Verifica un JWT y exige el claim role=admin (herramientas operativas)"""
+        payload = SecurityService.verify_token(token)
+        if payload.get("role") != "admin":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Se requiere un token de administrador"
+            )
+        return payload
+    
     @staticmethod
     def generate_verification_token() -> str:
         """Genera un token aleatorio para verificación de email"""
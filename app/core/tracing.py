@@ -0,0 +1,240 @@
+"""
+Spans ligeros por request (router → service → DB/Gemini).
+
+El trace activo viaja en un ContextVar, así que `span()` funciona igual en
+handlers async y en funciones llamadas desde ellos sin pasar nada explícito.
+Sin trace activo (tracing deshabilitado) `span()` devuelve un objeto no-op
+compartido: una lectura de ContextVar y nada más.
+"""
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.utils.http import route_template
+
+logger = logging.getLogger(__name__)
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("cliro_trace", default=None)
+_current_span: ContextVar[Optional["Span"]] = ContextVar("cliro_span", default=None)
+
+# Server-Timing solo admite tokens como nombre de métrica
+_SERVER_TIMING_INVALID = re.compile(r"[^A-Za-z0-9_\-]")
+
+
+class Span:
+    """Un tramo medido dentro de un trace"""
+
+    __slots__ = ("trace", "name", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "_token")
+
+    def __init__(self, trace: "Trace", name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = attributes
+        self.start_ns = 0
+        self.end_ns = 0
+        self._token = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns or time.time_ns()
+        return (end - self.start_ns) / 1_000_000
+
+    def __enter__(self):
+        self.start_ns = time.time_ns()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.time_ns()
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        _current_span.reset(self._token)
+        self.trace.spans.append(self)
+        return False
+
+
+class _NoopSpan:
+    """Span vacío usado cuando no hay trace activo"""
+
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    """Conjunto de spans de un request"""
+
+    __slots__ = ("trace_id", "spans", "start_ns")
+
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans: List[Span] = []
+        self.start_ns = time.time_ns()
+
+    def server_timing(self) -> str:
+        """Construye el header Server-Timing agregando duración por nombre de span"""
+        totals: Dict[str, float] = {}
+        for s in self.spans:
+            key = _SERVER_TIMING_INVALID.sub("_", s.name)
+            totals[key] = totals.get(key, 0.0) + s.duration_ms
+        total_ms = (time.time_ns() - self.start_ns) / 1_000_000
+        parts = [f"{name};dur={dur:.1f}" for name, dur in totals.items()]
+        parts.append(f"total;dur={total_ms:.1f}")
+        return ", ".join(parts)
+
+
+def span(name: str, **attributes):
+    """
+    Abre un span hijo del span actual.
+    Uso: `with span("db.insert", table="waitlist_users"): ...`
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return _NOOP_SPAN
+    return Span(trace, name, _current_span.get(), attributes)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+# =========================
+# Export (formato OTLP/JSON)
+# =========================
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(trace: Trace) -> Dict[str, Any]:
+    """Convierte un trace al payload JSON de OTLP (ExportTraceServiceRequest)"""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": settings.app_name}},
+                {"key": "service.version", "value": {"stringValue": settings.app_version}},
+            ]},
+            "scopeSpans": [{
+                "scope": {"name": "app.core.tracing"},
+                "spans": [
+                    {
+                        "traceId": trace.trace_id,
+                        "spanId": s.span_id,
+                        "parentSpanId": s.parent_id or "",
+                        "name": s.name,
+                        "kind": 1 if s.parent_id else 2,  # INTERNAL / SERVER
+                        "startTimeUnixNano": str(s.start_ns),
+                        "endTimeUnixNano": str(s.end_ns),
+                        "attributes": [
+                            {"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()
+                        ],
+                    }
+                    for s in trace.spans
+                ],
+            }],
+        }]
+    }
+
+
+class SpanExporter:
+    """
+    Exporta traces en un hilo de fondo para no bloquear el event loop.
+    Destinos: archivo JSON lines y/o collector OTLP/HTTP (`/v1/traces`).
+    Si la cola se llena los traces se descartan y se cuentan en `dropped`.
+    """
+
+    def __init__(self, path: Optional[str] = None, url: Optional[str] = None, max_queue: int = 1000):
+        self.path = path
+        self.url = url
+        self.dropped = 0
+        self._queue: "queue.Queue[Trace]" = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, trace: Trace):
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        http_client = None
+        if self.url:
+            import httpx
+            http_client = httpx.Client(timeout=5.0)
+        while True:
+            trace = self._queue.get()
+            payload = to_otlp(trace)
+            try:
+                if self.path:
+                    with open(self.path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+                if http_client is not None:
+                    http_client.post(self.url, json=payload)
+            except Exception as e:
+                logger.warning(f"No se pudo exportar trace {trace.trace_id}: {e}")
+
+
+class TracingMiddleware:
+    """
+    Middleware ASGI que abre el trace raíz de cada request y agrega el header
+    Server-Timing. Solo se registra si `settings.tracing_enabled`.
+    """
+
+    def __init__(self, app, exporter: Optional[SpanExporter] = None):
+        self.app = app
+        self.exporter = exporter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace()
+        trace_token = _current_trace.set(trace)
+        root = Span(trace, f"http {scope['method']}", None, {"http.target": scope["path"]})
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                root.name = f"http {scope['method']} {route_template(scope)}"
+                root.set_attribute("http.status_code", message["status"])
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            with root:
+                await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_trace.reset(trace_token)
+            if self.exporter is not None:
+                self.exporter.export(trace)
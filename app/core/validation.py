@@ -0,0 +1,74 @@
+"""
+Validación de los datos de la waitlist, compilada una sola vez desde
+app/core/constants.py (y el tope `max_languages_per_user` de settings).
+
+Las listas blancas son frozensets (búsqueda O(1)) y los patrones se compilan
+al importar. Los mismos chequeos los usan los schemas (como validadores de
+pydantic v2 sobre tipos `Annotated`, ver app/schemas/auth.py) y
+SecurityService, así que no hay copias de las listas que se puedan
+desincronizar. constants.py no importa nada del proyecto: importarlo desde
+acá no genera ciclos.
+"""
+import re
+from typing import Annotated, List
+
+from pydantic import AfterValidator, Field
+
+from app.core.config import settings
+from app.core.constants import INTEREST_REASONS, PLANNED_LANGUAGES, SUPPORTED_LANGUAGES
+
+# Idiomas aceptados como preferencia: los soportados y los planeados
+WAITLIST_LANGUAGES = frozenset(SUPPORTED_LANGUAGES).union(PLANNED_LANGUAGES)
+INTEREST_REASON_IDS = frozenset(reason["id"] for reason in INTEREST_REASONS)
+MAX_PREFERRED_LANGUAGES = settings.max_languages_per_user
+
+_INTEREST_REASON_ERROR = f"Razón inválida. Opciones: {', '.join(reason['id'] for reason in INTEREST_REASONS)}"
+_NAME = re.compile(r"[a-zA-ZáéíóúÁÉÍÓÚñÑ\s\-'.]+")
+
+
+def validate_name(value: str) -> str:
+    """Nombre sin espacios en los bordes, de al menos 2 letras y sin números"""
+    value = value.strip()
+    if len(value) < 2:
+        raise ValueError("Nombre demasiado corto")
+    if _NAME.fullmatch(value):
+        return value
+    # Solo ante un nombre inválido: qué mensaje corresponde
+    if any(char.isdigit() for char in value):
+        raise ValueError("El nombre no puede contener números")
+    raise ValueError("Nombre contiene caracteres inválidos")
+
+
+def is_interest_reason(value: str) -> bool:
+    return value in INTEREST_REASON_IDS
+
+
+def validate_interest_reason(value: str) -> str:
+    if value not in INTEREST_REASON_IDS:
+        raise ValueError(_INTEREST_REASON_ERROR)
+    return value
+
+
+def filter_languages(languages: List[str]) -> List[str]:
+    """Los primeros idiomas válidos, sin duplicados y en el orden recibido"""
+    return list(dict.fromkeys(
+        lang for lang in languages[:MAX_PREFERRED_LANGUAGES] if lang in WAITLIST_LANGUAGES
+    ))
+
+
+def validate_languages(languages: List[str]) -> List[str]:
+    if not languages:
+        raise ValueError("Debe seleccionar al menos un idioma")
+    valid = filter_languages(languages)
+    if not valid:
+        raise ValueError("Debe seleccionar al menos un idioma válido")
+    return valid
+
+
+# Tipos para los schemas: las restricciones de Field corren en pydantic-core
+# y después el validador compilado
+WaitlistName = Annotated[str, Field(min_length=2, max_length=100), AfterValidator(validate_name)]
+InterestReason = Annotated[str, AfterValidator(validate_interest_reason)]
+PreferredLanguages = Annotated[
+    List[str], Field(max_length=MAX_PREFERRED_LANGUAGES), AfterValidator(validate_languages)
+]
@@ -1,17 +1,225 @@
 from supabase import create_client, Client
 from app.core.config import settings
-from typing import Optional
+from app.core.metrics import track_upstream
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, Optional
+import asyncio
+import httpx
 import logging
+import math
+import random
 import time
 
+from postgrest.exceptions import APIError as PostgrestAPIError
+
 logger = logging.getLogger(__name__)
 
+# =========================
+# Errores tipados de acceso a datos
+# =========================
+
+class DatabaseError(Exception):
+    """Error base de acceso a datos"""
+
+class DatabaseUnavailableError(DatabaseError):
+    """Supabase no respondió tras agotar los reintentos"""
+
+class DatabaseTimeoutError(DatabaseError):
+    """Se agotó el presupuesto de tiempo del request"""
+
+class DatabaseQueryError(DatabaseError):
+    """Error no transitorio (query inválida, constraint, permisos)"""
+
+# Códigos de PostgREST/Postgres que indican fallas transitorias
+_TRANSIENT_HTTP_STATUS = {"408", "429", "500", "502", "503", "504", "520"}
+_TRANSIENT_PG_PREFIXES = ("08", "53", "57P", "PGRST000", "PGRST001", "PGRST002")
+
+def is_transient(error: Exception) -> bool:
+    """Indica si vale la pena reintentar la operación"""
+    if isinstance(error, (httpx.TransportError, ConnectionError)):
+        return True
+    if isinstance(error, PostgrestAPIError):
+        code = str(error.code or "")
+        return code in _TRANSIENT_HTTP_STATUS or code.startswith(_TRANSIENT_PG_PREFIXES)
+    return False
+
+# =========================
+# Presupuesto de tiempo por request
+# =========================
+
+_deadline: ContextVar[Optional[float]] = ContextVar("db_deadline", default=None)
+
+@contextmanager
+def deadline_budget(seconds: Optional[float] = None):
+    """
+    Fija un deadline compartido por todas las operaciones de BD dentro del bloque.
+    Si ya hay uno más estricto (bloques anidados) se respeta ese.
+    """
+    seconds = settings.db_request_budget_seconds if seconds is None else seconds
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def remaining_budget() -> Optional[float]:
+    """Segundos restantes del presupuesto actual (None si no hay)"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+async def run_query(
+    query: Any,
+    operation: str,
+    idempotent: bool = True,
+    endpoint: Optional["DatabaseEndpoint"] = None,
+    max_retries: Optional[int] = None
+) -> Any:
+    """
+    Ejecuta un query builder de postgrest fuera del event loop.
+    - Lecturas (idempotent=True): reintentos con backoff exponencial y full jitter
+    - Todas: respetan el presupuesto de tiempo del request
+    - Siempre lanza DatabaseError tipados
+    `endpoint` (primario por defecto) solo afecta métricas y estadísticas.
+    """
+    if hasattr(query, "retry"):
+        # Los reintentos los maneja esta capa (postgrest-py duerme en el hilo)
+        query = query.retry(False)
+    retries = settings.db_max_retries if max_retries is None else max_retries
+    attempts = retries + 1 if idempotent else 1
+    last_error: Optional[Exception] = None
+    endpoint = endpoint or db_manager.primary
+
+    for attempt in range(attempts):
+        remaining = remaining_budget()
+        if remaining is not None and remaining <= 0:
+            raise DatabaseTimeoutError(f"Presupuesto de BD agotado en {operation}") from last_error
+        timeout = settings.db_attempt_timeout_seconds
+        if remaining is not None:
+            timeout = min(timeout, remaining)
+        try:
+            with track_upstream(endpoint.upstream, operation), endpoint.track():
+                return await asyncio.wait_for(asyncio.to_thread(query.execute), timeout=timeout)
+        except asyncio.TimeoutError as e:
+            last_error = e
+        except Exception as e:
+            if not is_transient(e):
+                raise DatabaseQueryError(f"Error en {operation}: {e}") from e
+            last_error = e
+
+        if attempt + 1 < attempts:
+            delay = random.uniform(0, min(settings.db_backoff_max_seconds, settings.db_backoff_base_seconds * 2 ** attempt))
+            remaining = remaining_budget()
+            if remaining is not None and delay >= remaining:
+                break
+            logger.warning(f"Reintentando {operation} ({attempt + 1}/{attempts - 1}) en {delay:.2f}s: {last_error!r}")
+            await asyncio.sleep(delay)
+
+    if isinstance(last_error, asyncio.TimeoutError):
+        raise DatabaseTimeoutError(f"Timeout en {operation}") from last_error
+    raise DatabaseUnavailableError(f"Supabase no disponible en {operation}") from last_error
+
+async def run_read(table: str, build: Callable[[Any], Any], operation: str) -> Any:
+    """
+    Lectura ruteada: `build` recibe el table builder del endpoint elegido
+    (réplica si está configurada, sana y sin escrituras recientes en la
+    tabla) y devuelve el query. Si la réplica falla se repite en el primario
+    dentro del mismo presupuesto; la réplica hace un solo intento para que
+    quede tiempo para el fallback.
+    """
+    endpoint = db_manager.route(table)
+    if endpoint is not db_manager.primary:
+        try:
+            return await run_query(build(endpoint.table(table)), operation, endpoint=endpoint, max_retries=0)
+        except DatabaseError as e:
+            logger.warning(f"Réplica falló en {operation}, se lee del primario: {e}")
+            endpoint.mark_down()
+            endpoint.fallbacks += 1
+    return await run_query(build(db_manager.get_table(table)), operation)
+
+class DatabaseEndpoint:
+    """Un endpoint de PostgREST (primario o réplica) con sus estadísticas"""
+    
+    def __init__(self, name: str, url: str, key: str, client: Optional[Client] = None):
+        self.name = name
+        self.url = url
+        self._key = key
+        self._client = client
+        self.upstream = "supabase" if name == "primary" else f"supabase_{name}"
+        self.requests = 0
+        self.errors = 0
+        self.fallbacks = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.down_until = 0.0
+        self._latencies: Deque[float] = deque(maxlen=512)
+    
+    @property
+    def client(self) -> Client:
+        if self._client is None:
+            self._client = create_client(self.url, self._key)
+        return self._client
+    
+    def table(self, table_name: str):
+        return self.client.table(table_name)
+    
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.down_until
+    
+    def mark_down(self):
+        """Saca al endpoint de la rotación durante db_replica_cooldown_seconds"""
+        self.down_until = time.monotonic() + settings.db_replica_cooldown_seconds
+    
+    @contextmanager
+    def track(self):
+        self.requests += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.errors += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self._latencies.append(time.perf_counter() - start)
+    
+    def snapshot(self) -> Dict[str, Any]:
+        latencies = sorted(self._latencies)
+        def percentile(q: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, math.ceil(q * len(latencies)) - 1)], 4)
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "fallbacks": self.fallbacks,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "healthy": self.healthy,
+            "p50_seconds": percentile(0.5),
+            "p95_seconds": percentile(0.95),
+        }
+
 class DatabaseManager:
-    """Gestor seguro de conexiones a Supabase"""
+    """
+    Gestor seguro de conexiones a Supabase.
+    Escrituras (y lecturas que deben ver lo último) van al primario; con
+    `supabase_read_url` las lecturas toleran hasta `db_replica_max_lag_seconds`
+    de atraso y van a la réplica, salvo que la tabla se haya escrito hace
+    menos que eso desde este proceso.
+    """
     
     _instance: Optional['DatabaseManager'] = None
     _client: Optional[Client] = None
     _last_connection_test: float = 0
+    primary: Optional[DatabaseEndpoint] = None
+    replica: Optional[DatabaseEndpoint] = None
     
     def __new__(cls):
         if cls._instance is None:
@@ -29,6 +237,15 @@ class DatabaseManager:
                 settings.supabase_url,
                 settings.supabase_service_key
             )
+            self.primary = DatabaseEndpoint("primary", settings.supabase_url, settings.supabase_service_key, self._client)
+            self._last_write = {}
+            if settings.supabase_read_url:
+                # La réplica se conecta en el primer uso: si no está, las lecturas caen al primario
+                self.replica = DatabaseEndpoint(
+                    "replica",
+                    settings.supabase_read_url,
+                    settings.supabase_read_key or settings.supabase_service_key
+                )
             
             # Test de conexión
             self.test_connection()
@@ -64,10 +281,41 @@ class DatabaseManager:
                 raise ConnectionError("Conexión a Supabase perdida")
         return self._client
     
-    def get_table(self, table_name: str):
-        """Obtiene referencia a una tabla con logging"""
-        logger.debug(f"Accediendo a tabla: {table_name}")
+    def get_table(self, table_name: str, intent: str = "write"):
+        """
+        Obtiene referencia a una tabla con logging.
+        intent="read" la toma del endpoint de lectura (ver route); para
+        lecturas con fallback al primario usar run_read.
+        """
+        # DEBUG de alto volumen: el logging lo muestrea (ver log_debug_sample_every)
+        logger.debug("Accediendo a tabla: %s (%s)", table_name, intent)
+        if intent == "read":
+            return self.route(table_name).table(table_name)
         return self.client.table(table_name)
+    
+    def route(self, table_name: str) -> DatabaseEndpoint:
+        """Endpoint para leer `table_name`: la réplica salvo que no esté sana o que pueda estar atrasada"""
+        replica = self.replica
+        if replica is None or not replica.healthy:
+            return self.primary
+        written = self._last_write.get(table_name)
+        if written is not None and time.monotonic() - written < settings.db_replica_max_lag_seconds:
+            # Escritura reciente: la réplica todavía podría no tenerla
+            return self.primary
+        return replica
+    
+    def note_write(self, table_name: str):
+        """Registra una escritura: las lecturas de la tabla van al primario durante el lag tolerado"""
+        self._last_write[table_name] = time.monotonic()
+    
+    def stats(self) -> Dict[str, Any]:
+        endpoints = {"primary": self.primary.snapshot()}
+        if self.replica is not None:
+            endpoints["replica"] = self.replica.snapshot()
+        return {
+            "endpoints": endpoints,
+            "replica_max_lag_seconds": settings.db_replica_max_lag_seconds if self.replica else None,
+        }
 
 # Instancia global
 db_manager = DatabaseManager()
@@ -1,28 +1,62 @@
+import asyncio
+from contextlib import asynccontextmanager, suppress
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
-from app.routers import auth, ai
+from app.routers import auth, ai, admin
 from app.core.config import settings
+from app.core import capture, metrics, profiling, tracing
+from app.core.logging_config import setup_logging
+from app.core.responses import CompressionMiddleware, FastJSONResponse
+from app.utils.http import route_template
+from app.services.usage_ledger import usage_ledger
+from app.services.warmup import warmup
+from app.db import db_manager
 import logging
 from datetime import datetime
 
 import os
-import logging
+
+# Configuración de logging (no bloqueante, JSON estructurado)
+setup_logging()
 
 # Add startup logging
 logging.info(f"Starting app with PORT={os.getenv('PORT')}")
 logging.info(f"Environment: {os.getenv('ENVIRONMENT', 'development')}")
 
-# Configuración de logging
-logging.basicConfig(
-    level=logging.DEBUG if settings.debug else logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Persistencia por lotes del ledger de uso de IA
+    flusher = asyncio.create_task(usage_ledger.run_flusher()) if settings.ai_usage_persist_enabled else None
+    # Lag del event loop permanente (si no, solo mientras se perfila)
+    if settings.loop_lag_monitor_enabled:
+        profiling.profiler.lag_monitor.start()
+    # Conexiones, imports y caches en caliente. Corre en segundo plano: el
+    # servidor ya responde /health y /ready da 503 hasta que termina
+    warmup_task = None
+    if settings.warmup_enabled:
+        warmup_task = asyncio.create_task(warmup.run(settings.warmup_timeout_seconds))
+    else:
+        warmup.done = True
+    yield
+    if warmup_task is not None:
+        warmup_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await warmup_task
+    profiling.profiler.lag_monitor.stop()
+    if flusher is not None:
+        flusher.cancel()
+        with suppress(asyncio.CancelledError):
+            await flusher
+    # Liberar gauges del worker en modo multiproceso
+    metrics.mark_process_dead()
 
 app = FastAPI(
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse,
     title=settings.app_name,
     description="Backend para Cliro Notes - Extensión de Chrome",
     version="1.0.0",
@@ -33,7 +67,13 @@ app = FastAPI(
 # Rate Limiter global
 limiter = Limiter(key_func=get_remote_address)
 app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+
+def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
+    """Cuenta rechazos por ruta antes de delegar en slowapi"""
+    metrics.RATE_LIMIT_REJECTIONS.labels(route_template(request.scope)).inc()
+    return _rate_limit_exceeded_handler(request, exc)
+
+app.add_exception_handler(RateLimitExceeded, rate_limit_exceeded_handler)
 
 # CORS Configuration usando la lista convertida
 app.add_middleware(
@@ -42,11 +82,36 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-AI-Budget-Limit", "X-AI-Budget-Remaining", "X-AI-Budget-Reset", "Retry-After", "X-Cliro-Profile-Id"],
 )
 
+# Compresión negociada (br/gzip) por encima de compression_min_bytes
+app.add_middleware(CompressionMiddleware)
+
+# Spans por request y Server-Timing (sin middleware si está deshabilitado)
+if settings.tracing_enabled:
+    exporter = None
+    if settings.tracing_export_path or settings.tracing_export_url:
+        exporter = tracing.SpanExporter(settings.tracing_export_path, settings.tracing_export_url)
+    app.add_middleware(tracing.TracingMiddleware, exporter=exporter)
+
+# Profiling bajo demanda (sin middleware ni hilos si está deshabilitado)
+if settings.profiling_enabled:
+    app.add_middleware(profiling.ProfilingMiddleware, profiler=profiling.profiler)
+
+# Captura de tráfico anonimizado para replay (sin middleware si está deshabilitada)
+if settings.capture_enabled:
+    app.add_middleware(capture.CaptureMiddleware, capture=capture.traffic_capture)
+
+# Métricas por ruta: se registra último para ser el middleware más externo y
+# medir el request completo (incluidos profiling y captura)
+app.add_middleware(metrics.MetricsMiddleware)
+
 # Registrar routers
 app.include_router(auth.router, prefix="/api/auth")
 app.include_router(ai.router, prefix="/api/ai")
+if settings.profiling_enabled:
+    app.include_router(admin.router, prefix="/api/admin")
 
 @app.get("/")
 @limiter.limit("30/minute")
@@ -67,7 +132,6 @@ async def root(request: Request):
 @limiter.limit("60/minute")
 async def health_check(request: Request):
     """Health check para monitoreo"""
-    from app.db import db_manager
     try:
         # Verificar conexión a Supabase
         db_manager.test_connection()
@@ -85,6 +149,18 @@ async def health_check(request: Request):
             "timestamp": datetime.utcnow().isoformat()
         }
         
+@app.get("/ready")
+async def readiness_check():
+    """Readiness: 503 hasta que termina el warmup, después la duración de cada paso"""
+    if not warmup.done:
+        return JSONResponse(status_code=503, content={"status": "warming_up"})
+    return {"status": "ready", "warmup": warmup.snapshot()}
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Métricas en formato Prometheus"""
+    return Response(content=metrics.render_metrics(), media_type=metrics.CONTENT_TYPE_LATEST)
+
 if __name__ == "__main__":
     import uvicorn
     from app.core.config import settings
@@ -0,0 +1,56 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+from app.core.config import settings
+from app.core.profiling import authorize, profiler
+from app.schemas.admin import ProfilingWindowRequest
+import logging
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+def require_admin(request: Request) -> dict:
+    """`Authorization: Bearer <token>` con role=admin"""
+    header: Optional[str] = request.headers.get("authorization")
+    token = header[7:] if header and header.lower().startswith("bearer ") else None
+    return authorize(token)
+
+@router.post("/profiling", status_code=202)
+async def start_profiling_window(data: ProfilingWindowRequest, claims: dict = Depends(require_admin)):
+    """
+    Perfila el proceso completo durante `seconds` (sampling + lag del loop).
+    El perfil se baja de GET /profiling/{profile_id} cuando termina.
+    """
+    seconds = min(data.seconds, settings.profiling_max_seconds)
+    session = profiler.start_window(seconds, data.label or "window")
+    logger.info(f"Ventana de profiling de {seconds} s iniciada por {claims.get('sub')}", extra={"profile_id": session.id})
+    return {"success": True, "profile_id": session.id, "seconds": seconds}
+
+@router.get("/profiling")
+async def list_profiles(claims: dict = Depends(require_admin)):
+    """Perfiles recientes (activos y terminados) y lag del event loop"""
+    return {
+        "profiles": profiler.profiles(),
+        "loop_lag": profiler.lag_monitor.stats()
+    }
+
+@router.get("/profiling/{profile_id}", response_class=PlainTextResponse)
+async def get_profile(profile_id: str, claims: dict = Depends(require_admin)):
+    """
+    Stacks en formato folded (una línea `frame;frame;... N` por stack), para
+    flamegraph.pl, speedscope o inferno. 409 mientras la sesión sigue activa.
+    """
+    session = profiler.get(profile_id)
+    if session is None:
+        raise HTTPException(
+            status_code=404,
+            detail={"success": False, "error": "Perfil no encontrado", "error_type": "not_found"}
+        )
+    if session.active:
+        raise HTTPException(
+            status_code=409,
+            detail={"success": False, "error": "El perfil todavía se está capturando", "error_type": "in_progress"}
+        )
+    return PlainTextResponse(session.folded(), headers={
+        "Content-Disposition": f'attachment; filename="{profile_id}.folded"'
+    })
@@ -1,12 +1,53 @@
-from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi import APIRouter, HTTPException, Query, Request, WebSocket
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
 from typing import Optional
-from app.services.ai_service import process_ai_action
+from datetime import datetime
+from app.services.ai_service import (
+    delete_document, document_store, get_document, prefetch, prefetcher, process_ai_action,
+    detected_language, process_ai_batch, register_document, result_cache, stream_xray, translation_memory
+)
+from app.services.document_store import Document, DocumentNotFoundError
+from app.services.ai_resilience import AIError, gemini_breaker, latencies
+from app.services.usage_ledger import budget_headers, estimate_cost, usage_key, usage_ledger
+from app.services.ai_scheduler import ai_scheduler, priority_class
+from app.services.ai_channel import AIChannel
+from app.core.config import settings
+from app.core.tracing import span
+from app.core.responses import FastJSONResponse, StaticJSON, dumps
+from app.core.constants import ACTION_ALIASES, AI_ACTIONS, REWRITE_TONES
+from app.schemas.ai import AIBatchRequest, AIDocumentAction, AIDocumentCreate, AIPrefetchRequest, AIProcessRequest
+from app.utils.request_body import read_json_body
 # from app.core.security import verify_token  # COMENTAR por ahora
+from app.core.security import security
 import logging
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Catálogo de acciones: se serializa una vez al importar el router
+ACTIONS_CATALOG = StaticJSON({
+    "actions": list(AI_ACTIONS.values()),
+    "rewrite_tones": REWRITE_TONES,
+    "supported_languages": ["es", "en", "fr", "de", "it", "pt"]
+})
+
+def token_subject(token: Optional[str]) -> Optional[str]:
+    """
+    El token todavía no es obligatorio (MVP): si es válido, su `sub` es la
+    clave de cuota y de dueño y sube la prioridad en el scheduler; uno
+    inválido se trata como anónimo (cuota por IP)
+    """
+    if not token:
+        return None
+    try:
+        claims = security.verify_token(token)
+    except HTTPException:
+        return None
+    subject = claims.get("sub") or claims.get("user_id")
+    return str(subject) if subject else None
+
 @router.get("/")
 async def process_ai(
     request: Request,  # Agregar request para rate limiting si lo usas
@@ -18,11 +59,59 @@ async def process_ai(
     user_id: Optional[str] = Query(None, description="ID del usuario para tracking"),
     token: Optional[str] = Query(None, description="Token de autenticación (opcional por ahora)")
 ):
-    text = userText.strip()
     """
     Endpoint principal para procesamiento de IA
     Compatible con llamadas GET desde la extensión Chrome
     """
+    return await run_ai_request(request, action, userText, payload or tone or language, language, user_id, token)
+
+@router.post("/", openapi_extra={
+    "requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": AIProcessRequest.model_json_schema()}}
+    }
+})
+async def process_ai_post(request: Request):
+    """
+    Igual que GET /api/ai/ pero con el texto en un body JSON (sin límite de
+    URL ni percent-encoding, y fuera de los access logs). Acepta
+    Content-Encoding gzip, deflate o zstd; el body se lee en streaming y se
+    rechaza con 413 en cuanto pasa `ai_max_body_bytes`.
+    """
+    data = parse_body(AIProcessRequest, await read_json_body(request, settings.ai_max_body_bytes))
+    return await run_ai_request(
+        request, data.action, data.userText, data.payload or data.tone or data.language,
+        data.language, data.user_id, data.token
+    )
+
+def parse_body(model, body):
+    """Valida un body ya leído con el mismo formato de error que FastAPI (loc con "body")"""
+    try:
+        return model.model_validate(body)
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)], body=body
+        )
+
+async def run_ai_request(
+    request: Request,
+    action: str,
+    user_text: str,
+    payload: Optional[str],
+    language: Optional[str],
+    user_id: Optional[str],
+    token: Optional[str],
+    document: Optional[Document] = None,
+    metadata: Optional[dict] = None
+):
+    """
+    Lógica común de GET y POST /api/ai/ y de las acciones sobre documentos
+    (`document` habilita su context cache; `metadata` se suma a la respuesta)
+    """
+    text = user_text.strip()
+    client_ip = request.client.host if request.client else None
+    subject = token_subject(token)
+    budget_key = usage_key(subject, client_ip)
     try:
         # Por ahora no validamos token (para MVP)
         # if token:
@@ -32,25 +121,44 @@ async def process_ai(
         ai_request = {
             "action": action,
             "text": text,
-            "payload": payload or tone or language,
+            "payload": payload,
             "user_id": user_id,
-            "client_ip": request.client.host if request.client else None
+            "client_ip": client_ip,
+            "priority": priority_class(len(text), subject is not None),
+            "document": document
         }
         
-        logger.info(f"Procesando acción de IA: {action}, caracteres: {len(text)}")
+        logger.info(f"Procesando acción de IA: {action}, caracteres: {len(text)}", extra={"action": action, "chars": len(text)})
         
-        result = await process_ai_action(ai_request)
-        return {
+        # Cuota ponderada por costo: se reserva la estimación antes de llamar a Gemini
+        ai_request["reservation"] = usage_ledger.reserve(
+            budget_key, estimate_cost(ACTION_ALIASES.get(action.lower(), action), len(text))
+        )
+        try:
+            with span("ai.process", action=action):
+                result = await process_ai_action(ai_request)
+        finally:
+            usage_ledger.settle(ai_request["reservation"])
+        # Detectado localmente solo para translate (ya lo calculó al decidir el salto)
+        detected = detected_language(ai_request)
+        # Dict plano: se serializa directo sin jsonable_encoder
+        return FastJSONResponse({
             "success": True,
             "result": result,
             "action": action,
             "metadata": {
                 "chars_processed": len(text),
                 "action_type": action,
-                "language": language or "auto"
+                "language": language or detected or "auto",
+                "source_language": detected,
+                "translation_skipped": ai_request.get("translation_skipped", False),
+                **(metadata or {})
             }
-        }
+        }, headers=budget_headers(usage_ledger.snapshot(budget_key)))
         
+    except AIError as e:
+        logger.warning(f"Error de IA ({e.kind}): {str(e)}", extra={"action": action, "error_type": e.kind})
+        raise ai_http_error(e, action, budget_headers(usage_ledger.snapshot(budget_key)))
     except Exception as e:
         logger.error(f"Error en proceso de IA: {str(e)}", exc_info=True)
         raise HTTPException(
@@ -62,18 +170,286 @@ async def process_ai(
             }
         )
 
-@router.get("/actions")
-async def get_available_actions():
+@router.post("/documents", openapi_extra={
+    "requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": AIDocumentCreate.model_json_schema()}}
+    }
+})
+async def create_document(request: Request):
     """
-    Devuelve las acciones disponibles para la extensión
+    Registra el texto de una página una sola vez (acepta body comprimido,
+    como POST /api/ai/). Las acciones posteriores lo referencian por
+    `document_id` en /documents/{document_id}/actions.
+    """
+    data = parse_body(AIDocumentCreate, await read_json_body(request, settings.ai_document_max_bytes))
+    client_ip = request.client.host if request.client else None
+    try:
+        document = register_document(data.text, usage_key(token_subject(data.token), client_ip))
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail={"success": False, "error": str(e), "error_type": "too_large"})
+    return FastJSONResponse({
+        "success": True,
+        "document_id": document.id,
+        "chars": len(document.text),
+        "expires_in": settings.ai_documents_ttl_seconds
+    }, status_code=201)
+
+@router.post("/documents/{document_id}/actions")
+async def process_document_action(request: Request, document_id: str, body: AIDocumentAction):
+    """
+    Ejecuta una acción sobre un documento registrado, completo o sobre el
+    fragmento [start, end). Sobre el documento completo se usa el context
+    cache de Gemini si existe, sin reenviar el texto.
+    """
+    client_ip = request.client.host if request.client else None
+    document = find_document(document_id, usage_key(token_subject(body.token), client_ip))
+    try:
+        text = document.span(body.start, body.end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail={"success": False, "error": str(e), "error_type": "invalid_span"})
+    whole = body.start is None and body.end is None
+    return await run_ai_request(
+        request, body.action, text, body.payload or body.tone or body.language,
+        body.language, body.user_id, body.token,
+        document=document if whole else None,
+        metadata={"document_id": document.id, "span": None if whole else [body.start or 0, body.end or len(document.text)]}
+    )
+
+@router.delete("/documents/{document_id}")
+async def remove_document(request: Request, document_id: str, token: Optional[str] = Query(None)):
+    """Borra el documento (y su context cache en Gemini) antes de que venza"""
+    client_ip = request.client.host if request.client else None
+    try:
+        delete_document(document_id, usage_key(token_subject(token), client_ip))
+    except DocumentNotFoundError:
+        raise document_not_found(document_id)
+    return {"success": True, "document_id": document_id}
+
+def find_document(document_id: str, owner: Optional[str]) -> Document:
+    try:
+        return get_document(document_id, owner)
+    except DocumentNotFoundError:
+        raise document_not_found(document_id)
+
+def document_not_found(document_id: str) -> HTTPException:
+    return HTTPException(
+        status_code=404,
+        detail={
+            "success": False,
+            "error": "Documento no encontrado o vencido. Regístrelo de nuevo.",
+            "error_type": "document_not_found",
+            "document_id": document_id
+        }
+    )
+
+@router.post("/prefetch", status_code=202, openapi_extra={
+    "requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": AIPrefetchRequest.model_json_schema()}}
+    }
+})
+async def prefetch_selection(request: Request):
+    """
+    Hint de la extensión al cambiar la selección: calcula de antemano las
+    acciones probables (summarize por defecto) solo si Gemini tiene
+    capacidad ociosa. El click posterior sale del cache o se une al
+    prefetch en curso. Una selección nueva cancela el prefetch anterior.
+    """
+    data = parse_body(AIPrefetchRequest, await read_json_body(request, settings.ai_max_body_bytes))
+    client_ip = request.client.host if request.client else None
+    outcomes = prefetch(usage_key(token_subject(data.token), client_ip), data.userText.strip(), data.actions, data.language, client_ip)
+    return {"success": True, "prefetch": outcomes}
+
+@router.delete("/prefetch")
+async def cancel_prefetch(request: Request, token: Optional[str] = Query(None)):
+    """Cancela el prefetch en curso del usuario (ej. se deseleccionó el texto)"""
+    client_ip = request.client.host if request.client else None
+    return {"success": True, "cancelled": prefetcher.cancel_owner(usage_key(token_subject(token), client_ip))}
+
+@router.post("/batch")
+async def process_ai_batch_request(request: Request, batch: AIBatchRequest, token: Optional[str] = Query(None)):
+    """
+    Varias acciones sobre el mismo texto en un solo request.
+    `actions` es una lista ordenada; un paso con `input` usa como texto el
+    resultado de otro paso (ej. traducir el resumen). El texto se normaliza
+    y valida una sola vez.
+    """
+    logger.info(
+        f"Procesando batch de IA: {[s.action for s in batch.actions]}, caracteres: {len(batch.text)}",
+        extra={"actions": [s.action for s in batch.actions], "chars": len(batch.text)}
+    )
+    client_ip = request.client.host if request.client else None
+    subject = token_subject(token)
+    budget_key = usage_key(subject, client_ip)
+    try:
+        reservation = usage_ledger.reserve(
+            budget_key, sum(estimate_cost(step.action, len(batch.text)) for step in batch.actions)
+        )
+    except AIError as e:
+        raise ai_http_error(e, "batch", budget_headers(usage_ledger.snapshot(budget_key)))
+    try:
+        with span("ai.batch", steps=len(batch.actions)):
+            outcomes = await process_ai_batch(batch, client_ip, reservation, subject is not None)
+    finally:
+        usage_ledger.settle(reservation)
+    headers = budget_headers(usage_ledger.snapshot(budget_key))
+    
+    results = []
+    for step, outcome in outcomes:
+        entry = {"id": step.id, "action": step.action, "success": not isinstance(outcome, Exception)}
+        if entry["success"]:
+            entry["result"] = outcome
+        else:
+            entry.update(step_error(outcome))
+        results.append(entry)
+    
+    # Si no salió ningún paso, se responde con el status del primer error (503, 429, ...)
+    if not any(r["success"] for r in results):
+        first_error = outcomes[0][1]
+        if isinstance(first_error, AIError):
+            raise ai_http_error(first_error, "batch", headers)
+    
+    return FastJSONResponse({
+        "success": any(r["success"] for r in results),
+        "results": results,
+        "metadata": {
+            "chars_processed": len(batch.text),
+            "steps": len(results)
+        }
+    }, headers=headers)
+
+def step_error(e: Exception) -> dict:
+    """Error de un paso del batch en el mismo formato que ai_http_error"""
+    kind = getattr(e, "kind", "other")
+    if not isinstance(e, AIError) and kind == "other":
+        logger.error(f"Error en paso de batch: {str(e)}", exc_info=e)
+    expose = settings.debug or kind != "other"
+    return {
+        "error": str(e) if expose else "Error en procesamiento",
+        "error_type": kind
+    }
+
+@router.get("/xray/stream")
+async def stream_xray_analysis(
+    request: Request,
+    userText: str = Query(..., description="Texto a analizar"),
+    user_id: Optional[str] = Query(None, description="ID del usuario para tracking"),
+    token: Optional[str] = Query(None, description="Token de autenticación (opcional, sube la prioridad)")
+):
+    """
+    Análisis X-ray en NDJSON: una línea por sección (grammar_errors,
+    style_errors, ...) en cuanto el modelo la completa y una línea final
+    `done` con el análisis validado
+    """
+    text = userText.strip()
+    client_ip = request.client.host if request.client else None
+    subject = token_subject(token)
+    budget_key = usage_key(subject, client_ip)
+    
+    # El primer evento se espera antes de responder: presupuesto agotado,
+    # breaker abierto, quota, etc. todavía pueden salir como status HTTP normal
+    reservation = None
+    streaming = False
+    try:
+        reservation = usage_ledger.reserve(budget_key, estimate_cost("xray", len(text)))
+        events = stream_xray({
+            "action": "xray",
+            "text": text,
+            "user_id": user_id,
+            "client_ip": client_ip,
+            "reservation": reservation,
+            "priority": priority_class(len(text), subject is not None)
+        })
+        first = await events.__anext__()
+        streaming = True
+    except AIError as e:
+        if reservation is not None:
+            usage_ledger.settle(reservation)
+        logger.warning(f"Error de IA ({e.kind}): {str(e)}", extra={"action": "xray", "error_type": e.kind})
+        raise ai_http_error(e, "xray", budget_headers(usage_ledger.snapshot(budget_key)))
+    finally:
+        # Cualquier otra falla antes del stream también devuelve la reserva
+        if reservation is not None and not streaming:
+            usage_ledger.settle(reservation)
+    
+    async def ndjson():
+        yield dumps(first) + b"\n"
+        try:
+            async for event in events:
+                yield dumps(event) + b"\n"
+        except AIError as e:
+            logger.warning(f"Error de IA en stream ({e.kind}): {str(e)}", extra={"action": "xray", "error_type": e.kind})
+            yield dumps({
+                "type": "error",
+                "error": str(e) if settings.debug or e.kind != "other" else "Error en procesamiento",
+                "error_type": e.kind
+            }) + b"\n"
+        finally:
+            usage_ledger.settle(reservation)
+    
+    return StreamingResponse(
+        ndjson(),
+        media_type="application/x-ndjson",
+        headers=budget_headers(usage_ledger.snapshot(budget_key))
+    )
+
+@router.websocket("/ws")
+async def ai_channel(
+    websocket: WebSocket,
+    token: Optional[str] = Query(None, description="Token (o mandarlo en el primer mensaje `auth`)")
+):
+    """
+    Canal persistente para la extensión: autentica una vez y multiplexa
+    requests de IA por id con streaming, cancelación y heartbeats.
+    Protocolo en app/services/ai_channel.py.
+    """
+    await AIChannel(websocket).run(token)
+
+def ai_http_error(e: AIError, action: str, headers: Optional[dict] = None) -> HTTPException:
+    """Traduce un AIError tipado a la respuesta HTTP (503 + Retry-After con el circuito abierto)"""
+    # Los mensajes de quota/safety/timeout/circuito/presupuesto son seguros para el usuario
+    expose = settings.debug or e.kind != "other"
+    headers = dict(headers or {})
+    if e.retry_after:
+        headers["Retry-After"] = str(e.retry_after)
+    return HTTPException(
+        status_code=e.status_code,
+        detail={
+            "success": False,
+            "error": str(e) if expose else "Error en procesamiento",
+            "error_type": e.kind,
+            "action": action
+        },
+        headers=headers or None
+    )
+
+@router.get("/status")
+async def get_ai_status():
+    """
+    Estado del circuit breaker de Gemini, p95 observado por acción y
+    tasas de aciertos de la memoria de traducción y del cache de resultados
     """
-    from app.core.constants import AI_ACTIONS, REWRITE_TONES
     return {
-        "actions": list(AI_ACTIONS.values()),
-        "rewrite_tones": REWRITE_TONES,
-        "supported_languages": ["es", "en", "fr", "de", "it", "pt"]
+        "circuit_breaker": gemini_breaker.snapshot(),
+        "hedging_enabled": settings.ai_hedging_enabled,
+        "translation_memory": translation_memory.stats(),
+        "result_cache": result_cache.stats(),
+        "scheduler": ai_scheduler.snapshot(),
+        "documents": document_store.stats(),
+        "prefetch": prefetcher.stats(),
+        "p95_seconds": {
+            action: latencies.percentile(action, 0.95) for action in AI_ACTIONS
+        }
     }
 
+@router.get("/actions")
+async def get_available_actions(request: Request):
+    """
+    Devuelve las acciones disponibles para la extensión (cacheable, 304 con ETag)
+    """
+    return ACTIONS_CATALOG.response(request)
+
 @router.get("/test")
 async def test_ai():
     """Endpoint de prueba para IA"""
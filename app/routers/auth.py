@@ -12,8 +12,12 @@ from app.schemas.auth import (
     PublicConfig
 )
 from app.services.auth_service import auth_service
+from app.db import DatabaseError, db_manager, deadline_budget
 from app.core.constants import SUPPORTED_LANGUAGES, INTEREST_REASONS, REWRITE_TONES
 from app.core.config import settings
+from app.core.security import security
+from app.core.tracing import span
+from app.core.responses import FastJSONResponse, StaticJSON
 import logging
 
 logger = logging.getLogger(__name__)
@@ -22,6 +26,19 @@ router = APIRouter(tags=["auth"])
 # Rate Limiter
 limiter = Limiter(key_func=get_remote_address)
 
+def database_unavailable(e: DatabaseError, context: str) -> HTTPException:
+    """503 + Retry-After cuando Supabase falla tras reintentos o sin presupuesto"""
+    logger.error(f"Error de base de datos en {context}: {e!r}")
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail={
+            "success": False,
+            "message": "Servicio temporalmente no disponible",
+            "error": str(e) if settings.debug else "database_unavailable"
+        },
+        headers={"Retry-After": "5"}
+    )
+
 @router.post("/waitlist/join", 
              response_model=WaitlistUserResponse,
              status_code=status.HTTP_201_CREATED)
@@ -31,7 +48,8 @@ async def join_waitlist(request: Request, user_data: WaitlistUserCreate):
     Únete a la waitlist de Cliro Notes
     """
     try:
-        result = await auth_service.join_waitlist(user_data)
+        with span("waitlist.join"), deadline_budget():
+            result = await auth_service.join_waitlist(user_data)
         
         status_code = status.HTTP_201_CREATED if result["success"] else status.HTTP_200_OK
         return JSONResponse(
@@ -39,6 +57,8 @@ async def join_waitlist(request: Request, user_data: WaitlistUserCreate):
             status_code=status_code
         )
         
+    except DatabaseError as e:
+        raise database_unavailable(e, "/waitlist/join")
     except Exception as e:
         logger.error(f"Error en /waitlist/join: {str(e)}", exc_info=True)
         raise HTTPException(
@@ -56,8 +76,12 @@ async def get_waitlist_stats():
     Estadísticas públicas de la waitlist
     """
     try:
-        stats = await auth_service.get_waitlist_stats()
-        return stats
+        with span("waitlist.stats"), deadline_budget():
+            stats = await auth_service.get_waitlist_stats()
+        # El servicio ya arma el dict con la forma de WaitlistStats: sin re-validar
+        return FastJSONResponse(stats)
+    except DatabaseError as e:
+        raise database_unavailable(e, "/waitlist/stats")
     except Exception as e:
         logger.error(f"Error obteniendo stats: {e}")
         raise HTTPException(
@@ -71,22 +95,27 @@ async def check_email_exists(email: str):
     Verifica si un email está registrado
     """
     try:
-        from app.core.security import security
         # Validar formato primero
-        if not security.validate_email(email):
+        with span("waitlist.validate_email"):
+            is_valid = security.validate_email(email)
+        if not is_valid:
             return {
                 "exists": False,
                 "valid": False,
                 "message": "Formato de email inválido"
             }
         
-        user = await auth_service.get_user_by_email(email)
+        with deadline_budget():
+            user = await auth_service.get_user_by_email(email)
+            position = await auth_service.calculate_waitlist_position(user["id"]) if user else None
         return {
             "exists": user is not None,
             "valid": True,
             "message": "Email ya registrado" if user else "Email disponible",
-            "position": await auth_service.calculate_waitlist_position(user["id"]) if user else None
+            "position": position
         }
+    except DatabaseError as e:
+        raise database_unavailable(e, "/waitlist/check-email")
     except Exception as e:
         logger.error(f"Error verificando email: {e}")
         raise HTTPException(
@@ -94,32 +123,36 @@ async def check_email_exists(email: str):
             detail="Error verificando email"
         )
 
+# Configuración pública: se valida contra PublicConfig y se serializa una vez
+PUBLIC_CONFIG = StaticJSON(PublicConfig(
+    supported_languages=[
+        {"code": lang, "name": SUPPORTED_LANGUAGES[lang]["name"]}
+        for lang in SUPPORTED_LANGUAGES
+    ],
+    interest_reasons=INTEREST_REASONS,
+    rewrite_tones=REWRITE_TONES,
+    max_languages=settings.max_languages_per_user,
+    version=settings.app_version
+).model_dump())
+
 @router.get("/config/public", response_model=PublicConfig)
-async def get_public_config():
+async def get_public_config(request: Request):
     """
-    Configuración pública para frontend
+    Configuración pública para frontend (cacheable, 304 con ETag)
     """
-    return {
-        "supported_languages": [
-            {"code": lang, "name": SUPPORTED_LANGUAGES[lang]["name"]}
-            for lang in SUPPORTED_LANGUAGES
-        ],
-        "interest_reasons": INTEREST_REASONS,
-        "rewrite_tones": REWRITE_TONES,
-        "max_languages": settings.max_languages_per_user,
-        "version": settings.app_version
-    }
+    return PUBLIC_CONFIG.response(request)
 
 @router.get("/health/db")
 async def database_health():
     """
     Health check específico para base de datos
     """
-    from app.db import db_manager
     try:
         is_healthy = db_manager.test_connection()
         return {
             "database": "healthy" if is_healthy else "unhealthy",
+            # Requests, errores, fallbacks y latencia por endpoint (primario / réplica)
+            **db_manager.stats(),
             "timestamp": datetime.utcnow().isoformat()
         }
     except Exception as e:
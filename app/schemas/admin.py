@@ -0,0 +1,7 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+
+class ProfilingWindowRequest(BaseModel):
+    """Ventana de profiling de todo el proceso"""
+    seconds: float = Field(10.0, gt=0, description="Duración de la ventana (tope: profiling_max_seconds)")
+    label: Optional[str] = Field(None, max_length=100, description="Etiqueta para identificar el perfil")
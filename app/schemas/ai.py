@@ -0,0 +1,121 @@
+from pydantic import AfterValidator, BaseModel, Field, field_validator
+from typing import Annotated, List, Optional
+from app.core.constants import ACTION_ALIASES
+
+def _canonical_action(value: str) -> str:
+    """Acepta alias en español y devuelve el id canónico"""
+    action = ACTION_ALIASES.get(value.strip().lower())
+    if action is None:
+        raise ValueError(f"Acción inválida: {value}")
+    return action
+
+def _strip_text(value: str) -> str:
+    value = value.strip()
+    if not value:
+        raise ValueError("El texto no puede estar vacío")
+    return value
+
+# Acción de IA ya normalizada (alias → id canónico)
+ActionId = Annotated[str, AfterValidator(_canonical_action)]
+
+class XRayIssue(BaseModel):
+    """Error puntual detectado en el texto"""
+    original: str = Field(..., description="Fragmento del texto con el error")
+    correction: str = Field(..., description="Fragmento corregido")
+    explanation: str = Field(..., description="Por qué es un error")
+
+class VocabularySuggestion(BaseModel):
+    """Palabra que admite una alternativa más precisa"""
+    word: str = Field(..., description="Palabra original")
+    alternatives: List[str] = Field(..., description="Alternativas más precisas")
+    reason: str = Field(..., description="Motivo del cambio")
+
+class XRayAnalysis(BaseModel):
+    """
+    Análisis X-ray. Se pasa como `response_schema` a Gemini, así que el orden
+    de los campos es el orden en que el modelo genera (y se streamean) las secciones.
+    """
+    grammar_errors: List[XRayIssue] = Field(default_factory=list)
+    style_errors: List[XRayIssue] = Field(default_factory=list)
+    vocabulary_suggestions: List[VocabularySuggestion] = Field(default_factory=list)
+    overall_score: int = Field(..., ge=1, le=10, description="Puntuación general de 1 a 10")
+    improvement_suggestions: List[str] = Field(default_factory=list)
+
+# Secciones del análisis en orden de generación
+XRAY_SECTIONS = tuple(XRayAnalysis.model_fields)
+
+class AIProcessRequest(BaseModel):
+    """Body de POST /api/ai/: mismos campos que los query params del GET"""
+    action: str
+    userText: str
+    payload: Optional[str] = Field(None, description="Parámetros adicionales")
+    tone: Optional[str] = Field(None, description="Tono para rewrite: formal, concise, casual, texto")
+    language: Optional[str] = Field(None, description="Idioma para traducción: es, en, fr, de, it, pt")
+    user_id: Optional[str] = None
+    token: Optional[str] = Field(None, description="Token de autenticación (opcional, sube la prioridad)")
+
+class AIDocumentCreate(BaseModel):
+    """Registro de un documento para sesiones multi-acción"""
+    text: str = Field(..., min_length=1)
+    user_id: Optional[str] = None
+    token: Optional[str] = Field(None, description="Token de autenticación (el documento queda a nombre de su `sub`)")
+
+class AIDocumentAction(BaseModel):
+    """Acción sobre un documento registrado, opcionalmente sobre el fragmento [start, end)"""
+    action: str
+    payload: Optional[str] = Field(None, description="Parámetros adicionales")
+    tone: Optional[str] = Field(None, description="Tono para rewrite: formal, concise, casual, texto")
+    language: Optional[str] = Field(None, description="Idioma para traducción: es, en, fr, de, it, pt")
+    start: Optional[int] = Field(None, ge=0, description="Inicio del fragmento (caracteres)")
+    end: Optional[int] = Field(None, ge=1, description="Fin del fragmento, exclusivo")
+    user_id: Optional[str] = None
+    token: Optional[str] = Field(None, description="Token de autenticación (opcional, sube la prioridad)")
+
+class AIChannelRequest(BaseModel):
+    """Mensaje `request` del WebSocket /api/ai/ws"""
+    id: str = Field(..., min_length=1, max_length=64, description="Id del request dentro de la conexión")
+    action: ActionId
+    userText: str = Field(..., min_length=1)
+    payload: Optional[str] = Field(None, description="Parámetros adicionales")
+    tone: Optional[str] = Field(None, description="Tono para rewrite: formal, concise, casual, texto")
+    language: Optional[str] = Field(None, description="Idioma para traducción: es, en, fr, de, it, pt")
+    group: Optional[str] = Field(None, description="Un request nuevo del mismo grupo cancela al anterior en curso")
+
+class AIPrefetchRequest(BaseModel):
+    """Selección recién hecha: el servidor calcula de antemano las acciones probables"""
+    userText: str = Field(..., min_length=1)
+    actions: Optional[List[ActionId]] = Field(None, min_length=1, max_length=3, description="Por defecto, summarize")
+    language: Optional[str] = Field(None, description="Idioma destino si se incluye translate")
+    user_id: Optional[str] = None
+    token: Optional[str] = Field(None, description="Token de autenticación (límites por usuario según su `sub`)")
+
+class AIActionStep(BaseModel):
+    """Una acción dentro de un request multi-acción"""
+    action: ActionId
+    payload: Optional[str] = Field(None, description="Tono o idioma según la acción")
+    id: Optional[str] = Field(None, description="Identificador del paso (por defecto, la acción)")
+    input: Optional[str] = Field(None, description="id de un paso anterior cuyo resultado es la entrada")
+
+class AIBatchRequest(BaseModel):
+    """Varias acciones sobre el mismo texto en un solo request"""
+    text: Annotated[str, Field(min_length=1), AfterValidator(_strip_text)]
+    actions: List[AIActionStep] = Field(..., min_length=1, max_length=5)
+    user_id: Optional[str] = None
+    
+    @field_validator('actions')
+    @classmethod
+    def validate_pipeline(cls, v):
+        """ids únicos y cada `input` apunta a un paso anterior que produce texto"""
+        seen = {}
+        for step in v:
+            step.id = step.id or step.action
+            if step.id in seen:
+                raise ValueError(f"id de paso duplicado: {step.id}")
+            if step.input is not None:
+                source = seen.get(step.input)
+                if source is None:
+                    raise ValueError(f"El paso '{step.id}' depende de '{step.input}', que no es un paso anterior")
+                if source.action == "xray":
+                    raise ValueError("El resultado de xray no puede usarse como entrada de otro paso")
+            seen[step.id] = step
+        return v
@@ -0,0 +1,293 @@
+"""
+Canal WebSocket persistente para la extensión.
+
+Se autentica una sola vez (token del SecurityService en el query string o en
+el primer mensaje) y después multiplexa requests de IA por `id` sobre la
+misma conexión, sin handshake TLS ni preflight CORS por acción.
+
+Mensajes del cliente (JSON, uno por frame):
+    {"type": "auth", "token"}
+    {"type": "request", "id", "action", "userText", "payload"?, "tone"?, "language"?, "group"?}
+    {"type": "cancel", "id"}
+    {"type": "ping"} / {"type": "pong"}
+
+Mensajes del servidor (todos con el `id` del request al que responden):
+    {"type": "ready", "heartbeat_seconds", "max_inflight"}
+    {"id", "type": "delta", "text"}            fragmento generado
+    {"id", "type": "section", "name", "data"}  sección de xray
+    {"id", "type": "done", "result", "cached", "metadata"}
+    {"id", "type": "error", "error", "error_type", "retry_after"?}
+    {"id", "type": "cancelled", "reason"}      client | superseded
+    {"type": "ping"} / {"type": "pong"}
+
+Un request con `group` cancela al anterior del mismo grupo que siga en curso
+(el usuario cambió la selección). El servidor manda un ping cada
+`ai_ws_heartbeat_seconds` y cierra la conexión si el cliente no manda nada
+en tres intervalos.
+"""
+import asyncio
+import json
+import logging
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+
+from app.core.config import settings
+from app.core import metrics
+from app.core.responses import dumps
+from app.core.security import security
+from app.schemas.ai import AIChannelRequest
+from app.services.ai_resilience import AIError
+from app.services.ai_scheduler import priority_class
+from app.services.ai_service import detected_language, stream_ai_action
+from app.services.usage_ledger import budget_headers, estimate_cost, usage_key, usage_ledger
+
+# Intentar importar orjson, con fallback
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+logger = logging.getLogger(__name__)
+
+# Códigos de cierre (rango 4000-4999 reservado para la aplicación)
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_IDLE = 4408
+
+
+class AIChannel:
+    """Una conexión WebSocket autenticada con sus requests en curso"""
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.client_ip = websocket.client.host if websocket.client else None
+        self.claims: Dict[str, Any] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._groups: Dict[str, str] = {}
+        self._send_lock = asyncio.Lock()
+
+    @property
+    def user_id(self) -> Optional[str]:
+        return self.claims.get("sub") or self.claims.get("user_id")
+
+    # ---- ciclo de vida ----
+
+    async def run(self, token: Optional[str]):
+        """Autentica y atiende la conexión hasta que se cierre"""
+        if token and not self._authenticate(token):
+            # Antes del accept: el handshake termina en 403
+            await self.websocket.close(code=CLOSE_UNAUTHORIZED)
+            return
+        await self.websocket.accept()
+        if not token and not await self._await_auth():
+            await self.websocket.close(code=CLOSE_UNAUTHORIZED)
+            return
+
+        metrics.AI_WS_CONNECTIONS.inc()
+        heartbeat = asyncio.create_task(self._heartbeat())
+        try:
+            await self.send({
+                "type": "ready",
+                "heartbeat_seconds": settings.ai_ws_heartbeat_seconds,
+                "max_inflight": settings.ai_ws_max_inflight
+            })
+            await self._receive_loop()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            # Sin esperar: cada request libera su lugar y su reserva al cancelarse
+            heartbeat.cancel()
+            for task in list(self._tasks.values()):
+                task.cancel("disconnect")
+            metrics.AI_WS_CONNECTIONS.dec()
+
+    def _authenticate(self, token: str) -> bool:
+        try:
+            self.claims = security.verify_token(token)
+            return True
+        except HTTPException:
+            return False
+
+    async def _await_auth(self) -> bool:
+        """Primer mensaje: {"type": "auth", "token"} dentro de ai_ws_auth_timeout_seconds"""
+        try:
+            message = await asyncio.wait_for(
+                self.websocket.receive_json(), settings.ai_ws_auth_timeout_seconds
+            )
+        except (asyncio.TimeoutError, ValueError, WebSocketDisconnect):
+            return False
+        return (
+            isinstance(message, dict)
+            and message.get("type") == "auth"
+            and self._authenticate(message.get("token") or "")
+        )
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(settings.ai_ws_heartbeat_seconds)
+            try:
+                await self.send({"type": "ping"})
+            except (WebSocketDisconnect, RuntimeError):
+                # El otro extremo ya se fue: el receive loop cierra la conexión
+                return
+
+    async def _receive_loop(self):
+        idle_timeout = settings.ai_ws_heartbeat_seconds * 3
+        while True:
+            try:
+                raw = await asyncio.wait_for(self.websocket.receive_text(), idle_timeout)
+            except asyncio.TimeoutError:
+                await self.websocket.close(code=CLOSE_IDLE)
+                return
+            try:
+                message = self._parse(raw)
+            except ValueError:
+                await self.send({"type": "error", "error": "Mensaje JSON inválido", "error_type": "invalid_message"})
+                continue
+            await self._handle(message)
+
+    @staticmethod
+    def _parse(raw: str) -> Dict[str, Any]:
+        message = orjson.loads(raw) if HAS_ORJSON else json.loads(raw)
+        if not isinstance(message, dict):
+            raise ValueError("se esperaba un objeto")
+        return message
+
+    # ---- mensajes ----
+
+    async def send(self, message: Dict[str, Any]):
+        # Varios requests escriben en la misma conexión
+        async with self._send_lock:
+            await self.websocket.send_text(dumps(message).decode("utf-8"))
+
+    async def _handle(self, message: Dict[str, Any]):
+        kind = message.get("type")
+        if kind == "ping":
+            await self.send({"type": "pong"})
+        elif kind == "pong":
+            pass
+        elif kind == "cancel":
+            self._cancel(str(message.get("id")), "client")
+        elif kind == "request":
+            await self._start(message)
+        else:
+            await self.send({
+                "id": message.get("id"),
+                "type": "error",
+                "error": f"Tipo de mensaje desconocido: {kind}",
+                "error_type": "invalid_message"
+            })
+
+    async def _start(self, message: Dict[str, Any]):
+        try:
+            request = AIChannelRequest.model_validate(message)
+        except ValidationError as e:
+            await self.send({
+                "id": message.get("id"),
+                "type": "error",
+                "error": "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()),
+                "error_type": "validation"
+            })
+            return
+        if request.id in self._tasks:
+            await self._reject(request.id, "Ya hay un request en curso con ese id", "duplicate_id")
+            return
+        if len(request.userText) > settings.ai_max_body_bytes:
+            await self._reject(request.id, f"El texto excede el máximo de {settings.ai_max_body_bytes} caracteres", "too_large")
+            return
+
+        if request.group is not None:
+            previous = self._groups.get(request.group)
+            if previous is not None:
+                self._cancel(previous, "superseded")
+            self._groups[request.group] = request.id
+        # Los cancelados (ej. el recién reemplazado) ya no cuentan
+        if sum(1 for task in self._tasks.values() if not task.cancelling()) >= settings.ai_ws_max_inflight:
+            await self._reject(request.id, "Demasiados requests en curso en esta conexión", "too_many_requests")
+            return
+
+        task = asyncio.create_task(self._run_request(request))
+        self._tasks[request.id] = task
+        task.add_done_callback(lambda _: self._forget(request))
+
+    async def _reject(self, request_id: str, error: str, error_type: str):
+        metrics.AI_WS_REQUESTS.labels("error").inc()
+        await self.send({"id": request_id, "type": "error", "error": error, "error_type": error_type})
+
+    def _forget(self, request: AIChannelRequest):
+        self._tasks.pop(request.id, None)
+        if request.group is not None and self._groups.get(request.group) == request.id:
+            del self._groups[request.group]
+
+    def _cancel(self, request_id: str, reason: str):
+        task = self._tasks.get(request_id)
+        if task is not None and not task.done():
+            task.cancel(reason)
+
+    # ---- ejecución ----
+
+    async def _run_request(self, request: AIChannelRequest):
+        text = request.userText.strip()
+        budget_key = usage_key(self.user_id, self.client_ip)
+        ai_request = {
+            "action": request.action,
+            "text": text,
+            "payload": request.payload or request.tone or request.language,
+            "user_id": self.user_id,
+            "client_ip": self.client_ip,
+            "priority": priority_class(len(text), verified=True)
+        }
+        reservation = None
+        try:
+            reservation = usage_ledger.reserve(budget_key, estimate_cost(request.action, len(text)))
+            ai_request["reservation"] = reservation
+            async for event in stream_ai_action(ai_request):
+                if event["type"] == "done":
+                    detected = detected_language(ai_request)
+                    event = {**event, "metadata": {
+                        "chars_processed": len(text),
+                        "action_type": request.action,
+                        "language": request.language or detected or "auto",
+                        "source_language": detected,
+                        "translation_skipped": ai_request.get("translation_skipped", False),
+                        "budget": budget_headers(usage_ledger.snapshot(budget_key))
+                    }}
+                await self.send({"id": request.id, **event})
+            metrics.AI_WS_REQUESTS.labels("done").inc()
+        except asyncio.CancelledError as e:
+            reason = e.args[0] if e.args else "client"
+            metrics.AI_WS_REQUESTS.labels("superseded" if reason == "superseded" else "cancelled").inc()
+            if reason in ("client", "superseded"):
+                await self._send_quietly({"id": request.id, "type": "cancelled", "reason": reason})
+            raise
+        except AIError as e:
+            metrics.AI_WS_REQUESTS.labels("error").inc()
+            logger.warning(f"Error de IA por WebSocket ({e.kind}): {str(e)}", extra={"action": request.action, "error_type": e.kind})
+            await self._send_quietly({
+                "id": request.id,
+                "type": "error",
+                "error": str(e) if settings.debug or e.kind != "other" else "Error en procesamiento",
+                "error_type": e.kind,
+                "retry_after": e.retry_after
+            })
+        except Exception as e:
+            metrics.AI_WS_REQUESTS.labels("error").inc()
+            logger.error(f"Error en request por WebSocket: {str(e)}", exc_info=True)
+            await self._send_quietly({
+                "id": request.id,
+                "type": "error",
+                "error": str(e) if settings.debug else "Error en procesamiento",
+                "error_type": "other"
+            })
+        finally:
+            if reservation is not None:
+                usage_ledger.settle(reservation)
+
+    async def _send_quietly(self, message: Dict[str, Any]):
+        """Envía ignorando una conexión ya cerrada"""
+        try:
+            await self.send(message)
+        except (WebSocketDisconnect, RuntimeError):
+            pass
@@ -0,0 +1,330 @@
+"""
+Capa de resiliencia para las llamadas a Gemini.
+
+- Deadline por acción (asyncio.wait_for sobre el cliente async)
+- Errores tipados en lugar de comparar substrings de str(e)
+- Circuit breaker: con upstream degradado se falla rápido con 503 + Retry-After
+- Hedging opcional: segunda request tras el p95 observado de la acción
+- stream_model: breaker y deadline sobre respuestas en streaming (sin hedging)
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional
+
+from google.genai import errors as genai_errors
+
+from app.core.config import settings
+from app.core import metrics
+
+
+# =========================
+# Errores tipados
+# =========================
+
+class AIError(Exception):
+    """Error base de acciones de IA"""
+    kind = "other"
+    status_code = 500
+    # Si cuenta como falla del upstream para el circuit breaker
+    trips_breaker = True
+
+    def __init__(self, message: str, retry_after: Optional[int] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AIQuotaError(AIError):
+    kind = "quota"
+    status_code = 429
+
+    def __init__(self, message: str = "Límite de uso excedido. Por favor, intente más tarde.", retry_after: Optional[int] = 60):
+        super().__init__(message, retry_after)
+
+
+class AISafetyError(AIError):
+    kind = "safety"
+    status_code = 422
+    trips_breaker = False
+
+    def __init__(self, message: str = "El contenido no pudo ser procesado por políticas de seguridad.", retry_after: Optional[int] = None):
+        super().__init__(message, retry_after)
+
+
+class AITimeoutError(AIError):
+    kind = "timeout"
+    status_code = 504
+
+    def __init__(self, message: str = "El servicio de IA tardó demasiado en responder.", retry_after: Optional[int] = None):
+        super().__init__(message, retry_after)
+
+
+class AIUpstreamError(AIError):
+    kind = "other"
+    status_code = 502
+
+
+class AIBadRequestError(AIError):
+    kind = "other"
+    status_code = 400
+    trips_breaker = False
+
+
+class AICircuitOpenError(AIError):
+    kind = "circuit_open"
+    status_code = 503
+    trips_breaker = False
+
+    def __init__(self, retry_after: int):
+        super().__init__("Servicio de IA temporalmente no disponible. Intente más tarde.", retry_after)
+
+
+def classify_error(exc: BaseException) -> AIError:
+    """Convierte excepciones del SDK de Gemini / asyncio en errores tipados"""
+    if isinstance(exc, AIError):
+        return exc
+    if isinstance(exc, asyncio.TimeoutError):
+        return AITimeoutError()
+    if isinstance(exc, genai_errors.APIError):
+        status = (exc.status or "").upper()
+        if exc.code == 429 or status == "RESOURCE_EXHAUSTED":
+            return AIQuotaError()
+        if "SAFETY" in str(exc.message or "").upper():
+            return AISafetyError()
+        if exc.code and 400 <= exc.code < 500:
+            return AIBadRequestError(f"Error en el procesamiento de IA: {exc.message}")
+        return AIUpstreamError(f"Error en el procesamiento de IA: {exc.message}")
+    # Último recurso para errores que no vienen del SDK (red, transporte)
+    message = str(exc).lower()
+    if "quota" in message:
+        return AIQuotaError()
+    if "safety" in message:
+        return AISafetyError()
+    return AIUpstreamError(f"Error en el procesamiento de IA: {exc}")
+
+
+def raise_for_blocked(response: Any):
+    """Gemini devuelve 200 sin texto cuando bloquea por seguridad"""
+    feedback = getattr(response, "prompt_feedback", None)
+    if feedback is not None and getattr(feedback, "block_reason", None):
+        raise AISafetyError()
+    for candidate in getattr(response, "candidates", None) or []:
+        reason = str(getattr(candidate, "finish_reason", "") or "")
+        if reason.endswith("SAFETY"):
+            raise AISafetyError()
+
+
+# =========================
+# Circuit breaker
+# =========================
+
+class CircuitBreaker:
+    """
+    Breaker de tres estados sobre fallas consecutivas.
+    closed → open tras `failure_threshold` fallas; open → half_open tras
+    `reset_timeout` segundos; en half_open una sola request de prueba decide.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    _STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.total_rejections = 0
+        self._probe_in_flight = False
+        self._set_state(self.CLOSED)
+
+    def _set_state(self, state: str):
+        self.state = state
+        metrics.CIRCUIT_STATE.labels(self.name).set(self._STATE_VALUES[state])
+
+    def retry_after(self) -> int:
+        remaining = self.reset_timeout - (time.monotonic() - self.opened_at)
+        return max(1, int(remaining + 0.999))
+
+    def before_call(self):
+        """Lanza AICircuitOpenError si no se permite la llamada"""
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self._reject()
+            self._set_state(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                self._reject()
+            self._probe_in_flight = True
+
+    def _reject(self):
+        self.total_rejections += 1
+        metrics.CIRCUIT_REJECTIONS.labels(self.name).inc()
+        raise AICircuitOpenError(self.retry_after())
+
+    def release_probe(self):
+        """Libera la request de prueba de half_open sin decidir el estado"""
+        self._probe_in_flight = False
+
+    def record_success(self):
+        self._probe_in_flight = False
+        self.consecutive_failures = 0
+        if self.state != self.CLOSED:
+            self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        self._probe_in_flight = False
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._set_state(self.OPEN)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "failure_threshold": self.failure_threshold,
+            "retry_after": self.retry_after() if self.state == self.OPEN else None,
+            "total_rejections": self.total_rejections,
+        }
+
+
+# =========================
+# Latencias y hedging
+# =========================
+
+class LatencyWindow:
+    """Ventana móvil de latencias exitosas por acción para estimar el p95"""
+
+    def __init__(self, size: int = 200):
+        self._samples: Dict[str, Deque[float]] = {}
+        self._size = size
+
+    def record(self, action: str, seconds: float):
+        samples = self._samples.get(action)
+        if samples is None:
+            samples = self._samples[action] = deque(maxlen=self._size)
+        samples.append(seconds)
+
+    def percentile(self, action: str, q: float) -> Optional[float]:
+        samples = self._samples.get(action)
+        if not samples or len(samples) < settings.ai_hedge_min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+gemini_breaker = CircuitBreaker(
+    "gemini",
+    failure_threshold=settings.ai_breaker_failure_threshold,
+    reset_timeout=settings.ai_breaker_reset_seconds,
+)
+latencies = LatencyWindow()
+
+
+async def _hedged(action: str, call: Callable[[], Awaitable[Any]]) -> Any:
+    """Lanza una segunda request si la primera supera el p95 y devuelve la primera exitosa"""
+    delay = latencies.percentile(action, 0.95) if settings.ai_hedging_enabled else None
+    if delay is None:
+        return await call()
+
+    primary = asyncio.ensure_future(call())
+    hedge = None
+    pending = {primary}
+    first_error: Optional[BaseException] = None
+    try:
+        # Si el deadline de call_model cancela mientras se espera, el finally
+        # cancela también la llamada primaria (no queda consumiendo cuota)
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if done:
+            return primary.result()
+
+        hedge = asyncio.ensure_future(call())
+        pending = {primary, hedge}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    metrics.AI_HEDGES.labels(action, "hedge" if task is hedge else "primary").inc()
+                    return task.result()
+                first_error = first_error or task.exception()
+        raise first_error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def action_deadline(action: str) -> float:
+    return settings.ai_action_deadlines.get(action, settings.ai_default_deadline_seconds)
+
+
+async def call_model(action: str, call: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Ejecuta `call` (una llamada al cliente async de Gemini) con breaker,
+    deadline por acción y hedging. Siempre lanza AIError tipados.
+    """
+    gemini_breaker.before_call()
+    start = time.monotonic()
+    try:
+        response = await asyncio.wait_for(_hedged(action, call), timeout=action_deadline(action))
+        raise_for_blocked(response)
+    except asyncio.CancelledError:
+        # El cliente canceló: no es falla del upstream
+        gemini_breaker.release_probe()
+        raise
+    except Exception as e:
+        error = classify_error(e)
+        if error.trips_breaker:
+            gemini_breaker.record_failure()
+        else:
+            gemini_breaker.record_success()
+        if error is e:
+            raise
+        raise error from e
+
+    gemini_breaker.record_success()
+    latencies.record(action, time.monotonic() - start)
+    return response
+
+
+async def stream_model(action: str, open_stream: Callable[[], Awaitable[AsyncIterator[Any]]]) -> AsyncIterator[Any]:
+    """
+    Variante streaming de call_model. El deadline de la acción cubre el stream
+    completo (se aplica chunk a chunk con el tiempo restante) y el breaker se
+    decide al terminar. No hay hedging: no se puede duplicar un stream a medias.
+    """
+    gemini_breaker.before_call()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + action_deadline(action)
+    stream = None
+    try:
+        stream = await asyncio.wait_for(open_stream(), timeout=action_deadline(action))
+        while True:
+            try:
+                chunk = await asyncio.wait_for(stream.__anext__(), timeout=max(0.0, deadline - loop.time()))
+            except StopAsyncIteration:
+                break
+            raise_for_blocked(chunk)
+            yield chunk
+    except (asyncio.CancelledError, GeneratorExit):
+        # El cliente canceló o dejó de leer: no es falla del upstream
+        gemini_breaker.release_probe()
+        raise
+    except Exception as e:
+        error = classify_error(e)
+        if error.trips_breaker:
+            gemini_breaker.record_failure()
+        else:
+            gemini_breaker.record_success()
+        if error is e:
+            raise
+        raise error from e
+    finally:
+        if stream is not None and hasattr(stream, "aclose"):
+            await stream.aclose()
+
+    gemini_breaker.record_success()
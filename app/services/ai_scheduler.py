@@ -0,0 +1,316 @@
+"""
+Control de admisión y scheduling por prioridad para el trabajo de IA.
+
+Un número acotado de acciones corre en paralelo (`limit`); el resto espera
+en una cola por clase de prioridad:
+
+    interactive > interactive_anon > bulk > bulk_anon > prefetch
+
+(textos cortos vs. largos/batch, token verificado vs. anónimo; prefetch es
+trabajo especulativo). Entre
+clases la prioridad es estricta; dentro de cada clase se atiende primero
+el deadline más cercano (EDF). Si la espera estimada no entra en el
+deadline de la acción, o la cola está llena, se rechaza al instante con
+503 + Retry-After en lugar de encolar trabajo que va a vencer. Con la cola
+llena, un request de mayor prioridad desaloja al de menor prioridad y
+deadline más lejano.
+
+El límite de concurrencia puede ser adaptativo (AIMDLimit): sube de a uno
+mientras Gemini responde bien con la ventana en uso y baja
+multiplicativamente ante quota/timeout o latencia muy por encima de la
+habitual de la acción.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from app.core.config import settings
+from app.core import metrics
+from app.services.ai_resilience import AIError
+
+PRIORITY_CLASSES = ("interactive", "interactive_anon", "bulk", "bulk_anon", "prefetch")
+
+# Peso del último tiempo de servicio en la media móvil exponencial
+_EWMA_ALPHA = 0.2
+
+
+class AIOverloadedError(AIError):
+    """La espera estimada en cola excede el deadline de la acción"""
+    kind = "overloaded"
+    status_code = 503
+    trips_breaker = False
+
+    def __init__(self, retry_after: int):
+        super().__init__("Servicio de IA saturado. Intente más tarde.", retry_after)
+
+
+def priority_class(chars: int, verified: bool, bulk: bool = False) -> str:
+    """Clase de prioridad de un request según tamaño, tipo y autenticación"""
+    interactive = not bulk and chars <= settings.ai_interactive_max_chars
+    name = "interactive" if interactive else "bulk"
+    return name if verified else f"{name}_anon"
+
+
+class AIMDLimit:
+    """
+    Límite de concurrencia additive-increase / multiplicative-decrease
+    (como la ventana de TCP).
+    - Éxito con al menos la mitad del límite en uso: +1/limit (una ventana
+      completa de éxitos suma 1)
+    - Quota/timeout, o latencia > `latency_tolerance` x la base de la acción:
+      x `backoff`. Una sola vez por ventana: se ignoran los fallos de requests
+      que empezaron antes de la última reducción.
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        min_limit: int,
+        max_limit: int,
+        backoff: float = 0.7,
+        latency_tolerance: float = 2.0,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.decreases: Counter = Counter()
+        self._limit = float(initial)
+        self._baseline: Dict[str, float] = {}
+        self._last_decrease = 0.0
+        metrics.AI_CONCURRENCY_LIMIT.set(self.limit)
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def on_success(self, action: str, started: float, in_flight: int):
+        latency = time.monotonic() - started
+        baseline = self._baseline.get(action)
+        # Base lenta: sigue cambios sostenidos, no picos
+        self._baseline[action] = latency if baseline is None else baseline + 0.05 * (latency - baseline)
+        if baseline is not None and latency > baseline * self.latency_tolerance:
+            self.on_drop("latency", started)
+        elif in_flight * 2 >= self._limit:
+            self._set(min(self.max_limit, self._limit + 1 / self._limit))
+
+    def on_drop(self, reason: str, started: float):
+        if started < self._last_decrease:
+            return
+        self._last_decrease = time.monotonic()
+        self.decreases[reason] += 1
+        metrics.AI_CONCURRENCY_DECREASES.labels(reason).inc()
+        self._set(max(self.min_limit, self._limit * self.backoff))
+
+    def _set(self, value: float):
+        self._limit = value
+        metrics.AI_CONCURRENCY_LIMIT.set(self.limit)
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            "limit": self.limit,
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "decreases": dict(self.decreases),
+            "baseline_seconds": {a: round(b, 3) for a, b in self._baseline.items()},
+        }
+
+
+# Errores del upstream que indican saturación (bajan el límite)
+_DROP_KINDS = frozenset({"quota", "timeout"})
+
+
+@dataclass(order=True)
+class _Waiter:
+    deadline: float
+    seq: int
+    future: asyncio.Future = field(compare=False)
+    priority: str = field(compare=False)
+    enqueued: float = field(compare=False)
+
+
+class AIScheduler:
+    """Semáforo con colas de prioridad EDF y rechazo anticipado"""
+
+    def __init__(
+        self,
+        limit: int,
+        max_queue: int,
+        initial_service_seconds: float = 2.0,
+        limiter: Optional[AIMDLimit] = None,
+    ):
+        self._fixed_limit = limit
+        self.limiter = limiter
+        self.max_queue = max_queue
+        self.running = 0
+        self.service_ewma = initial_service_seconds
+        self.shed: Counter = Counter()
+        self._queues: Dict[str, List[_Waiter]] = {p: [] for p in PRIORITY_CLASSES}
+        self._seq = itertools.count()
+        # Se llama cuando un request real tiene que esperar (ej. cancelar prefetch)
+        self.on_pressure: Optional[Callable[[], None]] = None
+
+    # ---- estado ----
+
+    @property
+    def limit(self) -> int:
+        return self.limiter.limit if self.limiter else self._fixed_limit
+
+    def queued(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def _ahead_of(self, priority: str) -> int:
+        """Requests en cola que se atenderían antes que uno nuevo de `priority`"""
+        ahead = 0
+        for p in PRIORITY_CLASSES:
+            ahead += len(self._queues[p])
+            if p == priority:
+                break
+        return ahead
+
+    def has_spare(self, utilization: float) -> bool:
+        """Cola vacía y menos de `utilization` del límite en uso (capacidad ociosa)"""
+        return self.queued() == 0 and self.running < self.limit * utilization
+
+    def predicted_wait(self, priority: str) -> float:
+        """Espera estimada: rondas de servicio necesarias para llegar al frente"""
+        ahead = self._ahead_of(priority)
+        if self.running < self.limit and ahead == 0:
+            return 0.0
+        return (ahead + 1) / max(1, self.limit) * self.service_ewma
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            "limit": self.limit,
+            "running": self.running,
+            "queued": {p: len(q) for p, q in self._queues.items()},
+            "max_queue": self.max_queue,
+            "service_ewma_seconds": round(self.service_ewma, 3),
+            "shed": dict(self.shed),
+            "adaptive": self.limiter.snapshot() if self.limiter else None,
+        }
+
+    # ---- admisión ----
+
+    def _shed(self, priority: str, reason: str, wait: float):
+        self.shed[reason] += 1
+        metrics.AI_QUEUE_SHED.labels(priority, reason).inc()
+        raise AIOverloadedError(retry_after=max(1, math.ceil(wait)))
+
+    @asynccontextmanager
+    async def slot(self, priority: str, budget: float, action: str = "unknown"):
+        """
+        Reserva un lugar para ejecutar una acción con `budget` segundos de
+        deadline. Lanza AIOverloadedError si no llegaría a tiempo.
+        El resultado (latencia o error) alimenta al límite adaptativo.
+        """
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+
+        if self.running < self.limit and self._ahead_of(priority) == 0:
+            self.running += 1
+            metrics.AI_QUEUE_WAIT.labels(priority).observe(0.0)
+        else:
+            if priority != "prefetch" and self.on_pressure is not None:
+                self.on_pressure()
+            predicted = self.predicted_wait(priority)
+            if self.queued() >= self.max_queue and not self._evict_below(priority):
+                self._shed(priority, "queue_full", predicted)
+            if predicted + self.service_ewma > budget:
+                self._shed(priority, "deadline", predicted)
+            await self._wait_turn(loop, priority, now, budget, predicted)
+
+        start = loop.time()
+        started = time.monotonic()
+        try:
+            yield
+        except AIError as e:
+            if self.limiter and e.kind in _DROP_KINDS:
+                self.limiter.on_drop(e.kind, started)
+            raise
+        else:
+            if self.limiter:
+                self.limiter.on_success(action, started, self.running)
+        finally:
+            elapsed = loop.time() - start
+            self.service_ewma += _EWMA_ALPHA * (elapsed - self.service_ewma)
+            self._release()
+
+    async def _wait_turn(self, loop, priority: str, now: float, budget: float, predicted: float):
+        waiter = _Waiter(now + budget, next(self._seq), loop.create_future(), priority, now)
+        heapq.heappush(self._queues[priority], waiter)
+        metrics.AI_QUEUE_DEPTH.labels(priority).inc()
+        # Pasado este punto ya no queda tiempo para el servicio esperado
+        timeout = max(0.0, budget - self.service_ewma)
+        try:
+            await asyncio.wait_for(waiter.future, timeout)
+        except asyncio.TimeoutError:
+            self._forget(waiter)
+            self._shed(priority, "timeout", predicted)
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Se otorgó el lugar justo al cancelar: devolverlo
+                self._release()
+            else:
+                self._forget(waiter)
+            raise
+
+    def _evict_below(self, priority: str) -> bool:
+        """Rechaza al waiter de menor prioridad (y deadline más lejano) por debajo de `priority`"""
+        for lower in reversed(PRIORITY_CLASSES[PRIORITY_CLASSES.index(priority) + 1:]):
+            queue = self._queues[lower]
+            if queue:
+                victim = max(queue)
+                self._forget(victim)
+                self.shed["evicted"] += 1
+                metrics.AI_QUEUE_SHED.labels(lower, "evicted").inc()
+                victim.future.set_exception(AIOverloadedError(retry_after=max(1, math.ceil(self.predicted_wait(lower)))))
+                return True
+        return False
+
+    def _forget(self, waiter: _Waiter):
+        queue = self._queues[waiter.priority]
+        if waiter in queue:
+            queue.remove(waiter)
+            heapq.heapify(queue)
+            metrics.AI_QUEUE_DEPTH.labels(waiter.priority).dec()
+
+    def _release(self):
+        self.running -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """Otorga lugares libres: prioridad estricta entre clases, EDF dentro de cada una"""
+        loop_time = None
+        for priority in PRIORITY_CLASSES:
+            queue = self._queues[priority]
+            while queue and self.running < self.limit:
+                waiter = heapq.heappop(queue)
+                metrics.AI_QUEUE_DEPTH.labels(priority).dec()
+                if waiter.future.done():
+                    continue
+                self.running += 1
+                waiter.future.set_result(None)
+                loop_time = loop_time or waiter.future.get_loop().time()
+                metrics.AI_QUEUE_WAIT.labels(priority).observe(loop_time - waiter.enqueued)
+            if self.running >= self.limit:
+                return
+
+
+ai_scheduler = AIScheduler(
+    settings.ai_max_concurrency,
+    settings.ai_max_queue,
+    limiter=AIMDLimit(
+        initial=settings.ai_initial_concurrency,
+        min_limit=settings.ai_min_concurrency,
+        max_limit=settings.ai_max_concurrency,
+        backoff=settings.ai_limit_backoff,
+        latency_tolerance=settings.ai_limit_latency_tolerance,
+    ) if settings.ai_adaptive_concurrency else None,
+)
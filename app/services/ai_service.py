@@ -1,58 +1,618 @@
 import os
+import json
+import time
+import random
+import asyncio
+import logging
+from contextlib import contextmanager
 from google import genai
+from google.genai import types
+from pydantic import ValidationError
 from app.core.config import settings
-from typing import Dict, Any
+from app.core import metrics
+from app.core.tracing import span
+from app.core.constants import ACTION_ALIASES
+from app.schemas.ai import AIActionStep, AIBatchRequest, XRayAnalysis, XRAY_SECTIONS
+from app.services.ai_resilience import AIBadRequestError, AIError, AIUpstreamError, action_deadline, call_model, stream_model
+from app.services.ai_scheduler import ai_scheduler, priority_class
+from app.services.translation_memory import TranslationMemory, join_segments, split_segments
+from app.services.result_cache import ResultCache
+from app.services.document_store import Document, DocumentStore
+from app.services.language_detector import UNKNOWN, Detection, language_detector
+from app.services.prefetch import Prefetcher
+from app.services.usage_ledger import Reservation, estimate_tokens, usage_ledger
+from app.utils.json_stream import JsonSectionParser
+from typing import Dict, Any, AsyncIterator, List, Optional, Set, Tuple, Union
 
-client = genai.Client(api_key=settings.gemini_api_key)
+logger = logging.getLogger(__name__)
 
-async def process_ai_action(request: Dict[str, Any]) -> str:
+client = genai.Client(
+    api_key=settings.gemini_api_key,
+    http_options=types.HttpOptions(base_url=settings.gemini_base_url) if settings.gemini_base_url else None
+)
+
+# X-ray usa salida JSON nativa restringida al esquema en lugar de un esqueleto en el prompt
+XRAY_CONFIG = types.GenerateContentConfig(
+    response_mime_type="application/json",
+    response_schema=XRayAnalysis,
+)
+
+# Traducción por segmentos: Gemini devuelve un arreglo con una traducción por segmento
+SEGMENTS_CONFIG = types.GenerateContentConfig(
+    response_mime_type="application/json",
+    response_schema=list[str],
+)
+
+TRANSLATION_LANGUAGES = {
+    "es": "español",
+    "en": "inglés",
+    "fr": "francés",
+    "de": "alemán",
+    "it": "italiano",
+    "pt": "portugués"
+}
+
+translation_memory = TranslationMemory(settings.translation_memory_max_segments)
+
+result_cache = ResultCache(
+    settings.ai_cache_max_entries,
+    settings.ai_cache_ttl_seconds,
+    near_actions=settings.ai_cache_near_actions,
+    near_threshold=settings.ai_cache_near_threshold,
+    audit_min_overlap=settings.ai_cache_audit_min_overlap,
+)
+document_store = DocumentStore(
+    settings.ai_documents_max,
+    settings.ai_documents_max_chars,
+    settings.ai_documents_ttl_seconds,
+)
+
+# Prefetch especulativo: corre con prioridad "prefetch" y deja el resultado en result_cache
+prefetcher = Prefetcher(lambda request: _scheduled_run(request), result_cache, ai_scheduler)
+
+# Con el documento en el context cache de Gemini, el prompt lo referencia en lugar de incluirlo
+DOCUMENT_IN_CONTEXT = "(el DOCUMENTO incluido en el contexto)"
+
+# Tareas de fondo (auditorías, context caches): referencias para que el GC no las cancele
+_background_tasks: Set[asyncio.Task] = set()
+
+def is_xray(action: str) -> bool:
+    return ACTION_ALIASES.get(action.lower()) == "xray"
+
+@contextmanager
+def _track_action(action_label: str, text: str):
+    """Métricas comunes a las acciones de IA (entrada, in-flight, latencia y errores tipados)"""
+    metrics.AI_INPUT_CHARS.labels(action_label).observe(len(text))
+    in_flight = metrics.AI_ACTIONS_IN_FLIGHT.labels(action_label)
+    in_flight.inc()
+    start = time.perf_counter()
+    try:
+        yield
+    except AIError as e:
+        # Errores ya tipados por la capa de resiliencia (quota, safety, timeout, ...)
+        metrics.AI_ERRORS.labels(action_label, e.kind).inc()
+        raise
+    finally:
+        metrics.AI_ACTION_LATENCY.labels(action_label).observe(time.perf_counter() - start)
+        in_flight.dec()
+
+def cache_payload(action: Optional[str], payload: Optional[str]) -> Optional[str]:
+    """Parte del payload que cambia el resultado (solo el idioma destino en translate)"""
+    return target_language(payload) if action == "translate" else None
+
+async def process_ai_action(request: Dict[str, Any]) -> Union[str, Dict[str, Any]]:
+    """
+    Procesa la acción de IA basada en el request.
+    X-ray devuelve el análisis ya validado (dict); el resto, texto.
+    Antes de llamar a Gemini se consulta el cache de resultados (exacto y,
+    para las acciones configuradas, casi-duplicados).
     """
-    Procesa la acción de IA basada en el request
+    action = ACTION_ALIASES.get(request.get("action", "").lower())
+    text = request.get("text", "")
+    if _already_in_target(request, action):
+        return text
+    cacheable = settings.ai_cache_enabled and action in settings.ai_cache_actions
+    if not cacheable:
+        return await _scheduled_run(request)
+    
+    payload = cache_payload(action, request.get("payload"))
+    cached, kind = _cache_lookup(request, action, payload)
+    if kind != "miss":
+        return cached
+    joined = await _join_prefetch(request, action, payload)
+    if joined is not None:
+        return joined
+    
+    result = await _scheduled_run(request)
+    result_cache.put(action, payload, text, result)
+    return result
+
+def source_language(request: Dict[str, Any]) -> Detection:
+    """Idioma del texto detectado localmente (una vez por request)"""
+    detection = request.get("source_language")
+    if detection is None:
+        detection = UNKNOWN
+        if settings.ai_language_detection_enabled:
+            with span("ai.detect_language"):
+                detection = language_detector.detect(request.get("text", ""))
+        request["source_language"] = detection
+    return detection
+
+def detected_language(request: Dict[str, Any]) -> Optional[str]:
+    """
+    Idioma para la metadata de la respuesta. Solo translate lo usa, así que
+    solo ahí se detecta; las demás acciones (y los aciertos de cache) no
+    pagan los n-gramas y devuelven None salvo que ya se haya calculado
+    """
+    if ACTION_ALIASES.get(request.get("action", "").lower()) == "translate":
+        return source_language(request).language
+    detection = request.get("source_language")
+    return detection.language if detection is not None else None
+
+def _already_in_target(request: Dict[str, Any], action: Optional[str]) -> bool:
+    """
+    translate al idioma en que ya está el texto: se devuelve tal cual sin
+    llamar a Gemini (ej. language=es por defecto sobre una selección en español)
+    """
+    text = request.get("text", "")
+    if action != "translate" or not settings.ai_language_detection_enabled \
+            or not settings.ai_language_skip_min_chars <= len(text) <= settings.ai_language_skip_max_chars:
+        return False
+    target = target_language(request.get("payload"))
+    detection = source_language(request)
+    if detection.language != target or detection.confidence < settings.ai_language_skip_min_confidence:
+        return False
+    with span("ai.detect_language.segments"):
+        skip = language_detector.segments_in(text, target, settings.ai_language_skip_min_chars)
+    if skip:
+        request["translation_skipped"] = True
+        metrics.AI_TRANSLATIONS_SKIPPED.labels(target).inc()
+    return skip
+
+def _cache_lookup(request: Dict[str, Any], action: str, payload: Optional[str]) -> Tuple[Any, str]:
+    """Consulta el cache de resultados; muestrea auditorías de los casi-aciertos"""
+    with span("ai.cache_lookup", action=action) as lookup:
+        cached, kind, key = result_cache.get(action, payload, request.get("text", ""))
+        lookup.set_attribute("outcome", kind)
+    if kind == "near" and random.random() < settings.ai_cache_near_audit_rate:
+        _spawn(_audit_near_hit(request, cached))
+    if key is not None:
+        # Si lo calculó un prefetch (exacto o casi-duplicado), se cobra ahora a quien lo usa
+        prefetcher.consume(key, request.get("reservation"))
+    return cached, kind
+
+async def _join_prefetch(request: Dict[str, Any], action: str, payload: Optional[str]) -> Optional[Any]:
+    """Espera el prefetch en curso de la misma acción y texto, si lo hay"""
+    text = request.get("text", "")
+    task = prefetcher.pending(ResultCache.key(action, payload, text))
+    if task is None:
+        return None
+    with span("ai.prefetch_join", action=action):
+        try:
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                raise
+            # Se canceló el prefetch, no este request: se calcula como siempre
+            return None
+    if result is not None:
+        prefetcher.charge_joined(action, len(text), result, request.get("reservation"))
+    return result
+
+def prefetch(owner: Optional[str], text: str, actions: Optional[List[str]], payload: Optional[str],
+             client_ip: Optional[str] = None) -> Dict[str, str]:
+    """
+    Calcula especulativamente `actions` (por defecto
+    `ai_prefetch_default_actions`) sobre la selección; ver
+    app/services/prefetch.py. Devuelve el resultado por acción.
+    """
+    actions = actions or settings.ai_prefetch_default_actions
+    if not (settings.ai_prefetch_enabled and settings.ai_cache_enabled):
+        return {action: "disabled" for action in actions}
+    if len(text) > settings.ai_prefetch_max_chars:
+        return {action: "too_large" for action in actions}
+    requests = []
+    skipped: Dict[str, str] = {}
+    for action in actions:
+        if action not in settings.ai_prefetch_actions or action not in settings.ai_cache_actions:
+            skipped[action] = "not_allowed"
+            continue
+        request = {
+            "action": action,
+            "text": text,
+            "payload": cache_payload(action, payload),
+            "client_ip": client_ip,
+            "priority": "prefetch",
+            "reservation": None
+        }
+        if _already_in_target(request, action):
+            skipped[action] = "not_needed"
+            continue
+        requests.append(request)
+    return {**prefetcher.hint(owner, requests), **skipped}
+
+async def stream_ai_action(request: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Acción de IA en streaming. Eventos:
+    {"type": "delta", "text"} con cada fragmento generado (secciones
+    {"type": "section", "name", "data"} en xray) y al final
+    {"type": "done", "result", "cached"}.
+    Los aciertos de cache, la traducción con memoria (que se arma por
+    segmentos) y la que no hace falta (texto ya en el idioma destino) emiten
+    solo el `done`.
+    """
+    action = ACTION_ALIASES.get(request.get("action", "").lower())
+    text = request.get("text", "")
+    if _already_in_target(request, action):
+        yield {"type": "done", "result": text, "cached": None}
+        return
+    cacheable = settings.ai_cache_enabled and action in settings.ai_cache_actions
+    payload = cache_payload(action, request.get("payload"))
+    if cacheable:
+        cached, kind = _cache_lookup(request, action, payload)
+        if kind != "miss":
+            yield {"type": "done", "result": cached, "cached": kind}
+            return
+        joined = await _join_prefetch(request, action, payload)
+        if joined is not None:
+            yield {"type": "done", "result": joined, "cached": "prefetch"}
+            return
+    
+    if action == "xray":
+        async for event in stream_xray(request):
+            if event["type"] == "done":
+                result = event["result"]
+                event = {**event, "cached": None}
+            yield event
+    elif action == "translate" and settings.translation_memory_enabled:
+        result = await _scheduled_run(request)
+        yield {"type": "done", "result": result, "cached": None}
+    else:
+        result = None
+        async for event in _stream_text(request):
+            if event["type"] == "done":
+                result = event["result"]
+            yield event
+    
+    if cacheable:
+        result_cache.put(action, payload, text, result)
+
+async def _stream_text(request: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    """Acciones de texto (summarize, explain, rewrite, translate) fragmento a fragmento"""
+    action = request.get("action", "").lower()
+    text = request.get("text", "")
+    with span("ai.build_prompt"):
+        prompt = build_prompt(action, text, request.get("payload"))
+    
+    action_label = metrics.action_label(ACTION_ALIASES.get(action, action))
+    parts: List[str] = []
+    async with ai_scheduler.slot(_priority(request), action_deadline(action_label), f"{action_label}_stream"):
+        with _track_action(action_label, text):
+            async for chunk in stream_model(action_label, lambda: _generate_stream(prompt)):
+                if chunk.text:
+                    parts.append(chunk.text)
+                    yield {"type": "delta", "text": chunk.text}
+            
+            output = "".join(parts)
+            await log_usage(request, output)
+            metrics.AI_OUTPUT_CHARS.labels(action_label).observe(len(output))
+            yield {"type": "done", "result": output, "cached": None}
+
+def _priority(request: Dict[str, Any]) -> str:
+    return request.get("priority") or priority_class(len(request.get("text", "")), verified=False)
+
+async def _scheduled_run(request: Dict[str, Any]) -> Union[str, Dict[str, Any]]:
+    """Ejecuta la acción cuando el scheduler le da lugar (o la rechaza con 503)"""
+    action = ACTION_ALIASES.get(request.get("action", "").lower(), "")
+    async with ai_scheduler.slot(_priority(request), action_deadline(action), action):
+        return await _run_action(request)
+
+async def _audit_near_hit(request: Dict[str, Any], reused: Any):
+    """Recalcula un casi-acierto para medir si la reutilización fue correcta"""
+    action = ACTION_ALIASES.get(request.get("action", "").lower())
+    try:
+        # La auditoría es costo nuestro: no se cobra al usuario y va con la menor prioridad
+        fresh = await _scheduled_run({**request, "reservation": None, "priority": "bulk_anon"})
+    except Exception as e:
+        logger.debug("Auditoría de cache sin resultado: %s", e)
+        return
+    result_cache.put(action, cache_payload(action, request.get("payload")), request.get("text", ""), fresh)
+    overlap = result_cache.record_audit(action, reused, fresh)
+    logger.info("Auditoría de casi-acierto", extra={"action": action, "overlap": round(overlap, 3)})
+
+async def _run_action(request: Dict[str, Any]) -> Union[str, Dict[str, Any]]:
+    """
+    Ejecuta la acción contra Gemini (sin cache). Si el request viene de un
+    documento con context cache, el texto no se reenvía: el prompt lo
+    referencia y Gemini lo toma del cache.
     """
     action = request.get("action", "").lower()
     text = request.get("text", "")
     payload = request.get("payload")
+    use_memory = settings.translation_memory_enabled and ACTION_ALIASES.get(action) == "translate"
+    document: Optional[Document] = request.get("document")
+    context_cache = document.context_cache if document is not None and not use_memory else None
     
-    prompt = build_prompt(action, text, payload)
+    if not use_memory:
+        with span("ai.build_prompt"):
+            prompt = build_prompt(action, DOCUMENT_IN_CONTEXT if context_cache else text, payload)
+    config = XRAY_CONFIG if is_xray(action) else None
     
-    try:
-        response = client.models.generate_content(
-            model="gemini-3-flash-preview",
-            contents=prompt
-        )
+    action_label = metrics.action_label(action)
+    with _track_action(action_label, text):
+        chars_in = None
+        if use_memory:
+            output = await translate_with_memory(action_label, text, payload)
+        elif context_cache:
+            output = await _generate_with_context(action_label, document, prompt, text, payload, config)
+            chars_in = len(prompt) if document.context_cache else None
+        else:
+            response = await call_model(action_label, lambda: _generate(prompt, config))
+            output = response.text
         
         # Para el MVP, podríamos guardar logs simples
-        await log_usage(request, response.text)
+        await log_usage(request, output, chars_in)
         
+        metrics.AI_OUTPUT_CHARS.labels(action_label).observe(len(output or ""))
+        if is_xray(action):
+            return parse_xray(output)
+        return output
+
+async def _generate_with_context(
+    action_label: str,
+    document: Document,
+    prompt: str,
+    text: str,
+    payload: Optional[str],
+    config: Optional[types.GenerateContentConfig]
+) -> str:
+    """
+    Llama a Gemini usando el context cache del documento. Si el cache ya no
+    existe (venció o se borró del lado de Gemini) se descarta y se reintenta
+    con el texto en el prompt.
+    """
+    cached_config = (config or types.GenerateContentConfig()).model_copy(
+        update={"cached_content": document.context_cache}
+    )
+    try:
+        response = await call_model(action_label, lambda: _generate(prompt, cached_config))
+    except AIBadRequestError as e:
+        logger.info("Context cache de documento no disponible, se reenvía el texto: %s", e)
+        document.context_cache = None
+        metrics.AI_DOCUMENT_EVENTS.labels("context_cache_lost").inc()
+        inline_prompt = build_prompt(action_label, text, payload)
+        response = await call_model(action_label, lambda: _generate(inline_prompt, config))
         return response.text
-        
+    usage = getattr(response, "usage_metadata", None)
+    cached_tokens = getattr(usage, "cached_content_token_count", None) or 0
+    metrics.AI_CONTEXT_CACHE_TOKENS.inc(cached_tokens)
+    return response.text
+
+# ---- sesiones de documento ----
+
+def register_document(text: str, owner: Optional[str]) -> Document:
+    """
+    Guarda el documento y, si es lo bastante largo para el context caching
+    de Gemini, crea el cache en segundo plano (las acciones lo usan cuando
+    está listo; mientras tanto mandan el texto en el prompt).
+    """
+    document = document_store.create(text, owner)
+    if settings.ai_context_cache_enabled and estimate_tokens(len(text)) >= settings.ai_context_cache_min_tokens:
+        _spawn(_attach_context_cache(document))
+    _release_context_caches()
+    return document
+
+def get_document(document_id: str, owner: Optional[str]) -> Document:
+    document = document_store.get(document_id, owner)
+    _release_context_caches()
+    return document
+
+def delete_document(document_id: str, owner: Optional[str]):
+    document_store.delete(document_id, owner)
+    _release_context_caches()
+
+def _spawn(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+async def _attach_context_cache(document: Document):
+    try:
+        with metrics.track_upstream("gemini", "create_cached_content"):
+            cache = await asyncio.wait_for(
+                client.aio.caches.create(
+                    model=settings.ai_model,
+                    config=types.CreateCachedContentConfig(
+                        contents=[build_document_context(document.text)],
+                        ttl=f"{int(settings.ai_documents_ttl_seconds)}s",
+                        display_name=f"cliro-doc-{document.id[:8]}",
+                    )
+                ),
+                settings.ai_default_deadline_seconds
+            )
     except Exception as e:
-        # Manejo específico de errores de Gemini
-        if "quota" in str(e).lower():
-            raise Exception("Límite de uso excedido. Por favor, intente más tarde.")
-        elif "safety" in str(e).lower():
-            raise Exception("El contenido no pudo ser procesado por políticas de seguridad.")
-        else:
-            raise Exception(f"Error en el procesamiento de IA: {str(e)}")
+        # Sin cache el documento igual funciona (texto en el prompt)
+        logger.warning(f"No se pudo crear el context cache del documento: {e}")
+        metrics.AI_DOCUMENT_EVENTS.labels("context_cache_failed").inc()
+        return
+    metrics.AI_DOCUMENT_EVENTS.labels("context_cache_created").inc()
+    if document.id in document_store:
+        document.context_cache = cache.name
+    else:
+        # El documento se borró mientras se creaba el cache
+        await _delete_context_cache(cache.name)
+
+def _release_context_caches():
+    """Borra en Gemini los caches de documentos que salieron del store"""
+    for document in document_store.drain_removed():
+        _spawn(_delete_context_cache(document.context_cache))
+
+async def _delete_context_cache(name: str):
+    try:
+        with metrics.track_upstream("gemini", "delete_cached_content"):
+            await asyncio.wait_for(client.aio.caches.delete(name=name), settings.ai_default_deadline_seconds)
+    except Exception as e:
+        # Vence solo con el TTL
+        logger.debug(f"No se pudo borrar el context cache {name}: {e}")
+
+def target_language(language: Optional[str]) -> str:
+    """Código de idioma destino soportado (español por defecto)"""
+    code = (language or "es").lower()
+    return code if code in TRANSLATION_LANGUAGES else "es"
+
+async def translate_with_memory(action_label: str, text: str, language: Optional[str]) -> str:
+    """
+    Traduce usando la memoria de segmentos: solo los segmentos no vistos van
+    a Gemini, en un único prompt. Si la respuesta por lotes no cuadra con los
+    segmentos enviados, se traduce el texto completo como antes.
+    """
+    language = target_language(language)
+    segments, separators = split_segments(text)
+    resolved, pending = translation_memory.lookup(segments, language)
+    
+    if pending:
+        with span("ai.translate.segments", pending=len(pending), total=len(segments)):
+            translations = await _translate_segments(action_label, pending, language)
+        if translations is None:
+            response = await call_model(action_label, lambda: _generate(build_translate_prompt(text, language)))
+            return response.text
+        fresh = dict(zip(pending, translations))
+        for segment, translation in fresh.items():
+            translation_memory.put(segment, language, translation)
+        for i, segment in enumerate(segments):
+            if i not in resolved:
+                resolved[i] = fresh[segment]
+    
+    return join_segments([resolved[i] for i in range(len(segments))], separators)
+
+async def _translate_segments(action_label: str, segments: List[str], language: str) -> Optional[List[str]]:
+    prompt = build_segments_prompt(segments, language)
+    response = await call_model(action_label, lambda: _generate(prompt, SEGMENTS_CONFIG))
+    try:
+        translations = json.loads(response.text or "")
+    except ValueError:
+        translations = None
+    if not isinstance(translations, list) or len(translations) != len(segments) \
+            or not all(isinstance(t, str) for t in translations):
+        logger.warning("Traducción por segmentos inconsistente", extra={"segments": len(segments)})
+        return None
+    return translations
+
+class StepDependencyError(Exception):
+    """El paso no se ejecutó porque falló el paso del que depende"""
+    kind = "dependency"
+
+async def process_ai_batch(
+    batch: AIBatchRequest,
+    client_ip: Optional[str] = None,
+    reservation: Optional[Reservation] = None,
+    verified: bool = False
+) -> List[Tuple[AIActionStep, Any]]:
+    """
+    Ejecuta las acciones de un request multi-acción sobre el mismo texto.
+    Los pasos sin `input` corren en paralelo; los que dependen de otro
+    arrancan apenas termina su fuente (pipeline). Pasos idénticos (misma
+    acción, payload y entrada) comparten una sola llamada a Gemini.
+    Devuelve (paso, resultado) en el orden pedido; si el paso falló el
+    resultado es la excepción.
+    """
+    priority = priority_class(len(batch.text), verified, bulk=True)
+    tasks: Dict[str, asyncio.Task] = {}
+    shared: Dict[tuple, asyncio.Task] = {}
+    work_keys: Dict[str, tuple] = {}
+    for step in batch.actions:
+        key = (step.action, step.payload, work_keys.get(step.input))
+        work_keys[step.id] = key
+        if key not in shared:
+            shared[key] = asyncio.ensure_future(
+                _run_step(step, batch, tasks.get(step.input), client_ip, reservation, priority)
+            )
+        tasks[step.id] = shared[key]
+    
+    await asyncio.gather(*shared.values(), return_exceptions=True)
+    return [
+        (step, tasks[step.id].exception() or tasks[step.id].result())
+        for step in batch.actions
+    ]
+
+async def _run_step(
+    step: AIActionStep,
+    batch: AIBatchRequest,
+    source: Optional[asyncio.Task],
+    client_ip: Optional[str],
+    reservation: Optional[Reservation],
+    priority: str
+):
+    text = batch.text
+    if source is not None:
+        try:
+            text = await source
+        except Exception as e:
+            raise StepDependencyError(f"No se ejecutó: falló el paso '{step.input}'") from e
+    with span("ai.batch.step", action=step.action, step=step.id):
+        return await process_ai_action({
+            "action": step.action,
+            "text": text,
+            "payload": step.payload,
+            "user_id": batch.user_id,
+            "client_ip": client_ip,
+            "reservation": reservation,
+            "priority": priority
+        })
+
+async def stream_xray(request: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Análisis X-ray en streaming: emite cada sección en cuanto el modelo la
+    cierra y al final el análisis completo validado.
+    Eventos: {"type": "section", "name", "data"} y {"type": "done", "result"}.
+    """
+    text = request.get("text", "")
+    with span("ai.build_prompt"):
+        prompt = build_xray_prompt(text)
+    
+    parser = JsonSectionParser()
+    async with ai_scheduler.slot(_priority(request), action_deadline("xray"), "xray_stream"):
+        with _track_action("xray", text):
+            async for chunk in stream_model("xray", lambda: _generate_stream(prompt, XRAY_CONFIG)):
+                for name, data in parser.feed(chunk.text or ""):
+                    if name in XRAY_SECTIONS:
+                        yield {"type": "section", "name": name, "data": data}
+            
+            await log_usage(request, parser.text)
+            metrics.AI_OUTPUT_CHARS.labels("xray").observe(len(parser.text))
+            yield {"type": "done", "result": parse_xray(parser.text)}
+
+def parse_xray(raw: Optional[str]) -> Dict[str, Any]:
+    """Valida la salida del modelo contra XRayAnalysis"""
+    try:
+        return XRayAnalysis.model_validate_json(raw or "").model_dump()
+    except ValidationError as e:
+        logger.warning("Análisis X-ray con formato inválido", extra={"errors": e.error_count()})
+        raise AIUpstreamError("El análisis X-ray no tiene el formato esperado")
+
+async def _generate(prompt: str, config: Optional[types.GenerateContentConfig] = None):
+    """Una llamada a Gemini (el cliente async no bloquea el event loop)"""
+    with metrics.track_upstream("gemini", "generate_content"):
+        return await client.aio.models.generate_content(
+            model=settings.ai_model,
+            contents=prompt,
+            config=config
+        )
+
+async def _generate_stream(prompt: str, config: Optional[types.GenerateContentConfig] = None):
+    """Abre un stream de Gemini (se mide solo la apertura; el stream lo acota stream_model)"""
+    with metrics.track_upstream("gemini", "generate_content_stream"):
+        return await client.aio.models.generate_content_stream(
+            model=settings.ai_model,
+            contents=prompt,
+            config=config
+        )
 
 def build_prompt(action: str, text: str, payload: str = None) -> str:
     """
     Construye el prompt según la acción solicitada
     """
-    action_map = {
-        "summarize": "summarize",
-        "resumir": "summarize",
-        "explain": "explain",
-        "explicar": "explain",
-        "rewrite": "rewrite",
-        "reescribir": "rewrite",
-        "translate": "translate",
-        "traducir": "translate",
-        "xray": "analyze",
-        "analizar": "analyze"
-    }
-    
-    normalized_action = action_map.get(action.lower(), action)
+    normalized_action = ACTION_ALIASES.get(action.lower(), action)
     
     prompts = {
         "summarize": f"""
@@ -77,7 +637,7 @@ def build_prompt(action: str, text: str, payload: str = None) -> str:
         
         "translate": build_translate_prompt(text, payload),
         
-        "analyze": build_xray_prompt(text)
+        "xray": build_xray_prompt(text)
     }
     
     return prompts.get(normalized_action, prompts["summarize"])
@@ -106,22 +666,10 @@ def build_rewrite_prompt(text: str, tone: str = None) -> str:
     """
 
 def build_translate_prompt(text: str, language: str = None) -> str:
-    if language is None:
-        language = "es"
-        
     """
     Construye prompt para traducción
     """
-    language_map = {
-        "es": "español",
-        "en": "inglés",
-        "fr": "francés",
-        "de": "alemán",
-        "it": "italiano",
-        "pt": "portugués"
-    }
-    
-    target_lang = language_map.get(language.lower(), "español")
+    target_lang = TRANSLATION_LANGUAGES[target_language(language)]
     
     return f"""
     Traduce el siguiente texto al {target_lang}. Mantén el tono, estilo y significado original.
@@ -132,12 +680,31 @@ def build_translate_prompt(text: str, language: str = None) -> str:
     TRADUCCIÓN ({target_lang.upper()}):
     """
 
+def build_segments_prompt(segments: List[str], language: str) -> str:
+    """
+    Construye prompt para traducir varios segmentos en una sola llamada
+    """
+    target_lang = TRANSLATION_LANGUAGES[target_language(language)]
+    
+    return f"""
+    Traduce al {target_lang} cada segmento del siguiente arreglo JSON. Mantén el tono, estilo y significado original.
+    Responde con un arreglo JSON de exactamente {len(segments)} traducciones, en el mismo orden.
+    
+    SEGMENTOS:
+    {json.dumps(segments, ensure_ascii=False)}
+    """
+
+def build_document_context(text: str) -> types.Content:
+    """Contenido que se guarda en el context cache de un documento"""
+    return types.Content(role="user", parts=[types.Part(text=f"DOCUMENTO:\n{text}")])
+
 def build_xray_prompt(text: str) -> str:
     """
-    Construye prompt para análisis X-ray (análisis de errores)
+    Construye prompt para análisis X-ray (análisis de errores).
+    El formato JSON lo impone XRAY_CONFIG (response_schema), no el prompt.
     """
     return f"""
-    Analiza el siguiente texto y proporciona un análisis detallado de posibles mejoras en formato JSON:
+    Analiza el siguiente texto y proporciona un análisis detallado de posibles mejoras:
     
     1. **Errores gramaticales**: Lista de errores con correcciones
     2. **Errores de estilo**: Sugerencias para mejorar claridad y fluidez
@@ -146,20 +713,28 @@ def build_xray_prompt(text: str) -> str:
     
     TEXTO:
     {text}
-    
-    ANÁLISIS (en formato JSON):
-    {{
-      "grammar_errors": [],
-      "style_errors": [],
-      "vocabulary_suggestions": [],
-      "overall_score": 0,
-      "improvement_suggestions": []
-    }}
     """
 
-async def log_usage(request: Dict[str, Any], response: str):
+async def log_usage(request: Dict[str, Any], response: str, chars_in: Optional[int] = None):
     """
-    Guarda logs de uso (simple para MVP)
+    Guarda logs de uso (simple para MVP).
+    `chars_in` reemplaza al largo del texto cuando este no se mandó en el
+    prompt (documento en context cache).
     """
-    # Por ahora solo imprimimos, luego conectaremos a Supabase
-    print(f"[AI USAGE] Action: {request.get('action')}, Chars: {len(request.get('text', ''))}")
\ No newline at end of file
+    # Consumo real para el ledger (se persiste por lotes en Supabase)
+    action = request.get("action") or ""
+    usage_ledger.record(
+        request.get("reservation"),
+        ACTION_ALIASES.get(action.lower(), action),
+        estimate_tokens(chars_in if chars_in is not None else len(request.get("text", ""))),
+        estimate_tokens(len(response or "")),
+    )
+    logger.info(
+        "Uso de IA",
+        extra={
+            "action": request.get("action"),
+            "chars_in": len(request.get("text", "")),
+            "chars_out": len(response or ""),
+            "user_id": request.get("user_id"),
+        }
+    )
\ No newline at end of file
@@ -1,37 +1,35 @@
 from typing import Dict, Any, Optional, List, Tuple
 from datetime import datetime, date, timedelta
-from app.db import db_manager
+from app.db import db_manager, run_query, run_read
 from app.schemas.auth import WaitlistUserCreate
 from app.core.security import security
+from app.core.tracing import span
+import asyncio
 import logging
 import hashlib
 import uuid
 
 logger = logging.getLogger(__name__)
 
+WAITLIST_TABLE = "waitlist_users"
+
 class AuthService:
     """Servicio robusto para waitlist"""
     
     def __init__(self):
-        self.supabase = db_manager.get_table("waitlist_users")
+        # Escrituras; las lecturas van por run_read (réplica si hay)
+        self.supabase = db_manager.get_table(WAITLIST_TABLE, "write")
     
     async def join_waitlist(self, user_data: WaitlistUserCreate) -> Dict[str, Any]:
         """
         Registra usuario con validaciones robustas
         """
         try:
-            # 1. Validar email
-            if not security.validate_email(user_data.email):
-                return {
-                    "success": False,
-                    "message": "Formato de email inválido",
-                    "error": "invalid_email"
-                }
-            
-            # 2. Verificar si existe
-            existing_user = await self.get_user_by_email(user_data.email)
+            # El formato del email ya lo validó EmailStr en WaitlistUserCreate
+            # 1. Verificar si existe (en el primario: la réplica puede no tener un alta reciente)
+            existing_user = await self.get_user_by_email(user_data.email, intent="write")
             if existing_user:
-                position = await self.calculate_waitlist_position(existing_user["id"])
+                position = await self.calculate_waitlist_position(existing_user["id"], intent="write")
                 return {
                     "success": False,
                     "message": "Este email ya está registrado",
@@ -39,29 +37,35 @@ class AuthService:
                     "error": "email_exists"
                 }
             
-            # 3. Sanitizar datos
-            sanitized_data = {
-                "email": user_data.email.lower().strip(),
-                "name": security.sanitize_input(user_data.name, 100),
-                "interest_reason": user_data.interest_reason,
-                "preferred_languages": user_data.preferred_languages,
-                "created_at": datetime.utcnow().isoformat(),
-                "verification_token": self._generate_verification_token(user_data.email),
-                "is_verified": False  # Para futuro
-            }
+            # 2. Sanitizar datos
+            with span("waitlist.sanitize"):
+                sanitized_data = {
+                    "email": user_data.email.lower().strip(),
+                    "name": security.sanitize_input(user_data.name, 100),
+                    "interest_reason": user_data.interest_reason,
+                    "preferred_languages": user_data.preferred_languages,
+                    "created_at": datetime.utcnow().isoformat(),
+                    "verification_token": self._generate_verification_token(user_data.email),
+                    "is_verified": False  # Para futuro
+                }
             
-            # 4. Insertar en BD
-            response = self.supabase.insert(sanitized_data).execute()
+            # 3. Insertar en BD
+            response = await run_query(
+                self.supabase.insert(sanitized_data),
+                f"{WAITLIST_TABLE}.insert",
+                idempotent=False
+            )
             
             if not response.data:
                 raise Exception("Error al insertar en base de datos")
+            db_manager.note_write(WAITLIST_TABLE)
             
             user_id = response.data[0]["id"]
             
-            # 5. Calcular posición
-            position = await self.calculate_waitlist_position(user_id)
+            # 4. Calcular posición
+            position = await self.calculate_waitlist_position(user_id, intent="write")
             
-            # 6. Registrar en analytics (para futuro)
+            # 5. Registrar en analytics (para futuro)
             await self._log_signup_analytics(user_id, user_data.interest_reason)
             
             return {
@@ -74,32 +78,33 @@ class AuthService:
             }
             
         except Exception as e:
-            logger.error(f"Error en waitlist: {email} - {str(e)}", exc_info=True)
+            logger.error(f"Error en waitlist: {user_data.email} - {str(e)}", exc_info=True)
             raise
     
-    async def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
-        """Busca usuario por email"""
-        try:
-            response = self.supabase.select("*")\
-                .eq("email", email.lower())\
-                .execute()
-            
-            return response.data[0] if response.data else None
-        except Exception as e:
-            logger.error(f"Error buscando usuario: {e}")
-            return None
+    async def _select(self, build, operation: str, intent: str):
+        """Lectura por la réplica (intent="read") o por el primario (intent="write")"""
+        if intent == "read":
+            return await run_read(WAITLIST_TABLE, build, operation)
+        return await run_query(build(self.supabase), operation)
     
-    async def calculate_waitlist_position(self, user_id: int) -> int:
-        """Calcula posición real en waitlist"""
-        try:
-            # Contar usuarios registrados ANTES de este
-            response = self.supabase.select("id", count="exact")\
-                .lt("id", user_id)\
-                .execute()
-            
-            return (response.count or 0) + 1
-        except:
-            return 0
+    async def get_user_by_email(self, email: str, intent: str = "read") -> Optional[Dict[str, Any]]:
+        """Busca usuario por email (lanza DatabaseError si Supabase falla)"""
+        response = await self._select(
+            lambda table: table.select("*").eq("email", email.lower()),
+            f"{WAITLIST_TABLE}.select_by_email",
+            intent
+        )
+        return response.data[0] if response.data else None
+    
+    async def calculate_waitlist_position(self, user_id: int, intent: str = "read") -> int:
+        """Calcula posición real en waitlist (lanza DatabaseError si Supabase falla)"""
+        # Contar usuarios registrados ANTES de este
+        response = await self._select(
+            lambda table: table.select("id", count="exact").lt("id", user_id),
+            f"{WAITLIST_TABLE}.count_before",
+            intent
+        )
+        return (response.count or 0) + 1
     
     def _calculate_estimated_access(self, position: int) -> str:
         """Calcula fecha estimada"""
@@ -116,61 +121,66 @@ class AuthService:
             return access_date.strftime("%d/%m/%Y")
     
     async def get_waitlist_stats(self) -> Dict[str, Any]:
-        """Obtiene estadísticas completas"""
-        try:
+        """Obtiene estadísticas completas (lanza DatabaseError si Supabase falla)"""
+        today = date.today().isoformat()
+        
+        # Las cuatro lecturas son independientes: se ejecutan en paralelo (en la réplica si hay)
+        total_resp, today_resp, langs_resp, reasons_resp = await asyncio.gather(
             # Total usuarios
-            total_resp = self.supabase.select("id", count="exact").execute()
-            total_users = total_resp.count or 0
-            
+            run_read(
+                WAITLIST_TABLE,
+                lambda table: table.select("id", count="exact"),
+                f"{WAITLIST_TABLE}.count_total"
+            ),
             # Hoy
-            today = date.today().isoformat()
-            today_resp = self.supabase.select("id", count="exact")\
-                .gte("created_at", f"{today}T00:00:00")\
-                .lte("created_at", f"{today}T23:59:59")\
-                .execute()
-            today_signups = today_resp.count or 0
-            
+            run_read(
+                WAITLIST_TABLE,
+                lambda table: table.select("id", count="exact")
+                    .gte("created_at", f"{today}T00:00:00")
+                    .lte("created_at", f"{today}T23:59:59"),
+                f"{WAITLIST_TABLE}.count_today"
+            ),
             # Idiomas más populares
-            langs_resp = self.supabase.select("preferred_languages").execute()
-            lang_count = {}
-            for user in langs_resp.data:
-                for lang in user.get("preferred_languages", []):
-                    lang_count[lang] = lang_count.get(lang, 0) + 1
-            
-            top_langs = [
-                {"language": lang, "count": count}
-                for lang, count in sorted(lang_count.items(), key=lambda x: x[1], reverse=True)[:5]
-            ]
-            
+            run_read(
+                WAITLIST_TABLE,
+                lambda table: table.select("preferred_languages"),
+                f"{WAITLIST_TABLE}.select_languages"
+            ),
             # Razones más populares
-            reasons_resp = self.supabase.select("interest_reason").execute()
-            reason_count = {}
-            for user in reasons_resp.data:
-                reason = user.get("interest_reason")
-                reason_count[reason] = reason_count.get(reason, 0) + 1
-            
-            top_reasons = [
-                {"reason": reason, "count": count}
-                for reason, count in sorted(reason_count.items(), key=lambda x: x[1], reverse=True)[:5]
-            ]
-            
-            return {
-                "total_users": total_users,
-                "today_signups": today_signups,
-                "top_languages": top_langs,
-                "top_reasons": top_reasons,
-                "updated_at": datetime.utcnow().isoformat()
-            }
-            
-        except Exception as e:
-            logger.error(f"Error obteniendo stats: {e}")
-            return {
-                "total_users": 0,
-                "today_signups": 0,
-                "top_languages": [],
-                "top_reasons": [],
-                "updated_at": datetime.utcnow().isoformat()
-            }
+            run_read(
+                WAITLIST_TABLE,
+                lambda table: table.select("interest_reason"),
+                f"{WAITLIST_TABLE}.select_reasons"
+            ),
+        )
+        
+        lang_count = {}
+        for user in langs_resp.data:
+            for lang in user.get("preferred_languages") or []:
+                lang_count[lang] = lang_count.get(lang, 0) + 1
+        
+        top_langs = [
+            {"language": lang, "count": count}
+            for lang, count in sorted(lang_count.items(), key=lambda x: x[1], reverse=True)[:5]
+        ]
+        
+        reason_count = {}
+        for user in reasons_resp.data:
+            reason = user.get("interest_reason")
+            reason_count[reason] = reason_count.get(reason, 0) + 1
+        
+        top_reasons = [
+            {"reason": reason, "count": count}
+            for reason, count in sorted(reason_count.items(), key=lambda x: x[1], reverse=True)[:5]
+        ]
+        
+        return {
+            "total_users": total_resp.count or 0,
+            "today_signups": today_resp.count or 0,
+            "top_languages": top_langs,
+            "top_reasons": top_reasons,
+            "updated_at": datetime.utcnow().isoformat()
+        }
     
     def _generate_verification_token(self, email: str) -> str:
         """Genera token único para verificación"""
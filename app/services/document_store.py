@@ -0,0 +1,120 @@
+"""
+Sesiones de documento: el texto de una página se registra una vez y las
+acciones posteriores lo referencian por id (y opcionalmente un fragmento).
+
+Store en memoria (por proceso) acotado por cantidad de documentos y por
+caracteres totales, con TTL absoluto: coincide con el TTL del context cache
+de Gemini creado para el documento, así ambos vencen juntos. Cada documento
+pertenece a quien lo registró (usuario o IP) y solo ese dueño lo ve.
+"""
+import secrets
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from app.core import metrics
+
+
+class DocumentNotFoundError(LookupError):
+    """El documento no existe, venció o es de otro usuario"""
+
+
+@dataclass
+class Document:
+    id: str
+    owner: Optional[str]
+    text: str
+    created: float
+    expires: float
+    # Nombre del CachedContent de Gemini (cachedContents/...) si se creó
+    context_cache: Optional[str] = None
+    uses: int = 0
+
+    def span(self, start: Optional[int], end: Optional[int]) -> str:
+        """Fragmento [start, end) del documento (todo si no se indica)"""
+        if start is None and end is None:
+            return self.text
+        start = 0 if start is None else start
+        end = len(self.text) if end is None else end
+        if not 0 <= start < end <= len(self.text):
+            raise ValueError(f"Rango inválido [{start}, {end}) para un documento de {len(self.text)} caracteres")
+        return self.text[start:end]
+
+
+class DocumentStore:
+    """LRU con TTL absoluto, acotado por cantidad y por caracteres totales"""
+
+    def __init__(self, max_documents: int, max_chars: int, ttl_seconds: float):
+        self.max_documents = max_documents
+        self.max_chars = max_chars
+        self.ttl_seconds = ttl_seconds
+        self.total_chars = 0
+        self.events: Counter = Counter()
+        self._documents: "OrderedDict[str, Document]" = OrderedDict()
+        self._removed: List[Document] = []
+
+    def __contains__(self, document_id: str) -> bool:
+        return document_id in self._documents
+
+    def create(self, text: str, owner: Optional[str]) -> Document:
+        """Registra un documento; devuelve el Document con su id opaco"""
+        if len(text) > self.max_chars:
+            raise ValueError(f"El documento excede el máximo de {self.max_chars} caracteres")
+        now = time.monotonic()
+        document = Document(secrets.token_urlsafe(16), owner, text, now, now + self.ttl_seconds)
+        self._documents[document.id] = document
+        self.total_chars += len(text)
+        self._record("created")
+        self._evict(now)
+        return document
+
+    def get(self, document_id: str, owner: Optional[str]) -> Document:
+        document = self._documents.get(document_id)
+        if document is None or document.owner != owner:
+            raise DocumentNotFoundError(document_id)
+        if time.monotonic() >= document.expires:
+            self._remove(document_id, "expired")
+            raise DocumentNotFoundError(document_id)
+        self._documents.move_to_end(document_id)
+        document.uses += 1
+        return document
+
+    def delete(self, document_id: str, owner: Optional[str]) -> Document:
+        document = self._documents.get(document_id)
+        if document is None or document.owner != owner:
+            raise DocumentNotFoundError(document_id)
+        self._remove(document_id, "deleted")
+        return document
+
+    def drain_removed(self) -> List[Document]:
+        """Documentos sacados desde la última llamada (para borrar su context cache)"""
+        removed, self._removed = self._removed, []
+        return removed
+
+    def _evict(self, now: float):
+        for document_id in [d.id for d in self._documents.values() if now >= d.expires]:
+            self._remove(document_id, "expired")
+        while len(self._documents) > self.max_documents or self.total_chars > self.max_chars:
+            self._remove(next(iter(self._documents)), "evicted")
+
+    def _remove(self, document_id: str, reason: str):
+        document = self._documents.pop(document_id)
+        self.total_chars -= len(document.text)
+        self._record(reason)
+        if document.context_cache:
+            self._removed.append(document)
+
+    def _record(self, event: str):
+        self.events[event] += 1
+        metrics.AI_DOCUMENT_EVENTS.labels(event).inc()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "documents": len(self._documents),
+            "max_documents": self.max_documents,
+            "total_chars": self.total_chars,
+            "max_chars": self.max_chars,
+            "context_caches": sum(1 for d in self._documents.values() if d.context_cache),
+            "events": dict(self.events),
+        }
@@ -0,0 +1,148 @@
+"""
+Detección local de idioma (en proceso, sin red).
+
+- Escrituras propias: por script Unicode (hangul → ko, kana → ja, han → zh,
+  cirílico → ru, árabe → ar).
+- Escritura latina (es, en, fr, de, it, pt): naive Bayes sobre n-gramas de
+  caracteres (1 a 3) de cada palabra con bordes, entrenado al importar con
+  las muestras de app/services/language_samples.py.
+
+La confianza es la probabilidad posterior del idioma ganador con los
+log-likelihoods promediados por n-grama (el naive Bayes crudo es
+sobreconfiado con textos largos). Solo se analizan los primeros
+`max_chars` caracteres.
+"""
+import math
+import re
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.services.language_samples import LANGUAGE_SAMPLES
+from app.services.translation_memory import split_segments
+
+_WORD = re.compile(r"[^\W\d_]+")
+
+# Rangos Unicode de las escrituras no latinas soportadas
+_SCRIPTS: Tuple[Tuple[str, int, int], ...] = (
+    ("ko", 0xAC00, 0xD7AF),   # sílabas hangul
+    ("ko", 0x1100, 0x11FF),   # jamo
+    ("ja", 0x3040, 0x30FF),   # hiragana y katakana
+    ("zh", 0x4E00, 0x9FFF),   # ideogramas CJK (también kanji)
+    ("ru", 0x0400, 0x04FF),   # cirílico
+    ("ar", 0x0600, 0x06FF),   # árabe
+)
+
+# Peso de cada orden de n-grama en el score
+_ORDER_WEIGHTS = {1: 0.2, 2: 0.6, 3: 1.0}
+
+# Escala de la posterior (log-likelihood medio por n-grama -> confianza)
+_TEMPERATURE = 12.0
+
+
+@dataclass(frozen=True)
+class Detection:
+    language: Optional[str]
+    confidence: float
+
+
+UNKNOWN = Detection(None, 0.0)
+
+
+def _ngrams(word: str):
+    padded = f" {word} "
+    for n in _ORDER_WEIGHTS:
+        for i in range(len(padded) - n + 1):
+            gram = padded[i:i + n]
+            if gram != " ":
+                yield n, gram
+
+
+def _script(char: str) -> Optional[str]:
+    code = ord(char)
+    if code < 0x250:
+        return "latin"
+    for language, start, end in _SCRIPTS:
+        if start <= code <= end:
+            return language
+    return "latin" if "LATIN" in unicodedata.name(char, "") else None
+
+
+class LanguageDetector:
+    """Detector por script y n-gramas de caracteres"""
+
+    def __init__(self, samples: Dict[str, str], max_chars: int = 1000):
+        self.max_chars = max_chars
+        self.languages = list(samples)
+        self._logprob: Dict[str, Dict[Tuple[int, str], float]] = {}
+        self._unseen: Dict[str, Dict[int, float]] = {}
+        for language, text in samples.items():
+            counts: Counter = Counter()
+            for word in _WORD.findall(text.lower()):
+                counts.update(_ngrams(word))
+            totals: Counter = Counter()
+            vocabulary: Counter = Counter()
+            for (n, _), count in counts.items():
+                totals[n] += count
+                vocabulary[n] += 1
+            # Suavizado de Laplace por orden
+            self._logprob[language] = {
+                gram: math.log((count + 1) / (totals[gram[0]] + vocabulary[gram[0]] + 1))
+                for gram, count in counts.items()
+            }
+            self._unseen[language] = {
+                n: math.log(1 / (totals[n] + vocabulary[n] + 1)) for n in _ORDER_WEIGHTS
+            }
+
+    def detect(self, text: str) -> Detection:
+        text = text[:self.max_chars]
+        scripts = Counter(_script(char) for char in text if char.isalpha())
+        scripts.pop(None, None)
+        if not scripts:
+            return UNKNOWN
+        total = sum(scripts.values())
+        if scripts.get("ja"):
+            # Japonés mezcla kana y kanji: el kana lo distingue del chino
+            scripts["ja"] += scripts.pop("zh", 0)
+        script, count = scripts.most_common(1)[0]
+        if script != "latin":
+            return Detection(script, round(count / total, 3))
+        return self._detect_latin(text, count / total)
+
+    def _detect_latin(self, text: str, share: float) -> Detection:
+        grams: Counter = Counter()
+        for word in _WORD.findall(text.lower()):
+            grams.update(_ngrams(word))
+        if not grams:
+            return UNKNOWN
+        # Peso de cada n-grama distinto: orden x repeticiones
+        weighted = [(gram, _ORDER_WEIGHTS[gram[0]] * count) for gram, count in grams.items()]
+        total_weight = sum(weight for _, weight in weighted)
+        scores = {}
+        for language in self.languages:
+            logprob, unseen = self._logprob[language], self._unseen[language]
+            scores[language] = sum(
+                weight * logprob.get(gram, unseen[gram[0]]) for gram, weight in weighted
+            ) / total_weight
+        best = max(scores, key=scores.get)
+        norm = sum(math.exp(_TEMPERATURE * (score - scores[best])) for score in scores.values())
+        return Detection(best, round(share / norm, 3))
+
+    def segments_in(self, text: str, language: str, min_chars: int) -> bool:
+        """
+        False si algún segmento de al menos `min_chars` parece estar en otro
+        idioma (una cita o un párrafo en otro idioma ya justifica traducir).
+        Recorre todo el texto, no solo el prefijo de `detect`: el costo es
+        lineal en el largo y lo acota el llamador.
+        """
+        for segment in split_segments(text)[0]:
+            if len(segment) < min_chars:
+                continue
+            detection = self.detect(segment)
+            if detection.language != language and detection.confidence >= 0.5:
+                return False
+        return True
+
+language_detector = LanguageDetector(LANGUAGE_SAMPLES, settings.ai_language_detect_max_chars)
@@ -0,0 +1,125 @@
+"""
+Textos de entrenamiento del detector de idioma (app/services/language_detector.py).
+
+Prosa variada (noticias, instrucciones, correo, divulgación) por idioma de
+escritura latina; los perfiles de n-gramas se calculan al importar el
+detector. Los idiomas con alfabeto propio (zh, ja, ko, ru, ar) se detectan
+por script Unicode y no necesitan muestras.
+"""
+
+LANGUAGE_SAMPLES = {
+    "es": """
+    El gobierno anunció ayer un nuevo plan para mejorar el transporte público en las principales ciudades del país.
+    Según el ministro, las obras comenzarán el próximo año y durarán al menos tres años.
+    Muchos vecinos se quejan de que los autobuses llegan tarde y de que los trenes van siempre llenos.
+    Para preparar una buena tortilla de patatas necesitas huevos, patatas, aceite de oliva y un poco de sal.
+    Primero pela las patatas y córtalas en rodajas finas; después fríelas a fuego lento hasta que estén blandas.
+    Hola Marta, te escribo para confirmar la reunión del jueves a las diez de la mañana en la oficina.
+    Si no puedes venir, avísame cuanto antes y buscamos otro día que nos venga bien a todos.
+    La inteligencia artificial está cambiando la forma en que trabajamos, estudiamos y nos comunicamos.
+    Sin embargo, los expertos advierten que todavía hay muchos problemas que resolver antes de confiar en ella.
+    Los científicos descubrieron que las abejas pueden reconocer rostros humanos después de un breve entrenamiento.
+    Este hallazgo podría ayudarnos a entender cómo funciona la memoria en cerebros muy pequeños.
+    Nuestra empresa ofrece soluciones para pequeños negocios que quieren vender sus productos por internet.
+    Puedes cancelar tu suscripción en cualquier momento desde la configuración de tu cuenta.
+    La historia de la ciudad se remonta a la época romana, cuando era un importante puerto comercial.
+    Hoy en día es conocida por sus playas, su gastronomía y la amabilidad de su gente.
+    ¿Cuándo fue la última vez que leíste un libro que te hiciera pensar de verdad?
+    Los estudiantes deberán entregar el trabajo final antes del quince de junio para obtener la nota.
+    """,
+    "en": """
+    The government announced yesterday a new plan to improve public transport in the country's largest cities.
+    According to the minister, construction will begin next year and will take at least three years.
+    Many residents complain that the buses are always late and that the trains are too crowded.
+    To make a good pancake you need flour, eggs, milk, a little sugar and a pinch of salt.
+    First mix the dry ingredients in a large bowl, then slowly add the milk while you whisk.
+    Hi Mark, I'm writing to confirm our meeting on Thursday at ten in the morning at the office.
+    If you can't make it, please let me know as soon as possible and we will find another day.
+    Artificial intelligence is changing the way we work, study and communicate with each other.
+    However, experts warn that there are still many problems to solve before we can fully trust it.
+    Scientists discovered that bees can recognize human faces after a short period of training.
+    This finding could help us understand how memory works in very small brains.
+    Our company provides solutions for small businesses that want to sell their products online.
+    You can cancel your subscription at any time from your account settings.
+    The history of the town goes back to Roman times, when it was an important trading port.
+    Today it is known for its beaches, its food and the friendliness of its people.
+    When was the last time you read a book that really made you think?
+    Students should submit the final paper by the fifteenth of June in order to receive a grade.
+    """,
+    "fr": """
+    Le gouvernement a annoncé hier un nouveau plan pour améliorer les transports publics dans les grandes villes du pays.
+    Selon le ministre, les travaux commenceront l'année prochaine et dureront au moins trois ans.
+    Beaucoup d'habitants se plaignent que les bus arrivent en retard et que les trains sont toujours bondés.
+    Pour réussir une bonne crêpe, il faut de la farine, des œufs, du lait, un peu de sucre et une pincée de sel.
+    Mélangez d'abord les ingrédients secs dans un grand saladier, puis ajoutez le lait petit à petit en fouettant.
+    Bonjour Marc, je vous écris pour confirmer notre réunion de jeudi à dix heures au bureau.
+    Si vous ne pouvez pas venir, prévenez-moi le plus tôt possible et nous trouverons une autre date.
+    L'intelligence artificielle change la façon dont nous travaillons, étudions et communiquons entre nous.
+    Cependant, les experts avertissent qu'il reste encore beaucoup de problèmes à résoudre avant de lui faire confiance.
+    Les scientifiques ont découvert que les abeilles peuvent reconnaître des visages humains après un court entraînement.
+    Cette découverte pourrait nous aider à comprendre comment fonctionne la mémoire dans de très petits cerveaux.
+    Notre entreprise propose des solutions aux petites entreprises qui veulent vendre leurs produits sur internet.
+    Vous pouvez annuler votre abonnement à tout moment depuis les paramètres de votre compte.
+    L'histoire de la ville remonte à l'époque romaine, quand elle était un port de commerce important.
+    Aujourd'hui, elle est connue pour ses plages, sa gastronomie et la gentillesse de ses habitants.
+    Quand avez-vous lu pour la dernière fois un livre qui vous a vraiment fait réfléchir ?
+    Les étudiants doivent rendre le travail final avant le quinze juin pour obtenir leur note.
+    """,
+    "de": """
+    Die Regierung hat gestern einen neuen Plan zur Verbesserung des öffentlichen Verkehrs in den größten Städten des Landes angekündigt.
+    Nach Angaben des Ministers beginnen die Bauarbeiten im nächsten Jahr und dauern mindestens drei Jahre.
+    Viele Anwohner beschweren sich, dass die Busse immer zu spät kommen und die Züge ständig überfüllt sind.
+    Für einen guten Pfannkuchen braucht man Mehl, Eier, Milch, etwas Zucker und eine Prise Salz.
+    Zuerst die trockenen Zutaten in einer großen Schüssel vermischen und dann langsam die Milch unterrühren.
+    Hallo Markus, ich schreibe dir, um unser Treffen am Donnerstag um zehn Uhr im Büro zu bestätigen.
+    Wenn du nicht kommen kannst, sag mir bitte so früh wie möglich Bescheid, dann finden wir einen anderen Termin.
+    Künstliche Intelligenz verändert die Art und Weise, wie wir arbeiten, lernen und miteinander kommunizieren.
+    Experten warnen jedoch, dass noch viele Probleme gelöst werden müssen, bevor wir ihr wirklich vertrauen können.
+    Wissenschaftler haben herausgefunden, dass Bienen nach einem kurzen Training menschliche Gesichter erkennen können.
+    Diese Entdeckung könnte uns helfen zu verstehen, wie das Gedächtnis in sehr kleinen Gehirnen funktioniert.
+    Unser Unternehmen bietet Lösungen für kleine Firmen, die ihre Produkte im Internet verkaufen möchten.
+    Sie können Ihr Abonnement jederzeit in den Einstellungen Ihres Kontos kündigen.
+    Die Geschichte der Stadt reicht bis in die Römerzeit zurück, als sie ein wichtiger Handelshafen war.
+    Heute ist sie für ihre Strände, ihre Küche und die Freundlichkeit ihrer Bewohner bekannt.
+    Wann hast du zuletzt ein Buch gelesen, das dich wirklich zum Nachdenken gebracht hat?
+    Die Studierenden müssen die Abschlussarbeit bis zum fünfzehnten Juni abgeben, um eine Note zu erhalten.
+    """,
+    "it": """
+    Il governo ha annunciato ieri un nuovo piano per migliorare il trasporto pubblico nelle principali città del paese.
+    Secondo il ministro, i lavori inizieranno l'anno prossimo e dureranno almeno tre anni.
+    Molti cittadini si lamentano che gli autobus arrivano sempre in ritardo e che i treni sono troppo affollati.
+    Per preparare una buona frittata servono uova, patate, olio d'oliva, un po' di formaggio e un pizzico di sale.
+    Prima sbatti le uova in una ciotola grande, poi aggiungi le patate tagliate a fette sottili.
+    Ciao Marco, ti scrivo per confermare la riunione di giovedì alle dieci di mattina in ufficio.
+    Se non puoi venire, fammelo sapere il prima possibile così troviamo un altro giorno che vada bene a tutti.
+    L'intelligenza artificiale sta cambiando il modo in cui lavoriamo, studiamo e comunichiamo tra di noi.
+    Tuttavia gli esperti avvertono che ci sono ancora molti problemi da risolvere prima di potersi fidare davvero.
+    Gli scienziati hanno scoperto che le api riescono a riconoscere i volti umani dopo un breve addestramento.
+    Questa scoperta potrebbe aiutarci a capire come funziona la memoria in cervelli molto piccoli.
+    La nostra azienda offre soluzioni per le piccole imprese che vogliono vendere i propri prodotti su internet.
+    Puoi annullare il tuo abbonamento in qualsiasi momento dalle impostazioni del tuo account.
+    La storia della città risale all'epoca romana, quando era un importante porto commerciale.
+    Oggi è conosciuta per le sue spiagge, la sua cucina e la gentilezza della sua gente.
+    Quand'è stata l'ultima volta che hai letto un libro che ti ha fatto davvero pensare?
+    Gli studenti devono consegnare il lavoro finale entro il quindici giugno per ottenere il voto.
+    """,
+    "pt": """
+    O governo anunciou ontem um novo plano para melhorar o transporte público nas principais cidades do país.
+    Segundo o ministro, as obras vão começar no próximo ano e devem durar pelo menos três anos.
+    Muitos moradores reclamam que os ônibus chegam sempre atrasados e que os trens estão sempre lotados.
+    Para fazer um bom bolo de cenoura você precisa de farinha, ovos, açúcar, óleo e três cenouras médias.
+    Primeiro bata as cenouras com os ovos no liquidificador, depois misture com a farinha numa tigela grande.
+    Olá João, estou escrevendo para confirmar a nossa reunião de quinta-feira às dez horas no escritório.
+    Se não puder vir, me avise o quanto antes para que possamos marcar outro dia que seja bom para todos.
+    A inteligência artificial está mudando a maneira como trabalhamos, estudamos e nos comunicamos.
+    No entanto, os especialistas alertam que ainda há muitos problemas a resolver antes de confiarmos nela.
+    Os cientistas descobriram que as abelhas conseguem reconhecer rostos humanos depois de um breve treinamento.
+    Essa descoberta pode nos ajudar a entender como funciona a memória em cérebros muito pequenos.
+    A nossa empresa oferece soluções para pequenos negócios que querem vender os seus produtos pela internet.
+    Você pode cancelar a sua assinatura a qualquer momento nas configurações da sua conta.
+    A história da cidade remonta à época romana, quando era um importante porto comercial.
+    Hoje em dia ela é conhecida pelas suas praias, pela sua gastronomia e pela simpatia do seu povo.
+    Quando foi a última vez que você leu um livro que realmente o fez pensar?
+    Os alunos devem entregar o trabalho final até o dia quinze de junho para receber a nota.
+    """,
+}
@@ -0,0 +1,229 @@
+"""
+Prefetch especulativo de acciones de IA hacia el cache de resultados.
+
+La extensión manda la selección apenas el usuario la hace (antes de que
+elija una acción) y el servidor calcula las acciones más probables
+(`summarize` por defecto) con la menor prioridad del scheduler. Al hacer
+click, la acción sale del cache o se une al prefetch que sigue en curso.
+
+Reglas:
+- Solo arranca con capacidad ociosa: cola vacía y menos de
+  `ai_prefetch_max_utilization` del límite de concurrencia en uso. Nunca
+  espera en la cola.
+- Si un request real tiene que esperar lugar, se cancela el prefetch más
+  reciente no reclamado (preempted).
+- Por usuario: como mucho `ai_prefetch_max_per_user` en curso y
+  `ai_prefetch_per_user_per_minute` por minuto. Una selección nueva cancela
+  los prefetch de la anterior (superseded).
+- No cobra al calcular: el consumo se carga a la reserva del request que
+  usa el resultado. Los no usados dentro de `ai_prefetch_ttl_seconds`
+  cuentan como desperdicio (con sus tokens).
+"""
+import asyncio
+import logging
+import time
+from collections import Counter, OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from app.core.config import settings
+from app.core import metrics
+from app.services.ai_scheduler import AIScheduler
+from app.services.result_cache import ResultCache
+from app.services.usage_ledger import Reservation, estimate_tokens, usage_ledger
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PrefetchEntry:
+    key: bytes
+    owner: Optional[str]
+    action: str
+    chars_in: int
+    task: Optional[asyncio.Task] = None
+    claimed: bool = False
+    tokens_out: int = 0
+    ready_at: float = 0.0
+
+    @property
+    def live(self) -> bool:
+        """En curso y no cancelado (uno cancelado sigue en la tabla hasta que termina)"""
+        return self.task is not None and not self.task.done() and not self.task.cancelling()
+
+
+class Prefetcher:
+    """Prefetch en curso y listos (sin usar todavía), con sus resultados"""
+
+    def __init__(
+        self,
+        run: Callable[[Dict[str, Any]], Awaitable[Any]],
+        cache: ResultCache,
+        scheduler: AIScheduler,
+    ):
+        self._run = run
+        self.cache = cache
+        self.scheduler = scheduler
+        self.outcomes: Counter = Counter()
+        self.wasted_tokens = 0
+        self._running: "OrderedDict[bytes, PrefetchEntry]" = OrderedDict()
+        self._ready: "OrderedDict[bytes, PrefetchEntry]" = OrderedDict()
+        self._started: Dict[str, Deque[float]] = {}
+        scheduler.on_pressure = self.yield_capacity
+
+    # ---- hints ----
+
+    def hint(self, owner: Optional[str], requests: List[Dict[str, Any]]) -> Dict[str, str]:
+        """
+        Arranca el prefetch de cada request (acción sobre la selección).
+        Devuelve el resultado por acción: started, running, cached, o el
+        motivo por el que no arrancó (no_capacity, user_limit, budget).
+        """
+        self._expire()
+        keys = {ResultCache.key(r["action"], r["payload"], r["text"]): r for r in requests}
+        # Selección nueva: lo que siga en curso de la anterior ya no sirve
+        for entry in [e for e in self._running.values() if e.owner == owner and e.key not in keys and not e.claimed]:
+            self._cancel(entry, "superseded")
+
+        outcomes: Dict[str, str] = {}
+        for key, request in keys.items():
+            outcome = self._start(owner, key, request)
+            outcomes[request["action"]] = outcome
+            if outcome not in ("started", "running"):
+                self._record(request["action"], outcome)
+        return outcomes
+
+    def _start(self, owner: Optional[str], key: bytes, request: Dict[str, Any]) -> str:
+        action, text = request["action"], request["text"]
+        if key in self._running and self._running[key].live:
+            return "running"
+        if self.cache.peek(action, request["payload"], text):
+            return "cached"
+        if sum(1 for e in self._running.values() if e.live) >= settings.ai_prefetch_max_inflight \
+                or not self.scheduler.has_spare(settings.ai_prefetch_max_utilization):
+            return "no_capacity"
+        if not self._allow(owner):
+            return "user_limit"
+        if owner is not None and usage_ledger.snapshot(owner)["remaining"] < estimate_tokens(len(text)) * 2:
+            # No adelantar trabajo que el usuario no podría pagar al usarlo
+            return "budget"
+
+        entry = PrefetchEntry(key, owner, action, len(text))
+        entry.task = asyncio.create_task(self._prefetch(entry, request))
+        self._running[key] = entry
+        if owner is not None:
+            self._started.setdefault(owner, deque()).append(time.monotonic())
+        self._record(action, "started")
+        return "started"
+
+    def _allow(self, owner: Optional[str]) -> bool:
+        if owner is None:
+            return True
+        if sum(1 for e in self._running.values() if e.owner == owner and e.live) >= settings.ai_prefetch_max_per_user:
+            return False
+        started = self._started.get(owner)
+        if started is None:
+            return True
+        horizon = time.monotonic() - 60
+        while started and started[0] < horizon:
+            started.popleft()
+        if not started:
+            del self._started[owner]
+            return True
+        return len(started) < settings.ai_prefetch_per_user_per_minute
+
+    async def _prefetch(self, entry: PrefetchEntry, request: Dict[str, Any]):
+        try:
+            result = await self._run(request)
+        except asyncio.CancelledError as e:
+            reason = e.args[0] if e.args else "cancelled"
+            self._record(entry.action, reason)
+            raise
+        except Exception as e:
+            # Sin re-lanzar: quien se haya unido lo calcula por su cuenta
+            self._record(entry.action, "error")
+            logger.debug(f"Prefetch de {entry.action} sin resultado: {e}")
+            return None
+        finally:
+            if self._running.get(entry.key) is entry:
+                del self._running[entry.key]
+        self.cache.put(entry.action, request["payload"], request["text"], result)
+        entry.tokens_out = estimate_tokens(len(str(result)))
+        entry.ready_at = time.monotonic()
+        if entry.claimed:
+            # Un request real ya lo estaba esperando
+            self._record(entry.action, "joined")
+        else:
+            self._ready[entry.key] = entry
+        return result
+
+    # ---- uso por requests reales ----
+
+    def consume(self, key: bytes, reservation: Optional[Reservation]) -> bool:
+        """Acierto de cache sobre un prefetch: se cobra al request que lo usa"""
+        entry = self._ready.pop(key, None)
+        if entry is None:
+            return False
+        usage_ledger.record(reservation, entry.action, estimate_tokens(entry.chars_in), entry.tokens_out)
+        self._record(entry.action, "hit")
+        return True
+
+    def pending(self, key: bytes) -> Optional[asyncio.Task]:
+        """
+        Prefetch en curso para la misma acción y texto: el request se une en
+        vez de repetir la llamada, y desde ahí ya no se cancela
+        """
+        entry = self._running.get(key)
+        if entry is None or not entry.live:
+            return None
+        entry.claimed = True
+        return entry.task
+
+    @staticmethod
+    def charge_joined(action: str, chars_in: int, result: Any, reservation: Optional[Reservation]):
+        usage_ledger.record(reservation, action, estimate_tokens(chars_in), estimate_tokens(len(str(result))))
+
+    # ---- cancelación y desperdicio ----
+
+    def yield_capacity(self):
+        """Un request real espera lugar: se cancela el prefetch más reciente no reclamado"""
+        for entry in reversed(self._running.values()):
+            if entry.live and not entry.claimed:
+                self._cancel(entry, "preempted")
+                return
+
+    def cancel_owner(self, owner: Optional[str]) -> int:
+        entries = [e for e in self._running.values() if e.owner == owner and e.live and not e.claimed]
+        for entry in entries:
+            self._cancel(entry, "superseded")
+        return len(entries)
+
+    def _cancel(self, entry: PrefetchEntry, reason: str):
+        if entry.task is not None and not entry.task.done():
+            entry.task.cancel(reason)
+
+    def _expire(self):
+        horizon = time.monotonic() - settings.ai_prefetch_ttl_seconds
+        while self._ready:
+            entry = next(iter(self._ready.values()))
+            if entry.ready_at > horizon:
+                break
+            del self._ready[entry.key]
+            self.wasted_tokens += estimate_tokens(entry.chars_in) + entry.tokens_out
+            self._record(entry.action, "wasted")
+
+    def _record(self, action: str, outcome: str):
+        self.outcomes[outcome] += 1
+        metrics.AI_PREFETCH.labels(metrics.action_label(action), outcome).inc()
+
+    def stats(self) -> Dict[str, object]:
+        self._expire()
+        used = self.outcomes["hit"] + self.outcomes["joined"]
+        finished = used + self.outcomes["wasted"]
+        return {
+            "running": sum(1 for e in self._running.values() if e.live),
+            "ready": len(self._ready),
+            "outcomes": dict(self.outcomes),
+            "hit_rate": round(used / finished, 3) if finished else None,
+            "wasted_tokens": self.wasted_tokens,
+        }
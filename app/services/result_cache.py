@@ -0,0 +1,228 @@
+"""
+Cache de resultados de IA en memoria (por proceso).
+
+Dos capas:
+- Exacta: hash de (acción, payload, texto con espacios colapsados). No se
+  ignoran mayúsculas ni números: una traducción o un X-ray de "$500" no
+  sirve para "$900".
+- Casi-duplicados (solo acciones configuradas, ej. summarize/explain):
+  SimHash de 64 bits sobre tokens y shingles del texto normalizado, indexado
+  con LSH por bandas. Con distancia de Hamming máxima d y d+1 bandas, dos
+  fingerprints a distancia <= d comparten al menos una banda (palomar), así
+  que la búsqueda solo compara contra los candidatos de las mismas bandas.
+
+Los casi-aciertos se auditan por muestreo: se recalcula el resultado real y
+se compara con el reutilizado para medir la tasa de reutilización errónea.
+"""
+import hashlib
+import re
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.core import metrics
+
+_TOKEN = re.compile(r"\w+")
+_DIGITS = re.compile(r"\d+")
+_MASK64 = (1 << 64) - 1
+
+
+def normalize_text(text: str) -> str:
+    """Minúsculas, espacios colapsados y números enmascarados (fechas, horas, contadores)"""
+    return " ".join(_DIGITS.sub("0", text.lower()).split())
+
+
+def _hash64(feature: str) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def simhash(text: str, shingle: int = 3) -> int:
+    """SimHash de 64 bits sobre palabras y shingles de `shingle` palabras"""
+    tokens = _TOKEN.findall(normalize_text(text))
+    features: Counter = Counter(tokens)
+    features.update(" ".join(tokens[i:i + shingle]) for i in range(len(tokens) - shingle + 1))
+    weights = [0] * 64
+    for feature, count in features.items():
+        h = _hash64(feature)
+        for bit in range(64):
+            weights[bit] += count if (h >> bit) & 1 else -count
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming(a: int, b: int) -> int:
+    return bin((a ^ b) & _MASK64).count("1")
+
+
+@dataclass
+class CacheEntry:
+    key: bytes
+    action: str
+    payload: Optional[str]
+    result: Any
+    created: float
+    fingerprint: Optional[int] = None
+    length: int = 0
+
+
+class ResultCache:
+    """LRU con TTL y capa opcional de casi-duplicados por acción"""
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float,
+        near_actions: Iterable[str] = (),
+        near_threshold: float = 0.95,
+        audit_min_overlap: float = 0.5,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.near_actions = frozenset(near_actions)
+        self.near_threshold = near_threshold
+        self.audit_min_overlap = audit_min_overlap
+        self.max_distance = int((1.0 - near_threshold) * 64)
+        self._bands = self.max_distance + 1
+        self._band_bits = 64 // self._bands
+        self._entries: "OrderedDict[bytes, CacheEntry]" = OrderedDict()
+        self._index: List[Dict[int, Set[bytes]]] = [{} for _ in range(self._bands)]
+        self.lookups: Counter = Counter()
+        self.audits: Counter = Counter()
+
+    # ---- claves ----
+
+    @staticmethod
+    def key(action: str, payload: Optional[str], text: str) -> bytes:
+        raw = f"{action}\x00{payload or ''}\x00{' '.join(text.split())}"
+        return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).digest()
+
+    def _band_values(self, fingerprint: int) -> List[int]:
+        mask = (1 << self._band_bits) - 1
+        return [(fingerprint >> (i * self._band_bits)) & mask for i in range(self._bands)]
+
+    # ---- lectura ----
+
+    def get(self, action: str, payload: Optional[str], text: str) -> Tuple[Optional[Any], str, Optional[bytes]]:
+        """
+        Busca un resultado reutilizable.
+        Devuelve (resultado, "exact" | "near" | "miss", clave de la entrada
+        usada); en un casi-acierto la clave es la del texto original.
+        """
+        entry = self._get_fresh(self.key(action, payload, text))
+        if entry is not None:
+            return self._hit(entry, action, "exact")
+
+        if action in self.near_actions:
+            entry = self._near(action, payload, text)
+            if entry is not None:
+                return self._hit(entry, action, "near")
+
+        self.lookups[(action, "miss")] += 1
+        metrics.AI_CACHE_LOOKUPS.labels(action, "miss").inc()
+        return None, "miss", None
+
+    def peek(self, action: str, payload: Optional[str], text: str) -> bool:
+        """Hay resultado exacto vigente (sin contar como búsqueda ni tocar el LRU)"""
+        return self._get_fresh(self.key(action, payload, text)) is not None
+
+    def _hit(self, entry: CacheEntry, action: str, kind: str) -> Tuple[Any, str, bytes]:
+        self._entries.move_to_end(entry.key)
+        self.lookups[(action, kind)] += 1
+        metrics.AI_CACHE_LOOKUPS.labels(action, kind).inc()
+        return entry.result, kind, entry.key
+
+    def _get_fresh(self, key: bytes) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry.created > self.ttl_seconds:
+            self._remove(key)
+            return None
+        return entry
+
+    def _near(self, action: str, payload: Optional[str], text: str) -> Optional[CacheEntry]:
+        fingerprint = simhash(text)
+        length = len(text)
+        candidates: Set[bytes] = set()
+        for band, value in enumerate(self._band_values(fingerprint)):
+            candidates |= self._index[band].get(value, set())
+
+        best, best_distance = None, self.max_distance + 1
+        for key in candidates:
+            entry = self._get_fresh(key)
+            if entry is None or entry.action != action or entry.payload != payload:
+                continue
+            # Textos de largo muy distinto no se consideran casi-duplicados
+            if min(length, entry.length) < 0.8 * max(length, entry.length):
+                continue
+            distance = hamming(fingerprint, entry.fingerprint)
+            if distance < best_distance:
+                best, best_distance = entry, distance
+        return best
+
+    # ---- escritura ----
+
+    def put(self, action: str, payload: Optional[str], text: str, result: Any):
+        key = self.key(action, payload, text)
+        if key in self._entries:
+            self._remove(key)
+        entry = CacheEntry(key, action, payload, result, time.monotonic(), length=len(text))
+        if action in self.near_actions:
+            entry.fingerprint = simhash(text)
+            for band, value in enumerate(self._band_values(entry.fingerprint)):
+                self._index[band].setdefault(value, set()).add(key)
+        self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: bytes):
+        entry = self._entries.pop(key, None)
+        if entry is None or entry.fingerprint is None:
+            return
+        for band, value in enumerate(self._band_values(entry.fingerprint)):
+            bucket = self._index[band].get(value)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._index[band][value]
+
+    # ---- auditoría y estadísticas ----
+
+    def record_audit(self, action: str, reused: Any, fresh: Any) -> float:
+        """
+        Compara el resultado reutilizado con el recalculado (Jaccard de
+        vocabulario; dos respuestas del modelo nunca son idénticas). Por debajo
+        de `audit_min_overlap` cuenta como reutilización errónea.
+        Devuelve el solapamiento medido.
+        """
+        reused_tokens = set(_TOKEN.findall(normalize_text(str(reused))))
+        fresh_tokens = set(_TOKEN.findall(normalize_text(str(fresh))))
+        union = reused_tokens | fresh_tokens
+        overlap = len(reused_tokens & fresh_tokens) / len(union) if union else 1.0
+        outcome = "consistent" if overlap >= self.audit_min_overlap else "false_reuse"
+        self.audits[outcome] += 1
+        metrics.AI_CACHE_NEAR_AUDITS.labels(action, outcome).inc()
+        return overlap
+
+    def stats(self) -> Dict[str, Any]:
+        by_action: Dict[str, Dict[str, Any]] = {}
+        for (action, kind), count in self.lookups.items():
+            by_action.setdefault(action, {"exact": 0, "near": 0, "miss": 0})[kind] = count
+        for counts in by_action.values():
+            total = counts["exact"] + counts["near"] + counts["miss"]
+            counts["hit_rate"] = round((counts["exact"] + counts["near"]) / total, 4) if total else 0.0
+            counts["near_hit_rate"] = round(counts["near"] / total, 4) if total else 0.0
+        audited = self.audits["consistent"] + self.audits["false_reuse"]
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "near_threshold": self.near_threshold,
+            "actions": by_action,
+            "near_audits": {
+                "audited": audited,
+                "false_reuse": self.audits["false_reuse"],
+                "false_reuse_rate": round(self.audits["false_reuse"] / audited, 4) if audited else 0.0,
+            },
+        }
@@ -0,0 +1,98 @@
+"""
+Memoria de traducción a nivel de segmento.
+
+El texto se parte en oraciones/líneas; cada segmento se busca por
+(hash del segmento, idioma destino) en un LRU acotado. Solo los segmentos
+nuevos van a Gemini (en un único prompt por lotes) y la salida se rearma en
+el orden original conservando los separadores.
+"""
+import hashlib
+import re
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from app.core import metrics
+
+# Fin de oración (. ! ? …) seguido de espacios, o saltos de línea; el grupo
+# captura el separador para poder rearmar el texto tal cual
+_SEGMENT_BOUNDARY = re.compile(r"((?<=[.!?…])\s+|\s*\n\s*)")
+
+
+def split_segments(text: str) -> Tuple[List[str], List[str]]:
+    """Devuelve (segmentos, separadores); len(separadores) == len(segmentos) - 1"""
+    parts = _SEGMENT_BOUNDARY.split(text)
+    return parts[0::2], parts[1::2]
+
+
+def join_segments(segments: List[str], separators: List[str]) -> str:
+    out = [segments[0]]
+    for separator, segment in zip(separators, segments[1:]):
+        out.append(separator)
+        out.append(segment)
+    return "".join(out)
+
+
+def needs_translation(segment: str) -> bool:
+    """Segmentos vacíos o sin letras (números, viñetas) se copian tal cual"""
+    return any(char.isalpha() for char in segment)
+
+
+class TranslationMemory:
+    """LRU acotado de traducciones por (segmento, idioma destino)"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[bytes, str]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(segment: str, language: str) -> bytes:
+        return hashlib.blake2b(f"{language}\x00{segment}".encode("utf-8"), digest_size=16).digest()
+
+    def get(self, segment: str, language: str) -> Optional[str]:
+        key = self._key(segment, language)
+        translation = self._entries.get(key)
+        if translation is None:
+            self.misses += 1
+            metrics.TRANSLATION_SEGMENTS.labels("miss").inc()
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        metrics.TRANSLATION_SEGMENTS.labels("hit").inc()
+        return translation
+
+    def put(self, segment: str, language: str, translation: str):
+        key = self._key(segment, language)
+        self._entries[key] = translation
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def lookup(self, segments: List[str], language: str) -> Tuple[Dict[int, str], List[str]]:
+        """
+        Resuelve lo que se pueda desde memoria.
+        Devuelve ({índice: traducción}, segmentos únicos pendientes en orden de aparición).
+        """
+        resolved: Dict[int, str] = {}
+        pending: Dict[str, None] = {}
+        for i, segment in enumerate(segments):
+            if not needs_translation(segment):
+                resolved[i] = segment
+                continue
+            translation = self.get(segment, language)
+            if translation is not None:
+                resolved[i] = translation
+            else:
+                pending[segment] = None
+        return resolved, list(pending)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,243 @@
+"""
+Ledger de uso de IA por usuario con cuotas ponderadas por costo.
+
+Cada request reserva antes de llamar a Gemini una estimación de tokens
+(entrada + salida esperada según la acción) contra una ventana deslizante
+en memoria; al terminar se liquida con el uso real (o se devuelve si falló
+o salió del cache). Los consumos reales se acumulan y se persisten por lotes
+en Supabase (tabla `ai_usage`) desde una tarea de fondo.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core import metrics
+from app.services.ai_resilience import AIError
+
+logger = logging.getLogger(__name__)
+
+USAGE_TABLE = "ai_usage"
+
+# Tamaño de cada bucket de la ventana deslizante (segundos)
+_BUCKET_SECONDS = 60
+
+
+class AIBudgetExceededError(AIError):
+    """El usuario agotó su presupuesto de tokens en la ventana"""
+    kind = "budget"
+    status_code = 429
+    trips_breaker = False
+
+    def __init__(self, retry_after: int):
+        super().__init__("Presupuesto de uso de IA agotado. Intente más tarde.", retry_after)
+
+
+def budget_headers(snapshot: Dict[str, int]) -> Dict[str, str]:
+    """Headers con el presupuesto restante de la ventana"""
+    return {
+        "X-AI-Budget-Limit": str(snapshot["limit"]),
+        "X-AI-Budget-Remaining": str(snapshot["remaining"]),
+        "X-AI-Budget-Reset": str(snapshot["reset"]),
+    }
+
+
+def estimate_tokens(chars: int) -> int:
+    return max(1, -(-chars // settings.ai_chars_per_token))
+
+
+def estimate_cost(action: str, chars_in: int) -> int:
+    """Tokens de entrada más la salida esperada de la acción (ej. xray genera más de lo que recibe)"""
+    tokens_in = estimate_tokens(chars_in)
+    ratio = settings.ai_output_token_ratio.get(action, 1.0)
+    return tokens_in + int(tokens_in * ratio)
+
+
+def usage_key(subject: Optional[str], client_ip: Optional[str]) -> Optional[str]:
+    """
+    `sub` de un token verificado o, si no hay, la IP del cliente. Nunca el
+    `user_id` del request: lo elige el cliente y no está autenticado
+    """
+    if subject:
+        return f"user:{subject}"
+    if client_ip:
+        return f"ip:{client_ip}"
+    return None
+
+
+@dataclass
+class Reservation:
+    """Tokens reservados por un request; `used` acumula el consumo real"""
+    key: Optional[str]
+    estimated: int
+    used: int = 0
+    settled: bool = False
+    bucket: int = 0
+
+
+class UsageLedger:
+    """Ventanas deslizantes por usuario (buckets de 1 minuto) y uso pendiente de persistir"""
+
+    def __init__(self, limit: int, window_seconds: int):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self._windows: Dict[str, Deque[List[int]]] = {}
+        self._pending: Dict[Tuple[str, str], Dict[str, int]] = {}
+        self._pending_since: Optional[datetime] = None
+        self._next_prune = 0.0
+
+    # ---- ventana deslizante ----
+
+    def _window(self, key: str, now: float) -> Deque[List[int]]:
+        window = self._windows.get(key)
+        if window is None:
+            window = self._windows[key] = deque()
+        horizon = int(now) - self.window_seconds
+        while window and window[0][0] <= horizon:
+            window.popleft()
+        return window
+
+    def _add(self, key: str, tokens: int, now: float) -> int:
+        """Suma `tokens` al bucket de `now` y devuelve ese bucket"""
+        window = self._window(key, now)
+        bucket = int(now) - int(now) % _BUCKET_SECONDS
+        if window and window[-1][0] == bucket:
+            window[-1][1] += tokens
+        else:
+            window.append([bucket, tokens])
+        return bucket
+
+    def used(self, key: str, now: Optional[float] = None) -> int:
+        return sum(tokens for _, tokens in self._window(key, now or time.time()))
+
+    def snapshot(self, key: Optional[str]) -> Dict[str, int]:
+        """Presupuesto restante y segundos hasta que se libere el bucket más viejo"""
+        if key is None:
+            return {"limit": self.limit, "remaining": self.limit, "reset": 0}
+        now = time.time()
+        window = self._window(key, now)
+        used = sum(tokens for _, tokens in window)
+        reset = int(window[0][0] + self.window_seconds - now) + 1 if window else 0
+        return {"limit": self.limit, "remaining": max(0, self.limit - used), "reset": max(0, reset)}
+
+    # ---- reservas ----
+
+    def reserve(self, key: Optional[str], estimated: int) -> Reservation:
+        """Reserva `estimated` tokens o lanza AIBudgetExceededError"""
+        reservation = Reservation(key, estimated)
+        if key is None:
+            return reservation
+        now = time.time()
+        if now >= self._next_prune:
+            self.prune(now)
+        if self.used(key, now) + estimated > self.limit:
+            metrics.AI_BUDGET_REJECTIONS.inc()
+            raise AIBudgetExceededError(retry_after=max(1, self.snapshot(key)["reset"]))
+        reservation.bucket = self._add(key, estimated, now)
+        return reservation
+
+    def record(self, reservation: Optional[Reservation], action: str, tokens_in: int, tokens_out: int):
+        """Registra el consumo real de una llamada a Gemini dentro de la reserva"""
+        if reservation is None or reservation.key is None:
+            return
+        reservation.used += tokens_in + tokens_out
+        entry = self._pending.setdefault(
+            (reservation.key, action), {"requests": 0, "tokens_in": 0, "tokens_out": 0}
+        )
+        entry["requests"] += 1
+        entry["tokens_in"] += tokens_in
+        entry["tokens_out"] += tokens_out
+        if self._pending_since is None:
+            self._pending_since = datetime.now(timezone.utc)
+        metrics.AI_TOKENS_CHARGED.labels(metrics.action_label(action)).inc(tokens_in + tokens_out)
+
+    def settle(self, reservation: Reservation):
+        """
+        Ajusta la estimación al uso real en el mismo bucket donde se reservó
+        (idempotente). Si ese bucket ya salió de la ventana, la corrección se
+        descarta: la reserva ya no cuenta.
+        """
+        if reservation.settled or reservation.key is None:
+            return
+        reservation.settled = True
+        delta = reservation.used - reservation.estimated
+        if not delta:
+            return
+        for entry in reversed(self._window(reservation.key, time.time())):
+            if entry[0] == reservation.bucket:
+                entry[1] = max(0, entry[1] + delta)
+                return
+
+    # ---- persistencia ----
+
+    def drain(self) -> List[Dict[str, Any]]:
+        """Saca el uso pendiente como filas para `ai_usage`"""
+        if not self._pending:
+            return []
+        period_start = (self._pending_since or datetime.now(timezone.utc)).isoformat()
+        period_end = datetime.now(timezone.utc).isoformat()
+        rows = [
+            {"user_key": key, "action": action, "period_start": period_start, "period_end": period_end, **counts}
+            for (key, action), counts in self._pending.items()
+        ]
+        self._pending = {}
+        self._pending_since = None
+        return rows
+
+    def restore(self, rows: List[Dict[str, Any]]):
+        """Devuelve filas no persistidas a pendientes (si falló el flush)"""
+        for row in rows:
+            entry = self._pending.setdefault(
+                (row["user_key"], row["action"]), {"requests": 0, "tokens_in": 0, "tokens_out": 0}
+            )
+            for field in ("requests", "tokens_in", "tokens_out"):
+                entry[field] += row[field]
+        if rows:
+            restored_since = datetime.fromisoformat(rows[0]["period_start"])
+            if self._pending_since is None or restored_since < self._pending_since:
+                self._pending_since = restored_since
+
+    def prune(self, now: Optional[float] = None):
+        """
+        Descarta ventanas de usuarios inactivos. Corre desde reserve() como
+        mucho una vez por bucket, con o sin persistencia habilitada
+        """
+        now = now or time.time()
+        self._next_prune = now + _BUCKET_SECONDS
+        for key in [k for k, w in self._windows.items() if not self._window(k, now)]:
+            del self._windows[key]
+
+    async def flush(self) -> int:
+        """Persiste el uso pendiente en un solo insert; devuelve filas escritas"""
+        # Import diferido: app.db conecta a Supabase al importarse, y el ledger
+        # se importa desde ai_service (benchmarks, herramientas sin red)
+        from app.db import DatabaseError, db_manager, deadline_budget, run_query
+
+        rows = self.drain()
+        if not rows:
+            return 0
+        try:
+            with deadline_budget():
+                await run_query(db_manager.get_table(USAGE_TABLE).insert(rows), "insert_usage", idempotent=False)
+        except DatabaseError as e:
+            logger.warning(f"No se pudo persistir uso de IA ({len(rows)} filas): {e}")
+            self.restore(rows)
+            return 0
+        return len(rows)
+
+    async def run_flusher(self):
+        """Tarea de fondo: flush periódico hasta ser cancelada (flush final al salir)"""
+        try:
+            while True:
+                await asyncio.sleep(settings.ai_usage_flush_seconds)
+                await self.flush()
+        except asyncio.CancelledError:
+            await self.flush()
+            raise
+
+
+usage_ledger = UsageLedger(settings.ai_budget_tokens, settings.ai_budget_window_seconds)
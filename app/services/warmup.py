@@ -0,0 +1,132 @@
+"""
+Calentamiento al arrancar, en una tarea de fondo del lifespan.
+
+Los primeros requests después de un deploy pagaban el handshake TLS con
+Supabase y Gemini, la primera carga de email-validator y los caches vacíos.
+Los pasos corren en paralelo con un tope total de `warmup_timeout_seconds`;
+un paso que falla o no termina a tiempo se registra y queda frío solo lo de
+ese paso. El servidor acepta conexiones desde el principio (`/health`
+responde); `GET /ready` da 503 hasta que termina y después devuelve la
+duración de cada paso, así el balanceador no manda tráfico antes.
+
+Pasos:
+- supabase: prueba la conexión del primario (la del import ya pudo cerrarse
+  por keep-alive) y abre la de la réplica si hay.
+- waitlist_stats: las lecturas de `/waitlist/stats` (pool de PostgREST en
+  el endpoint de lectura).
+- gemini: un GET del modelo, que abre el pool del cliente async. No genera
+  ni consume cuota; un error HTTP igual deja la conexión abierta.
+- hot_paths: una pasada por validación de email y schemas, sanitización,
+  prompts, JWT, detector de idioma y serialización.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core import metrics
+from app.core.responses import dumps
+from app.core.security import security
+from app.db import db_manager
+from app.schemas.ai import AIProcessRequest
+from app.schemas.auth import WaitlistUserCreate
+from app.services.ai_service import build_prompt, client
+from app.services.auth_service import auth_service
+from app.services.language_detector import language_detector
+
+logger = logging.getLogger(__name__)
+
+_SAMPLE_TEXT = "La inteligencia artificial está cambiando la forma en que trabajamos y estudiamos."
+
+
+async def _supabase():
+    if not await asyncio.to_thread(db_manager.test_connection):
+        raise ConnectionError("Supabase no respondió al test de conexión")
+    if db_manager.replica is not None:
+        await asyncio.to_thread(lambda: db_manager.replica.client)
+
+
+async def _waitlist_stats():
+    await auth_service.get_waitlist_stats()
+
+
+async def _gemini():
+    try:
+        await client.aio.models.get(model=settings.ai_model)
+    except Exception as e:
+        # 4xx/5xx: la conexión ya quedó en el pool. Sin respuesta HTTP sí es falla
+        if getattr(e, "code", None) is None:
+            raise
+
+
+async def _hot_paths():
+    security.validate_email("warmup@example.com")
+    WaitlistUserCreate(
+        email="warmup@example.com", name="Warmup", preferred_languages=["es"], interest_reason="productivity"
+    )
+    AIProcessRequest(action="resumir", userText=_SAMPLE_TEXT)
+    security.sanitize_input(_SAMPLE_TEXT)
+    security.verify_token(security.create_access_token({"sub": "warmup"}))
+    for action, payload in (("summarize", None), ("explain", None), ("rewrite", "formal"),
+                            ("translate", "en"), ("xray", None)):
+        build_prompt(action, _SAMPLE_TEXT, payload)
+    language_detector.detect(_SAMPLE_TEXT)
+    dumps({"success": True, "result": _SAMPLE_TEXT, "metadata": {"chars_processed": len(_SAMPLE_TEXT)}})
+
+
+class Warmup:
+    """Pasos de calentamiento y su resultado (para /ready)"""
+
+    def __init__(self, steps: List[Tuple[str, Callable[[], Awaitable[Any]]]]):
+        self.steps = steps
+        self.done = False
+        self.duration: Optional[float] = None
+        self.results: Dict[str, Dict[str, Any]] = {}
+
+    async def run(self, timeout: float):
+        start = time.perf_counter()
+        tasks = {name: asyncio.create_task(self._step(name, step)) for name, step in self.steps}
+        try:
+            _, pending = await asyncio.wait(tasks.values(), timeout=timeout)
+        except asyncio.CancelledError:
+            # Apagado durante el warmup: no dejar pasos corriendo
+            for task in tasks.values():
+                task.cancel()
+            raise
+        for name, task in tasks.items():
+            if task in pending:
+                task.cancel()
+                self.results[name] = {"ok": False, "error": "timeout"}
+        self.duration = time.perf_counter() - start
+        self.done = True
+        metrics.WARMUP_DURATION.set(self.duration)
+        failed = [name for name, result in self.results.items() if not result["ok"]]
+        logger.info(
+            f"Warmup terminado en {self.duration * 1000:.0f} ms" + (f" (fallaron: {', '.join(failed)})" if failed else ""),
+            extra={"duration_ms": round(self.duration * 1000, 1), "failed_steps": failed}
+        )
+
+    async def _step(self, name: str, step: Callable[[], Awaitable[Any]]):
+        start = time.perf_counter()
+        try:
+            await step()
+            self.results[name] = {"ok": True, "ms": round((time.perf_counter() - start) * 1000, 1)}
+        except Exception as e:
+            self.results[name] = {"ok": False, "ms": round((time.perf_counter() - start) * 1000, 1), "error": type(e).__name__}
+            logger.warning(f"Warmup: falló el paso {name}: {e!r}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "done": self.done,
+            "duration_ms": round(self.duration * 1000, 1) if self.duration is not None else None,
+            "steps": self.results,
+        }
+
+
+warmup = Warmup([
+    ("supabase", _supabase),
+    ("waitlist_stats", _waitlist_stats),
+    ("gemini", _gemini),
+    ("hot_paths", _hot_paths),
+])
@@ -0,0 +1,326 @@
+"""
+Stand-in local de la API de Gemini (generateContent / streamGenerateContent)
+con simulación de saturación.
+
+Implementa lo que usa el backend vía google-genai: respuestas de texto,
+salida JSON restringida a `responseSchema` (genera un valor mínimo válido;
+los arreglos de strings devuelven el arreglo del prompt traducido "a la
+stub"), streaming SSE y context caching explícito (`cachedContents`: el
+contenido guardado se antepone al prompt de los requests que lo referencian).
+Permite probar breaker, deadlines, scheduler, el limitador adaptativo y las
+sesiones de documento sin red ni cuota real:
+
+    python -m app.testing.gemini_stub --port 8089 --capacity 4 --latency 0.3
+    GEMINI_BASE_URL=http://127.0.0.1:8089 uvicorn app.main:app
+
+Con más de `capacity` requests en curso la latencia crece linealmente con la
+carga y, pasado `capacity * overload_factor`, responde 429
+RESOURCE_EXHAUSTED (como la cuota real). `rpm` agrega un límite de requests
+por minuto. Se reconfigura en caliente con `POST /__throttle`.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Deque, Dict, Optional
+from urllib.parse import urlsplit
+
+_MODEL_PATH = re.compile(r"^/v1beta/models/(?P<model>[^:/]+):(?P<method>generateContent|streamGenerateContent)$")
+_CACHE_PATH = re.compile(r"^/v1beta/(?P<name>cachedContents/[^/]+)$")
+_JSON_ARRAY = re.compile(r"\[\s*\".*?\"\s*\]", re.S)
+
+
+@dataclass
+class ThrottlePlan:
+    """Comportamiento del upstream simulado"""
+    capacity: int = 8              # requests concurrentes sin degradación
+    overload_factor: float = 2.0   # por encima de capacity * factor → 429
+    latency: float = 0.2           # segundos por request sin carga
+    rpm: int = 0                   # requests por minuto (0 = sin límite)
+    error_rate: float = 0.0        # probabilidad de 503 UNAVAILABLE
+    stream_chunks: int = 4
+
+
+def _example(schema: Optional[Dict[str, Any]]) -> Any:
+    """Valor mínimo que cumple un Schema de Gemini (tipos en mayúsculas o minúsculas)"""
+    if not schema:
+        return ""
+    kind = str(schema.get("type", "STRING")).upper()
+    if kind == "OBJECT":
+        return {name: _example(prop) for name, prop in (schema.get("properties") or {}).items()}
+    if kind == "ARRAY":
+        return []
+    if kind in ("INTEGER", "NUMBER"):
+        return schema.get("minimum", 1)
+    if kind == "BOOLEAN":
+        return False
+    return ""
+
+
+class GeminiStub:
+    """Servidor Gemini en memoria corriendo en un hilo"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, plan: Optional[ThrottlePlan] = None):
+        self.plan = plan or ThrottlePlan()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.request_count = 0
+        self.throttled_count = 0
+        self.bytes_received = 0
+        self.prompt_chars = 0
+        self.cached_chars = 0
+        self.caches: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._recent: Deque[float] = deque()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "GeminiStub":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="gemini-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ---- simulación ----
+
+    def _admit(self) -> Optional[Dict[str, Any]]:
+        """Registra el request; devuelve el error a responder si se satura"""
+        now = time.monotonic()
+        with self._lock:
+            self.request_count += 1
+            while self._recent and now - self._recent[0] > 60:
+                self._recent.popleft()
+            over_rpm = self.plan.rpm and len(self._recent) >= self.plan.rpm
+            overloaded = self.in_flight >= self.plan.capacity * self.plan.overload_factor
+            if over_rpm or overloaded:
+                self.throttled_count += 1
+                return {"code": 429, "status": "RESOURCE_EXHAUSTED",
+                        "message": "Resource has been exhausted (e.g. check quota)."}
+            if self.plan.error_rate and random.random() < self.plan.error_rate:
+                return {"code": 503, "status": "UNAVAILABLE", "message": "The model is overloaded."}
+            self._recent.append(now)
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            load = self.in_flight
+        # La latencia crece con la carga por encima de la capacidad
+        time.sleep(self.plan.latency * max(1.0, load / max(1, self.plan.capacity)))
+        return None
+
+    def _done(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    @staticmethod
+    def _text(contents) -> str:
+        return " ".join(
+            part.get("text", "")
+            for content in contents or []
+            for part in content.get("parts", [])
+        )
+
+    def create_cache(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        name = f"cachedContents/{uuid.uuid4().hex[:12]}"
+        text = self._text(body.get("contents"))
+        ttl = float(str(body.get("ttl", "3600s")).rstrip("s"))
+        expire = time.time() + ttl
+        with self._lock:
+            self.caches[name] = {"text": text, "expires": expire}
+        return {
+            "name": name,
+            "model": body.get("model"),
+            "displayName": body.get("displayName", ""),
+            "expireTime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(expire)),
+            "usageMetadata": {"totalTokenCount": max(1, len(text) // 4)},
+        }
+
+    def cached_text(self, name: Optional[str]) -> Optional[str]:
+        """Texto del cache `name`, o None si no existe o venció"""
+        cache = self.caches.get(name or "")
+        if cache is None or cache["expires"] < time.time():
+            return None
+        return cache["text"]
+
+    def generate(self, model: str, body: Dict[str, Any]) -> str:
+        """Texto de la respuesta según el request"""
+        prompt = self._text(body.get("contents"))
+        with self._lock:
+            self.prompt_chars += len(prompt)
+        cached = self.cached_text(body.get("cachedContent"))
+        if cached is not None:
+            with self._lock:
+                self.cached_chars += len(cached)
+            prompt = f"{cached} {prompt}"
+        config = body.get("generationConfig") or {}
+        if config.get("responseMimeType") == "application/json":
+            schema = config.get("responseSchema") or config.get("responseJsonSchema")
+            if schema and str(schema.get("type", "")).upper() == "ARRAY":
+                match = _JSON_ARRAY.search(prompt)
+                items = json.loads(match.group(0)) if match else []
+                return json.dumps([f"[{model}] {item}" for item in items], ensure_ascii=False)
+            return json.dumps(_example(schema), ensure_ascii=False)
+        return f"[{model}] " + " ".join(prompt.split())[:200]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **asdict(self.plan),
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "request_count": self.request_count,
+            "throttled_count": self.throttled_count,
+            "bytes_received": self.bytes_received,
+            "prompt_chars": self.prompt_chars,
+            "cached_chars": self.cached_chars,
+            "caches": len(self.caches),
+        }
+
+    # ---- HTTP ----
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: Any):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            @staticmethod
+            def _response(text: str, model: str, final: bool = True, cached_tokens: int = 0) -> Dict[str, Any]:
+                candidate = {"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}
+                response = {"candidates": [candidate], "modelVersion": model}
+                if final:
+                    candidate["finishReason"] = "STOP"
+                    if cached_tokens:
+                        response["usageMetadata"] = {"cachedContentTokenCount": cached_tokens}
+                return response
+
+            def _not_found(self):
+                self._send(404, {"error": {"code": 404, "message": "not found", "status": "NOT_FOUND"}})
+
+            def do_GET(self):
+                path = urlsplit(self.path).path
+                if path == "/__throttle":
+                    return self._send(200, stub.snapshot())
+                match = _CACHE_PATH.match(path)
+                if match and stub.cached_text(match.group("name")) is not None:
+                    return self._send(200, {"name": match.group("name")})
+                self._not_found()
+
+            def do_DELETE(self):
+                match = _CACHE_PATH.match(urlsplit(self.path).path)
+                with stub._lock:
+                    found = match is not None and stub.caches.pop(match.group("name"), None) is not None
+                if not found:
+                    return self._not_found()
+                self._send(200, {})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length)
+                with stub._lock:
+                    stub.bytes_received += len(raw)
+                body = json.loads(raw or b"{}")
+                path = urlsplit(self.path).path
+                if path == "/__throttle":
+                    for key, value in body.items():
+                        setattr(stub.plan, key, value)
+                    return self._send(200, stub.snapshot())
+                if path == "/v1beta/cachedContents":
+                    return self._send(200, stub.create_cache(body))
+
+                match = _MODEL_PATH.match(path)
+                if match is None:
+                    return self._not_found()
+                if body.get("cachedContent") and stub.cached_text(body["cachedContent"]) is None:
+                    return self._send(403, {"error": {
+                        "code": 403, "status": "PERMISSION_DENIED",
+                        "message": "CachedContent not found (or permission denied)"
+                    }})
+                error = stub._admit()
+                if error is not None:
+                    return self._send(error["code"], {"error": error})
+                try:
+                    model = match.group("model")
+                    text = stub.generate(model, body)
+                    cached_tokens = len(stub.cached_text(body.get("cachedContent")) or "") // 4
+                    if match.group("method") == "generateContent":
+                        return self._send(200, self._response(text, model, cached_tokens=cached_tokens))
+                    self._stream(text, model)
+                finally:
+                    stub._done()
+
+            def _stream(self, text: str, model: str):
+                """SSE como `alt=sse`: una línea `data:` por chunk"""
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                chunks = max(1, stub.plan.stream_chunks)
+                size = max(1, -(-len(text) // chunks))
+                parts = [text[i:i + size] for i in range(0, len(text), size)] or [""]
+                try:
+                    for i, part in enumerate(parts):
+                        event = json.dumps(self._response(part, model, final=i == len(parts) - 1))
+                        data = f"data: {event}\r\n\r\n".encode()
+                        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                        self.wfile.flush()
+                        time.sleep(stub.plan.latency / chunks)
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # El cliente canceló el stream a mitad de camino
+                    self.close_connection = True
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in local de Gemini con simulación de saturación")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--capacity", type=int, default=8)
+    parser.add_argument("--overload-factor", type=float, default=2.0)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--rpm", type=int, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    plan = ThrottlePlan(args.capacity, args.overload_factor, args.latency, args.rpm, args.error_rate)
+    stub = GeminiStub(args.host, args.port, plan)
+    print(f"Gemini stub escuchando en {stub.url}")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
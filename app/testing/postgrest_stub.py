@@ -0,0 +1,227 @@
+"""
+Stand-in local de PostgREST (la API REST de Supabase) con inyección de fallas.
+
+Implementa el subconjunto que usa el backend: select con filtros
+(eq, neq, lt, lte, gt, gte, in), `count=exact`, `limit` e insert.
+Permite probar reintentos, deadlines y ruteo de lecturas sin red:
+
+    python -m app.testing.postgrest_stub --port 54321 --error-rate 0.2 --latency 0.05
+    SUPABASE_URL=http://127.0.0.1:54321 uvicorn app.main:app
+
+Las fallas se configuran al crear el stub o en caliente con
+`POST /__faults` ({"error_rate": 0.5, "error_status": 503, "latency": 0.2, "fail_next": 3}).
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+
+@dataclass
+class FaultPlan:
+    """Fallas a inyectar en cada request a /rest/v1"""
+    error_rate: float = 0.0    # probabilidad de responder `error_status`
+    error_status: int = 503
+    latency: float = 0.0       # segundos añadidos a cada respuesta
+    fail_next: int = 0         # las próximas N requests fallan siempre
+
+    def should_fail(self) -> bool:
+        if self.fail_next > 0:
+            self.fail_next -= 1
+            return True
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+
+def _coerce(value: str) -> Any:
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return value
+
+
+def _matches(row: Dict[str, Any], column: str, expression: str) -> bool:
+    op, _, raw = expression.partition(".")
+    current = row.get(column)
+    if op == "in":
+        options = [_coerce(v.strip('"')) for v in raw.strip("()").split(",")]
+        return current in options
+    expected = _coerce(raw)
+    if current is None:
+        return op == "neq"
+    try:
+        return {
+            "eq": lambda: current == expected,
+            "neq": lambda: current != expected,
+            "lt": lambda: current < expected,
+            "lte": lambda: current <= expected,
+            "gt": lambda: current > expected,
+            "gte": lambda: current >= expected,
+        }[op]()
+    except (KeyError, TypeError):
+        return False
+
+
+class PostgrestStub:
+    """Servidor PostgREST en memoria corriendo en un hilo"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, faults: Optional[FaultPlan] = None):
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self.faults = faults or FaultPlan()
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self._next_id: Dict[str, int] = {}
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "PostgrestStub":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="postgrest-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ---- datos ----
+
+    def insert(self, table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            rows = self.tables.setdefault(table, [])
+            if "id" not in row:
+                self._next_id[table] = self._next_id.get(table, 0) + 1
+                row = {"id": self._next_id[table], **row}
+            else:
+                self._next_id[table] = max(self._next_id.get(table, 0), int(row["id"]))
+            rows.append(row)
+            return row
+
+    def select(self, table: str, params: List[tuple]) -> Tuple[List[Dict[str, Any]], int]:
+        with self._lock:
+            rows = list(self.tables.get(table, []))
+        columns = "*"
+        limit = None
+        for key, value in params:
+            if key == "select":
+                columns = value
+            elif key == "limit":
+                limit = int(value)
+            elif key in ("offset", "order"):
+                continue
+            else:
+                rows = [r for r in rows if _matches(r, key, value)]
+        total = len(rows)
+        if limit is not None:
+            rows = rows[:limit]
+        if columns not in ("*", "count"):
+            wanted = [c.strip() for c in columns.split(",")]
+            rows = [{c: r.get(c) for c in wanted} for r in rows]
+        return rows, total
+
+    # ---- HTTP ----
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: Any = None, headers: Optional[Dict[str, str]] = None):
+                payload = b"" if body is None else json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(payload)
+
+            def _table(self) -> Optional[str]:
+                path = urlsplit(self.path).path
+                prefix = "/rest/v1/"
+                return path[len(prefix):] if path.startswith(prefix) else None
+
+            def _inject(self) -> bool:
+                stub.request_count += 1
+                if stub.faults.latency:
+                    time.sleep(stub.faults.latency)
+                if stub.faults.should_fail():
+                    self._send(stub.faults.error_status, {
+                        "message": "fault injected", "code": str(stub.faults.error_status),
+                        "hint": None, "details": None,
+                    })
+                    return True
+                return False
+
+            def do_GET(self):
+                table = self._table()
+                if table is None:
+                    return self._send(404, {"message": "not found", "code": "404", "hint": None, "details": None})
+                if self._inject():
+                    return
+                rows, total = stub.select(table, parse_qsl(urlsplit(self.path).query))
+                headers = {}
+                if "count=exact" in (self.headers.get("Prefer") or ""):
+                    end = max(len(rows) - 1, 0)
+                    headers["Content-Range"] = f"0-{end}/{total}" if rows else f"*/{total}"
+                self._send(200, rows, headers)
+
+            do_HEAD = do_GET
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"null")
+                if urlsplit(self.path).path == "/__faults":
+                    for key, value in (body or {}).items():
+                        setattr(stub.faults, key, value)
+                    return self._send(200, asdict(stub.faults))
+                table = self._table()
+                if table is None:
+                    return self._send(404, {"message": "not found", "code": "404", "hint": None, "details": None})
+                if self._inject():
+                    return
+                rows = body if isinstance(body, list) else [body]
+                inserted = [stub.insert(table, dict(r)) for r in rows]
+                self._send(201, inserted)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in local de PostgREST con inyección de fallas")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    stub = PostgrestStub(args.host, args.port, FaultPlan(args.error_rate, args.error_status, args.latency))
+    print(f"PostgREST stub escuchando en {stub.url}")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,468 @@
+"""
+Replay de tráfico capturado (app/core/capture.py) contra una instancia local.
+
+Reproduce la mezcla real de acciones, largos, idiomas y ráfagas: cada
+request sale en el mismo instante relativo que en la captura (dividido por
+`--speed`), sin esperar a que terminen los anteriores (carga abierta). Los
+textos se generan con el largo y el idioma capturados; el mismo fingerprint
+produce siempre el mismo texto, así que las repeticiones (y los aciertos de
+cache) se mantienen. Cada bucket de usuario pasa a ser `replay-<bucket>`
+(`sub` de un token firmado localmente, en HTTP y en el WebSocket), para que
+cuotas y límites por usuario se repartan igual que en producción.
+
+Sin `--url` levanta todo en local: los stand-ins de PostgREST y Gemini
+(`--gemini-latency`, `--gemini-capacity`) y uvicorn apuntando a ellos.
+
+    python -m app.testing.replay capture/traffic.jsonl.1 capture/traffic.jsonl --speed 4
+    python -m app.testing.replay capture/traffic.jsonl --url http://127.0.0.1:8000 --json report.json
+
+Al final imprime por ruta y acción: requests, errores, p50/p90/p99/máx de la
+latencia del replay y, para comparar, p50/p99 de la capturada. Las rutas con
+parámetros de path (documentos) no se reproducen: el id no está en la
+captura.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from app.services.language_samples import LANGUAGE_SAMPLES
+from app.testing.gemini_stub import GeminiStub, ThrottlePlan
+from app.testing.postgrest_stub import PostgrestStub
+
+_WORDS = {language: re.findall(r"[^\W\d_]+", text.lower()) for language, text in LANGUAGE_SAMPLES.items()}
+
+# Caracteres de los idiomas que el detector reconoce por script
+_SCRIPT_CHARS = {
+    "zh": (0x4E00, 0x4FFF),
+    "ja": (0x3041, 0x3096),
+    "ko": (0xAC00, 0xAEFF),
+    "ru": (0x0430, 0x044F),
+    "ar": (0x0627, 0x064A),
+}
+
+_WS_TERMINAL = ("done", "error", "cancelled")
+
+
+# =========================
+# Textos sintéticos
+# =========================
+
+def synthetic_text(description: Dict[str, Any]) -> str:
+    """Texto determinístico con el largo e idioma de `{"chars", "fp", "lang"}`"""
+    chars = description.get("chars", 0)
+    rng = random.Random(description.get("fp") or chars)
+    language = description.get("lang")
+    if language in _SCRIPT_CHARS:
+        start, end = _SCRIPT_CHARS[language]
+        words = ["".join(chr(rng.randint(start, end)) for _ in range(rng.randint(2, 5))) for _ in range(200)]
+    else:
+        words = _WORDS.get(language) or _WORDS["es"]
+
+    parts: List[str] = []
+    size = 0
+    sentence = 0
+    while size < chars:
+        word = rng.choice(words)
+        if sentence == 0:
+            word = word.capitalize()
+        sentence += 1
+        if sentence >= rng.randint(8, 16):
+            word += "."
+            sentence = 0
+        parts.append(word)
+        size += len(word) + 1
+    return " ".join(parts)[:chars].rstrip()
+
+
+def synthesize(value: Any) -> Any:
+    """Reemplaza cada texto anonimizado de los campos capturados"""
+    if isinstance(value, dict):
+        if "fp" in value and "chars" in value:
+            return synthetic_text(value)
+        return {k: synthesize(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [synthesize(v) for v in value]
+    return value
+
+
+# =========================
+# Captura
+# =========================
+
+def load(paths: List[str], routes: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """Registros de uno o más archivos (rotados incluidos), ordenados por tiempo"""
+    records = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if routes and not record.get("route", "").startswith(tuple(routes)):
+                    continue
+                records.append(record)
+    records.sort(key=lambda r: r["ts"])
+    return records
+
+
+def replayable(record: Dict[str, Any]) -> bool:
+    route = record.get("route", "")
+    return record.get("fields") is not None and route.startswith("/") and "{" not in route
+
+
+def group_key(record: Dict[str, Any]) -> Tuple[str, str]:
+    fields = record.get("fields") or {}
+    action = fields.get("action")
+    if not isinstance(action, str):
+        action = "-"
+    return f"{record['method']} {record['route']}", action
+
+
+def replay_user(record: Dict[str, Any]) -> Optional[str]:
+    return f"replay-{record['user']}" if record.get("user") is not None else None
+
+
+@lru_cache(maxsize=None)
+def replay_token(user: str) -> str:
+    """Token por bucket (las cuotas se cuentan por el `sub` verificado)"""
+    from app.core.security import security
+    return security.create_access_token({"sub": user})
+
+
+def is_error(status: Any) -> bool:
+    return status != "done" if isinstance(status, str) else status >= 400
+
+
+# =========================
+# Replay
+# =========================
+
+class Replayer:
+    """Reproduce los registros contra `url` respetando los tiempos relativos"""
+
+    def __init__(self, url: str, records: List[Dict[str, Any]], speed: float = 1.0,
+                 max_inflight: int = 256, timeout: float = 60.0):
+        self.url = url.rstrip("/")
+        self.records = records
+        self.speed = speed
+        self.timeout = timeout
+        self._inflight = asyncio.Semaphore(max_inflight)
+        self._connections: Dict[str, "_Channel"] = {}
+        self.results: List[Dict[str, Any]] = []
+
+    async def run(self) -> float:
+        """Devuelve la duración total del replay en segundos"""
+        remaining: Dict[str, int] = defaultdict(int)
+        for record in self.records:
+            if record.get("conn"):
+                remaining[record["conn"]] += 1
+
+        # Textos generados antes de arrancar: no cuentan en la latencia ni atrasan el scheduler
+        prepared = [(record, synthesize(record["fields"])) for record in self.records]
+        tasks = []
+        async with httpx.AsyncClient(base_url=self.url, timeout=self.timeout,
+                                     limits=httpx.Limits(max_connections=None)) as client:
+            await client.get("/api/ai/actions")
+            start = time.monotonic()
+            origin = self.records[0]["ts"] if self.records else 0.0
+            for record, fields in prepared:
+                due = start + (record["ts"] - origin) / self.speed
+                delay = due - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                await self._inflight.acquire()
+                late = max(0.0, time.monotonic() - due) * 1000
+                if record["kind"] == "ws":
+                    channel = self._connections.get(record["conn"])
+                    if channel is None:
+                        channel = self._connections[record["conn"]] = _Channel(self.url, replay_user(record), remaining[record["conn"]])
+                    coroutine = self._ws(channel, fields)
+                else:
+                    coroutine = self._http(client, record, fields)
+                tasks.append(asyncio.create_task(self._measure(record, coroutine, late)))
+            await asyncio.gather(*tasks)
+        return time.monotonic() - start
+
+    async def _measure(self, record: Dict[str, Any], coroutine, late: float):
+        started = time.perf_counter()
+        try:
+            status = await asyncio.wait_for(coroutine, self.timeout)
+        except asyncio.TimeoutError:
+            status = "timeout"
+        except Exception as e:
+            status = f"client_error:{type(e).__name__}"
+        finally:
+            self._inflight.release()
+        self.results.append({
+            "record": record,
+            "status": status,
+            "ms": (time.perf_counter() - started) * 1000,
+            "late_ms": late,
+        })
+
+    async def _http(self, client: httpx.AsyncClient, record: Dict[str, Any], fields: Dict[str, Any]) -> int:
+        user = replay_user(record)
+        params = {"token": replay_token(user)} if user else {}
+        if record["in"] == "query":
+            response = await client.request(record["method"], record["route"], params={**fields, **params})
+        else:
+            # Token en el body y en la query (batch lo lee de la query)
+            response = await client.request(record["method"], record["route"], params=params, json={**fields, **params})
+        return response.status_code
+
+    async def _ws(self, channel: "_Channel", message: Dict[str, Any]) -> str:
+        try:
+            return await channel.request(message)
+        finally:
+            channel.finished()
+
+
+class _Channel:
+    """Una conexión WebSocket de la captura, abierta al primer request"""
+
+    def __init__(self, url: str, user: Optional[str], expected: int):
+        from app.core.security import security
+        self.url = re.sub(r"^http", "ws", url) + "/api/ai/ws?token=" + security.create_access_token({"sub": user or "replay"})
+        self.expected = expected
+        self._socket = None
+        self._reader: Optional[asyncio.Task] = None
+        self._connecting: Optional[asyncio.Task] = None
+        self._waiting: Dict[str, asyncio.Future] = {}
+        self._next_id = 0
+
+    async def _connect(self):
+        import websockets
+        self._socket = await websockets.connect(self.url, max_size=None)
+        json.loads(await self._socket.recv())  # ready
+        self._reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        try:
+            async for raw in self._socket:
+                message = json.loads(raw)
+                if message.get("type") == "ping":
+                    await self._socket.send(json.dumps({"type": "pong"}))
+                    continue
+                future = self._waiting.get(str(message.get("id")))
+                if future is not None and not future.done() and message.get("type") in _WS_TERMINAL:
+                    status = message["type"]
+                    if status == "error":
+                        status = f"error:{message.get('error_type', 'other')}"
+                    future.set_result(status)
+        except Exception:
+            pass
+        finally:
+            for future in self._waiting.values():
+                if not future.done():
+                    future.set_result("disconnected")
+
+    async def request(self, message: Dict[str, Any]) -> str:
+        if self._connecting is None:
+            self._connecting = asyncio.create_task(self._connect())
+        await self._connecting
+        self._next_id += 1
+        request_id = str(self._next_id)
+        future = self._waiting[request_id] = asyncio.get_running_loop().create_future()
+        await self._socket.send(json.dumps({**message, "type": "request", "id": request_id}))
+        try:
+            return await future
+        finally:
+            del self._waiting[request_id]
+
+    def finished(self):
+        self.expected -= 1
+        if self.expected <= 0 and self._socket is not None:
+            asyncio.create_task(self._socket.close())
+
+
+# =========================
+# Reporte
+# =========================
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1)
+
+
+def report(results: List[Dict[str, Any]], duration: float, skipped: int) -> Dict[str, Any]:
+    groups: Dict[Tuple[str, str], List[Dict[str, Any]]] = defaultdict(list)
+    for result in results:
+        groups[group_key(result["record"])].append(result)
+
+    rows = []
+    for (route, action), items in sorted(groups.items()):
+        latencies = [r["ms"] for r in items]
+        captured = [r["record"]["ms"] for r in items]
+        rows.append({
+            "route": route,
+            "action": action,
+            "requests": len(items),
+            "errors": sum(1 for r in items if is_error(r["status"])),
+            "captured_errors": sum(1 for r in items if is_error(r["record"]["status"])),
+            "p50_ms": percentile(latencies, 0.5),
+            "p90_ms": percentile(latencies, 0.9),
+            "p99_ms": percentile(latencies, 0.99),
+            "max_ms": round(max(latencies), 1),
+            "captured_p50_ms": percentile(captured, 0.5),
+            "captured_p99_ms": percentile(captured, 0.99),
+        })
+    statuses: Dict[str, int] = defaultdict(int)
+    for result in results:
+        statuses[str(result["status"])] += 1
+    all_latencies = [r["ms"] for r in results]
+    return {
+        "requests": len(results),
+        "skipped": skipped,
+        "duration_seconds": round(duration, 2),
+        "rate_per_second": round(len(results) / duration, 2) if duration else None,
+        "p50_ms": percentile(all_latencies, 0.5),
+        "p99_ms": percentile(all_latencies, 0.99),
+        "max_late_ms": round(max((r["late_ms"] for r in results), default=0.0), 1),
+        "statuses": dict(statuses),
+        "routes": rows,
+    }
+
+
+def print_report(summary: Dict[str, Any]):
+    def cell(value) -> str:
+        return "-" if value is None else f"{value:g}"
+
+    print(f"{'ruta':<28} {'acción':<10} {'n':>6} {'err':>5} {'p50':>8} {'p90':>8} {'p99':>8} {'máx':>8} | {'capt p50':>8} {'capt p99':>8}")
+    for row in summary["routes"]:
+        print(
+            f"{row['route']:<28} {row['action']:<10} {row['requests']:>6} {row['errors']:>5} "
+            f"{cell(row['p50_ms']):>8} {cell(row['p90_ms']):>8} {cell(row['p99_ms']):>8} {cell(row['max_ms']):>8} | "
+            f"{cell(row['captured_p50_ms']):>8} {cell(row['captured_p99_ms']):>8}"
+        )
+    print(
+        f"\n{summary['requests']} requests en {summary['duration_seconds']} s "
+        f"({summary['rate_per_second']}/s), p50 {cell(summary['p50_ms'])} ms, p99 {cell(summary['p99_ms'])} ms, "
+        f"atraso máximo del scheduler {summary['max_late_ms']} ms, omitidos {summary['skipped']}"
+    )
+    print("status:", ", ".join(f"{status}={count}" for status, count in sorted(summary["statuses"].items())))
+
+
+# =========================
+# Instancia local
+# =========================
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class LocalStack:
+    """Stand-ins de PostgREST y Gemini + uvicorn apuntando a ellos"""
+
+    def __init__(self, plan: ThrottlePlan):
+        self.plan = plan
+        self.port = _free_port()
+        self._postgrest: Optional[PostgrestStub] = None
+        self._gemini: Optional[GeminiStub] = None
+        self._server: Optional[subprocess.Popen] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self) -> "LocalStack":
+        self._postgrest = PostgrestStub().start()
+        self._gemini = GeminiStub(plan=self.plan).start()
+        env = {
+            **os.environ,
+            "SUPABASE_URL": self._postgrest.url,
+            "GEMINI_BASE_URL": self._gemini.url,
+            "CAPTURE_ENABLED": "false",
+        }
+        self._server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(self.port), "--log-level", "warning"],
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if self._server.poll() is not None:
+                raise RuntimeError("uvicorn terminó antes de quedar listo")
+            try:
+                if httpx.get(f"{self.url}/api/ai/actions", timeout=1.0).status_code == 200:
+                    return self
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        self.__exit__()
+        raise RuntimeError("uvicorn no quedó listo en 30 s")
+
+    def __exit__(self, *exc):
+        if self._server is not None:
+            self._server.terminate()
+            try:
+                self._server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self._server.kill()
+        for stub in (self._gemini, self._postgrest):
+            if stub is not None:
+                stub.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay de tráfico capturado con latencias por ruta y acción")
+    parser.add_argument("paths", nargs="+", help="Archivos de captura (los rotados también, en cualquier orden)")
+    parser.add_argument("--url", help="Instancia a usar (por defecto se levanta una local con stand-ins)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Factor de aceleración (2 = el doble de rápido)")
+    parser.add_argument("--limit", type=int, default=0, help="Reproducir solo los primeros N requests")
+    parser.add_argument("--routes", nargs="*", help="Prefijos de ruta a reproducir")
+    parser.add_argument("--max-inflight", type=int, default=256)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--gemini-latency", type=float, default=0.3)
+    parser.add_argument("--gemini-capacity", type=int, default=8)
+    parser.add_argument("--json", dest="json_path", help="Además, escribir el reporte en JSON")
+    args = parser.parse_args()
+
+    records = load(args.paths, args.routes)
+    runnable = [r for r in records if replayable(r)]
+    if args.limit:
+        runnable = runnable[:args.limit]
+    skipped = len(records) - len(runnable)
+    if not runnable:
+        print("No hay requests reproducibles en la captura")
+        return
+
+    def replay(url: str) -> Dict[str, Any]:
+        replayer = Replayer(url, runnable, args.speed, args.max_inflight, args.timeout)
+        duration = asyncio.run(replayer.run())
+        return report(replayer.results, duration, skipped)
+
+    if args.url:
+        summary = replay(args.url)
+    else:
+        with LocalStack(ThrottlePlan(capacity=args.gemini_capacity, latency=args.gemini_latency)) as stack:
+            summary = replay(stack.url)
+
+    print_report(summary)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
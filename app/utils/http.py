@@ -0,0 +1,18 @@
+"""
+Helpers HTTP compartidos por middlewares.
+"""
+from typing import Any, MutableMapping
+
+
+def route_template(scope: MutableMapping[str, Any]) -> str:
+    """
+    Devuelve la plantilla de la ruta resuelta (`/api/auth/waitlist/check-email/{email}`).
+    Se reconstruye desde el path y los path_params para incluir los prefijos de
+    `include_router`, que no siempre están en `route.path`.
+    """
+    if scope.get("route") is None:
+        return "unmatched"
+    path = scope["path"]
+    for name, value in scope.get("path_params", {}).items():
+        path = path.replace(f"/{value}", f"/{{{name}}}", 1)
+    return path
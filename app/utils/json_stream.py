@@ -0,0 +1,86 @@
+"""
+Parser incremental de un objeto JSON que llega por chunks.
+
+Emite cada clave de primer nivel en cuanto su valor se cierra, sin esperar
+al resto del documento:
+
+    parser = JsonSectionParser()
+    for chunk in chunks:
+        for key, value in parser.feed(chunk):
+            ...
+
+Un valor que no es JSON válido lanza AIUpstreamError (salida del modelo
+rota), igual que el resto de las fallas del stream.
+"""
+import json
+from typing import Any, List, Optional, Tuple
+
+from app.services.ai_resilience import AIUpstreamError
+
+
+def _loads(raw: str) -> Any:
+    try:
+        return json.loads(raw)
+    except ValueError:
+        raise AIUpstreamError("La respuesta del modelo no es JSON válido") from None
+
+
+class JsonSectionParser:
+    """Escanea el texto una sola vez; solo decodifica los valores completos"""
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._key: Optional[str] = None
+        self._value_start: Optional[int] = None
+        self.done = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Agrega texto y devuelve las secciones (clave, valor) que se completaron"""
+        self._buffer += chunk
+        sections = []
+        buffer = self._buffer
+        for i in range(self._pos, len(buffer)):
+            char = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._value_start is None:
+                        self._key = _loads(buffer[self._string_start:i + 1])
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = i
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._close_section(buffer, i, sections)
+                    self.done = True
+            elif char == ":" and self._depth == 1 and self._value_start is None:
+                self._value_start = i + 1
+            elif char == "," and self._depth == 1:
+                self._close_section(buffer, i, sections)
+        self._pos = len(buffer)
+        return sections
+
+    def _close_section(self, buffer: str, end: int, sections: List[Tuple[str, Any]]):
+        if self._key is not None and self._value_start is not None:
+            sections.append((self._key, _loads(buffer[self._value_start:end])))
+        self._key = None
+        self._value_start = None
+
+    @property
+    def text(self) -> str:
+        """Todo el texto recibido hasta ahora"""
+        return self._buffer
@@ -0,0 +1,147 @@
+"""
+Lectura acotada de bodies JSON, opcionalmente comprimidos.
+
+El body se consume en streaming: si `Content-Length` ya excede el límite se
+rechaza sin leer nada, y si no (chunked, o comprimido) se corta en cuanto los
+bytes leídos o descomprimidos pasan `max_bytes`. La descompresión también
+está acotada, así que un body chico que se expande mucho (zip bomb) no llega
+a materializarse en memoria: gzip/deflate se descomprimen por chunk y zstd
+(cuyo decompressobj no acota la salida) al final, con una lectura acotada
+sobre los bytes comprimidos ya recibidos.
+
+Content-Encoding soportados: identity, gzip, deflate y zstd (si `zstandard`
+está instalado).
+"""
+import io
+import json
+import zlib
+from typing import Any, Optional
+
+from fastapi import HTTPException
+from starlette.requests import Request
+
+# Intentar importar orjson, con fallback
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+# zstd es opcional: sin la librería se responde 415
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+
+def supported_encodings() -> list:
+    encodings = ["identity", "gzip", "deflate"]
+    if HAS_ZSTD:
+        encodings.append("zstd")
+    return encodings
+
+
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail={"success": False, "error": f"El body excede el máximo de {max_bytes} bytes", "error_type": "too_large"}
+    )
+
+
+def _invalid_body() -> HTTPException:
+    return HTTPException(
+        status_code=400,
+        detail={"success": False, "error": "Body JSON inválido", "error_type": "invalid_body"}
+    )
+
+
+class _Decoder:
+    """Descompresor incremental que nunca produce más de `limit` bytes"""
+
+    def __init__(self, encoding: str, limit: int):
+        self.limit = limit
+        self._compressed = bytearray()
+        if encoding == "gzip":
+            self._zlib = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == "deflate":
+            self._zlib = zlib.decompressobj()
+        else:
+            self._zlib = None
+
+    def decode(self, chunk: bytes) -> bytes:
+        if self._zlib is None:
+            self._compressed += chunk
+            return b""
+        # Un byte más que el límite alcanza para saber que se pasó
+        out = self._zlib.decompress(chunk, self.limit + 1)
+        if self._zlib.unconsumed_tail:
+            raise _too_large(self.limit)
+        return out
+
+    def finish(self) -> bytes:
+        if self._zlib is not None:
+            return self._zlib.flush()
+        try:
+            out = bytearray()
+            with zstandard.ZstdDecompressor().stream_reader(io.BytesIO(self._compressed)) as reader:
+                while len(out) <= self.limit:
+                    piece = reader.read(self.limit + 1 - len(out))
+                    if not piece:
+                        break
+                    out += piece
+        except zstandard.ZstdError:
+            raise _invalid_body()
+        if len(out) > self.limit:
+            raise _too_large(self.limit)
+        return bytes(out)
+
+
+async def read_json_body(request: Request, max_bytes: int) -> Any:
+    """
+    Lee y parsea el body JSON de `request` sin aceptar más de `max_bytes`
+    (después de descomprimir). 413 si se pasa, 415 con Content-Encoding
+    desconocido, 400 si el JSON es inválido.
+    """
+    encoding = (request.headers.get("content-encoding") or "identity").strip().lower()
+    if encoding not in supported_encodings():
+        raise HTTPException(
+            status_code=415,
+            detail={
+                "success": False,
+                "error": f"Content-Encoding no soportado: {encoding}",
+                "error_type": "unsupported_encoding",
+                "supported": supported_encodings()
+            }
+        )
+
+    # Rechazo temprano: el comprimido nunca debería superar al descomprimido
+    declared: Optional[str] = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_bytes:
+        raise _too_large(max_bytes)
+
+    decoder = _Decoder(encoding, max_bytes) if encoding != "identity" else None
+    received = 0
+    body = bytearray()
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > max_bytes:
+            raise _too_large(max_bytes)
+        try:
+            body += decoder.decode(chunk) if decoder else chunk
+        except zlib.error:
+            raise _invalid_body()
+        if len(body) > max_bytes:
+            raise _too_large(max_bytes)
+    if decoder:
+        try:
+            body += decoder.finish()
+        except zlib.error:
+            raise _invalid_body()
+        if len(body) > max_bytes:
+            raise _too_large(max_bytes)
+
+    try:
+        return orjson.loads(body) if HAS_ORJSON else json.loads(body)
+    except ValueError:
+        raise _invalid_body()
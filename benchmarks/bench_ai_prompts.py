@@ -0,0 +1,20 @@
+"""
+Benchmarks de construcción de prompts.
+`build_prompt` construye los cinco prompts en cada llamada, por eso se mide
+por acción.
+"""
+import pytest
+
+from app.services.ai_service import build_prompt
+
+
+@pytest.mark.parametrize("action,payload", [
+    ("summarize", None),
+    ("explain", None),
+    ("rewrite", "formal"),
+    ("translate", "en"),
+    ("xray", None),
+])
+def bench_build_prompt(benchmark, sample_text, action, payload):
+    prompt = benchmark(build_prompt, action, sample_text, payload)
+    assert sample_text in prompt
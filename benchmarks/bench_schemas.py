@@ -0,0 +1,28 @@
+"""
+Benchmarks de validación de esquemas de waitlist.
+"""
+import pytest
+
+from app.core.validation import validate_name
+from app.schemas.auth import WaitlistUserCreate
+
+NAMES = {
+    "short": "Ana",
+    "accented": "María José Núñez-O'Connor",
+}
+
+
+@pytest.mark.parametrize("name", list(NAMES.values()), ids=list(NAMES))
+def bench_validate_name(benchmark, name):
+    assert benchmark(validate_name, name) == name
+
+
+def bench_waitlist_user_create(benchmark):
+    data = {
+        "email": "juan.perez@empresa.com",
+        "name": "Juan Pérez",
+        "interest_reason": "business",
+        "preferred_languages": ["es", "en", "fr"],
+    }
+    user = benchmark(WaitlistUserCreate, **data)
+    assert user.preferred_languages == ["es", "en", "fr"]
@@ -0,0 +1,52 @@
+"""
+Benchmarks de SecurityService: sanitización, validación de email, idiomas y
+razón de interés, y JWT.
+"""
+import pytest
+from pydantic import EmailStr, TypeAdapter
+
+from app.core.security import security
+
+EMAILS = {
+    "simple": "ana@example.com",
+    "subdomain": "juan.perez+cliro@mail.empresa.com.mx",
+}
+
+email_adapter = TypeAdapter(EmailStr)
+
+
+def bench_sanitize_input(benchmark, dirty_text):
+    result = benchmark(security.sanitize_input, dirty_text)
+    assert result and "\x00" not in result
+
+
+@pytest.mark.parametrize("email", list(EMAILS.values()), ids=list(EMAILS))
+def bench_validate_email_security(benchmark, email):
+    assert benchmark(security.validate_email, email) is True
+
+
+@pytest.mark.parametrize("email", list(EMAILS.values()), ids=list(EMAILS))
+def bench_validate_email_pydantic(benchmark, email):
+    assert benchmark(email_adapter.validate_python, email) == email
+
+
+def bench_validate_languages(benchmark):
+    valid, languages = benchmark(security.validate_languages, ["ko", "pt", "xx", "en"])
+    assert valid and languages == ["ko", "pt"]
+
+
+def bench_validate_interest_reason(benchmark):
+    # La última de la lista: el peor caso de una búsqueda lineal
+    assert benchmark(security.validate_interest_reason, "other") is True
+
+
+def bench_create_access_token(benchmark):
+    data = {"sub": "123", "email": "ana@example.com"}
+    token = benchmark(security.create_access_token, data)
+    assert token.count(".") == 2
+
+
+def bench_verify_token(benchmark):
+    token = security.create_access_token({"sub": "123", "email": "ana@example.com"})
+    payload = benchmark(security.verify_token, token)
+    assert payload["sub"] == "123"
@@ -0,0 +1,79 @@
+"""
+Benchmarks de serialización y compresión de respuestas de IA.
+Comparan el camino por defecto de FastAPI (jsonable_encoder + json estándar)
+con FastJSONResponse, y registran los bytes en el cable en `extra_info`.
+"""
+import gzip
+
+import pytest
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+
+from app.core.responses import HAS_BROTLI, FastJSONResponse
+from conftest import make_text
+
+
+def _xray_payload() -> dict:
+    issue = {
+        "original": "los datos fueron analizado",
+        "correction": "los datos fueron analizados",
+        "explanation": "Concordancia de número entre sujeto y participio.",
+    }
+    analysis = {
+        "grammar_errors": [issue] * 25,
+        "style_errors": [issue] * 15,
+        "vocabulary_suggestions": [{"word": "hacer", "alternatives": ["realizar", "efectuar", "llevar a cabo"]}] * 20,
+        "overall_score": 7,
+        "improvement_suggestions": ["Evita oraciones de más de 40 palabras."] * 10,
+    }
+    return _wrap("xray", analysis)
+
+
+def _rewrite_payload() -> dict:
+    return _wrap("rewrite", make_text(5000))
+
+
+def _wrap(action: str, result) -> dict:
+    return {
+        "success": True,
+        "result": result,
+        "action": action,
+        "metadata": {"chars_processed": 5000, "action_type": action, "language": "auto"},
+    }
+
+
+PAYLOADS = {"xray": _xray_payload(), "rewrite_5000": _rewrite_payload()}
+
+
+@pytest.mark.parametrize("name", list(PAYLOADS))
+def bench_serialize_default(benchmark, name):
+    """Antes: jsonable_encoder + JSONResponse (json estándar)"""
+    content = PAYLOADS[name]
+    response = benchmark(lambda: JSONResponse(jsonable_encoder(content)))
+    benchmark.extra_info["bytes"] = len(response.body)
+
+
+@pytest.mark.parametrize("name", list(PAYLOADS))
+def bench_serialize_fast(benchmark, name):
+    """Después: FastJSONResponse directo desde el dict"""
+    content = PAYLOADS[name]
+    response = benchmark(lambda: FastJSONResponse(content))
+    benchmark.extra_info["bytes"] = len(response.body)
+
+
+@pytest.mark.parametrize("name", list(PAYLOADS))
+def bench_compress_gzip(benchmark, name):
+    body = FastJSONResponse(PAYLOADS[name]).body
+    compressed = benchmark(gzip.compress, body, 6)
+    benchmark.extra_info["bytes_identity"] = len(body)
+    benchmark.extra_info["bytes"] = len(compressed)
+
+
+@pytest.mark.skipif(not HAS_BROTLI, reason="brotli no instalado")
+@pytest.mark.parametrize("name", list(PAYLOADS))
+def bench_compress_brotli(benchmark, name):
+    import brotli
+    body = FastJSONResponse(PAYLOADS[name]).body
+    compressed = benchmark(brotli.compress, body, quality=4)
+    benchmark.extra_info["bytes_identity"] = len(body)
+    benchmark.extra_info["bytes"] = len(compressed)
@@ -0,0 +1,43 @@
+"""
+Fixtures compartidas para los microbenchmarks.
+Los textos son deterministas para que las comparaciones contra el baseline
+sean estables entre ejecuciones.
+"""
+import os
+import sys
+
+import pytest
+
+# Permite importar `app` al ejecutar desde la raíz o desde benchmarks/
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+_BASE_PARAGRAPH = (
+    "La inteligencia artificial está transformando la manera en que escribimos, "
+    "leemos y aprendemos. Las herramientas de productividad ahora pueden resumir "
+    "artículos largos, explicar conceptos complejos y sugerir mejoras de estilo. "
+    "Sin embargo, es importante revisar siempre el resultado con criterio propio. "
+)
+
+# Tamaños realistas: selección corta, párrafo, y página completa (límite de 5000)
+TEXT_SIZES = {
+    "selection_80": 80,
+    "paragraph_800": 800,
+    "page_5000": 5000,
+}
+
+
+def make_text(size: int) -> str:
+    """Genera un texto en español de exactamente `size` caracteres"""
+    repeated = _BASE_PARAGRAPH * (size // len(_BASE_PARAGRAPH) + 1)
+    return repeated[:size]
+
+
+@pytest.fixture(params=list(TEXT_SIZES), ids=list(TEXT_SIZES))
+def sample_text(request) -> str:
+    return make_text(TEXT_SIZES[request.param])
+
+
+@pytest.fixture
+def dirty_text(sample_text) -> str:
+    """Texto con espacios y caracteres de control como llega desde la extensión"""
+    return "  \x00" + sample_text.replace(". ", ".\x07 ") + "\x1f  "